@@ -0,0 +1,29 @@
+"""add per-user analytics state for incremental job runs"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080001"
+down_revision = "202402070002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "emotion_analytics_state",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("data_changed_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.Column("effects_estimated_at", sa.DateTime(), nullable=True),
+        sa.Column("paths_estimated_at", sa.DateTime(), nullable=True),
+    )
+    # Existing users start dirty so the first incremental run covers them.
+    op.execute(
+        "INSERT INTO emotion_analytics_state (user_id, data_changed_at) "
+        "SELECT DISTINCT user_id, CURRENT_TIMESTAMP FROM emotion_episode"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("emotion_analytics_state")
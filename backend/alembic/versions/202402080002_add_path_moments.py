@@ -0,0 +1,28 @@
+"""add per-user path model sufficient statistics"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080002"
+down_revision = "202402080001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Populated by the next `python -m cqox.jobs.estimate_paths --full` run.
+    op.create_table(
+        "emotion_path_moments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("partner_role", sa.String(length=32), nullable=False),
+        sa.Column("n_episodes", sa.Integer(), nullable=False),
+        sa.Column("moments", sa.Text(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.UniqueConstraint("user_id", "partner_role", name="uq_path_moments"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("emotion_path_moments")
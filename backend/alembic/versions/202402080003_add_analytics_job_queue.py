@@ -0,0 +1,33 @@
+"""add durable analytics job queue"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080003"
+down_revision = "202402080002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    job_status = sa.Enum("QUEUED", "RUNNING", "DONE", "FAILED", name="jobstatus")
+    op.create_table(
+        "emotion_analytics_job",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("status", job_status, nullable=False),
+        sa.Column("dedupe_key", sa.String(length=64), nullable=True, unique=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_emotion_analytics_job_status", "emotion_analytics_job", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_emotion_analytics_job_status", table_name="emotion_analytics_job")
+    op.drop_table("emotion_analytics_job")
+    sa.Enum(name="jobstatus").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,24 @@
+"""add cross-process analytics job lock"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080004"
+down_revision = "202402080003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "emotion_job_lock",
+        sa.Column("name", sa.String(length=64), primary_key=True),
+        sa.Column("owner", sa.String(length=128), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("rerun_requested", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("emotion_job_lock")
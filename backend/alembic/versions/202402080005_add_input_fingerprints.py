@@ -0,0 +1,20 @@
+"""add estimator input fingerprints to persisted results"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080005"
+down_revision = "202402080004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("emotion_treatment_effect", sa.Column("input_fingerprint", sa.String(length=64), nullable=True))
+    op.add_column("emotion_path_summary", sa.Column("input_fingerprint", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("emotion_path_summary", "input_fingerprint")
+    op.drop_column("emotion_treatment_effect", "input_fingerprint")
@@ -0,0 +1,47 @@
+"""add write-maintained per-user dashboard rollup
+
+Existing users get their row on their next write, or all at once with
+`python -m cqox.jobs.rollup`; until then the dashboard falls back to grouped
+queries over the source tables.
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080006"
+down_revision = "202402080005"
+branch_labels = None
+depends_on = None
+
+COUNTER_COLUMNS = [
+    "episodes_total",
+    "episodes_planned",
+    "episodes_completed",
+    "episodes_cancelled",
+    "prep_journaling_10m_count",
+    "prep_three_messages_count",
+    "prep_breathing_4_7_8_count",
+    "prep_roleplay_self_qa_count",
+    "prep_safe_word_plan_count",
+    "outcomes_count",
+    "sum_stress_during",
+    "sum_stress_after",
+    "sum_crying_level",
+    "sum_speech_block_level",
+    "sum_expression_score",
+    "sum_relationship_impact",
+]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "emotion_user_rollup",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        *[sa.Column(name, sa.Integer(), nullable=False, server_default="0") for name in COUNTER_COLUMNS],
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("emotion_user_rollup")
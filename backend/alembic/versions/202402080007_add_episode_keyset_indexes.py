@@ -0,0 +1,23 @@
+"""add composite indexes for keyset-paginated episode listing"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "202402080007"
+down_revision = "202402080006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_episode_user_scheduled", "emotion_episode", ["user_id", "scheduled_at", "id"])
+    op.create_index("ix_episode_user_status_scheduled", "emotion_episode", ["user_id", "status", "scheduled_at", "id"])
+    op.create_index(
+        "ix_episode_user_scenario_scheduled", "emotion_episode", ["user_id", "scenario_type", "scheduled_at", "id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_episode_user_scenario_scheduled", table_name="emotion_episode")
+    op.drop_index("ix_episode_user_status_scheduled", table_name="emotion_episode")
+    op.drop_index("ix_episode_user_scheduled", table_name="emotion_episode")
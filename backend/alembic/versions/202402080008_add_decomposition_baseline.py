@@ -0,0 +1,36 @@
+"""materialise episode decomposition inputs on emotion_path_summary
+
+Existing rows are filled by the next path job run; to backfill at once:
+
+    python -m cqox.jobs.estimate_paths --full
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080008"
+down_revision = "202402080007"
+branch_labels = None
+depends_on = None
+
+FLOAT_COLUMNS = [
+    "mean_eval_threat",
+    "mean_pre_anxiety",
+    "mean_suppress_intent",
+    "trait_crying_proneness",
+    "contrib_trait",
+    "baseline_crying",
+]
+
+
+def upgrade() -> None:
+    for name in FLOAT_COLUMNS:
+        op.add_column("emotion_path_summary", sa.Column(name, sa.Float(), nullable=True))
+    op.add_column("emotion_path_summary", sa.Column("crying_effects", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("emotion_path_summary", "crying_effects")
+    for name in reversed(FLOAT_COLUMNS):
+        op.drop_column("emotion_path_summary", name)
@@ -0,0 +1,31 @@
+"""add per-user bandit posterior
+
+Filled as outcomes are recorded; to seed it from existing episodes:
+
+    python -m cqox.jobs.bandit
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080009"
+down_revision = "202402080008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "emotion_bandit_posterior",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("model_version", sa.String(length=32), nullable=False),
+        sa.Column("n_updates", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("a_inv", sa.Text(), nullable=False),
+        sa.Column("b", sa.Text(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("emotion_bandit_posterior")
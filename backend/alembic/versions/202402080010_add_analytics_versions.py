@@ -0,0 +1,33 @@
+"""track analytics dirtiness with database-side data versions
+
+Users that were clean under the timestamp watermark start clean at
+version 0; everyone else stays dirty.
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080010"
+down_revision = "202402080009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "emotion_analytics_state", sa.Column("data_version", sa.Integer(), nullable=False, server_default="0")
+    )
+    op.add_column("emotion_analytics_state", sa.Column("effects_version", sa.Integer(), nullable=True))
+    op.add_column("emotion_analytics_state", sa.Column("paths_version", sa.Integer(), nullable=True))
+    for job in ("effects", "paths"):
+        op.execute(
+            f"UPDATE emotion_analytics_state SET {job}_version = 0 "
+            f"WHERE {job}_estimated_at IS NOT NULL AND {job}_estimated_at >= data_changed_at"
+        )
+
+
+def downgrade() -> None:
+    op.drop_column("emotion_analytics_state", "paths_version")
+    op.drop_column("emotion_analytics_state", "effects_version")
+    op.drop_column("emotion_analytics_state", "data_version")
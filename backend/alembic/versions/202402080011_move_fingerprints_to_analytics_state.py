@@ -0,0 +1,41 @@
+"""keep one input fingerprint per user and job on emotion_analytics_state
+
+The per-row `input_fingerprint` on the result tables is copied over where
+all of a user's rows agree, then dropped; other users refit once.
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "202402080011"
+down_revision = "202402080010"
+branch_labels = None
+depends_on = None
+
+_SOURCES = {"effects": "emotion_treatment_effect", "paths": "emotion_path_summary"}
+
+
+def upgrade() -> None:
+    op.add_column("emotion_analytics_state", sa.Column("effects_fingerprint", sa.String(length=64), nullable=True))
+    op.add_column("emotion_analytics_state", sa.Column("paths_fingerprint", sa.String(length=64), nullable=True))
+    for job, table in _SOURCES.items():
+        op.execute(
+            f"UPDATE emotion_analytics_state SET {job}_fingerprint = ("
+            f"SELECT MAX(r.input_fingerprint) FROM {table} r WHERE r.user_id = emotion_analytics_state.user_id "
+            "HAVING COUNT(*) = COUNT(r.input_fingerprint) AND MIN(r.input_fingerprint) = MAX(r.input_fingerprint))"
+        )
+    op.drop_column("emotion_path_summary", "input_fingerprint")
+    op.drop_column("emotion_treatment_effect", "input_fingerprint")
+
+
+def downgrade() -> None:
+    op.add_column("emotion_treatment_effect", sa.Column("input_fingerprint", sa.String(length=64), nullable=True))
+    op.add_column("emotion_path_summary", sa.Column("input_fingerprint", sa.String(length=64), nullable=True))
+    for job, table in _SOURCES.items():
+        op.execute(
+            f"UPDATE {table} SET input_fingerprint = ("
+            f"SELECT s.{job}_fingerprint FROM emotion_analytics_state s WHERE s.user_id = {table}.user_id)"
+        )
+    op.drop_column("emotion_analytics_state", "paths_fingerprint")
+    op.drop_column("emotion_analytics_state", "effects_fingerprint")
@@ -5,12 +5,15 @@ Routers are intentionally thin; business logic lives inside service.py.
 """
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from cqox.dependencies import get_current_user, get_db
 from cqox.emotion import service, schemas
-from cqox.emotion.analytics import AnalyticsEngine
+from cqox.emotion.analytics import PREPARATION_KEYS, AnalyticsEngine
+from cqox.emotion.recommend import recommend_bandit_plan, recommend_plans
 from cqox.emotion.safety import SafetyGuard
 
 router = APIRouter(prefix="/api/emotion", tags=["emotion"])
@@ -35,6 +38,34 @@ def list_my_episodes(
     return service.list_episodes(db, current_user["id"], status=status, limit=limit)
 
 
+@router.get("/episodes/page", response_model=schemas.EpisodePage)
+def list_my_episodes_page(
+    status: schemas.EpisodeStatus | None = None,
+    scenario_type: schemas.ScenarioType | None = None,
+    partner_role: str | None = None,
+    scheduled_from: datetime | None = None,
+    scheduled_to: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    try:
+        return service.list_episodes_page(
+            db,
+            current_user["id"],
+            status=status,
+            scenario_type=scenario_type,
+            partner_role=partner_role,
+            scheduled_from=scheduled_from,
+            scheduled_to=scheduled_to,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
 @router.get("/episodes/{episode_id}", response_model=schemas.EpisodeComplete)
 def get_episode(
     episode_id: int,
@@ -85,6 +116,25 @@ def dashboard_summary(
     return service.get_dashboard_summary(db, current_user["id"])
 
 
+@router.get("/dashboard/bundle", response_model=schemas.DashboardBundle)
+def dashboard_bundle(
+    sections: list[schemas.DashboardSection] | None = Query(None),
+    timeline_max_points: int | None = Query(None, ge=3, le=5000),
+    episode_status: schemas.EpisodeStatus | None = None,
+    episode_limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    return service.get_dashboard_bundle(
+        db,
+        current_user["id"],
+        sections=sections,
+        timeline_max_points=timeline_max_points,
+        episode_status=episode_status,
+        episode_limit=episode_limit,
+    )
+
+
 @router.get("/effects/me", response_model=schemas.TreatmentEffectList)
 def get_my_effects(
     db: Session = Depends(get_db),
@@ -113,6 +163,19 @@ def get_partner_paths(
     return service.get_partner_path_summaries(db, current_user["id"])
 
 
+@router.post("/episodes/decomposition/batch", response_model=schemas.EpisodeDecompositionBatch)
+def get_episode_decompositions(
+    payload: schemas.EpisodeDecompositionBatchRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    try:
+        items = service.decompose_episodes(db, current_user["id"], payload.episode_ids)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return schemas.EpisodeDecompositionBatch(items=items)
+
+
 @router.get("/episodes/{episode_id}/decomposition", response_model=schemas.EpisodeDecompositionRead)
 def get_episode_decomposition(
     episode_id: int,
@@ -127,10 +190,19 @@ def get_episode_decomposition(
 
 @router.get("/episodes/timeline/me", response_model=schemas.TimelineResponse)
 def get_my_timeline(
+    scheduled_from: datetime | None = None,
+    scheduled_to: datetime | None = None,
+    max_points: int | None = Query(None, ge=3, le=5000),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    return service.get_timeline_points(db, current_user["id"])
+    return service.get_timeline_points(
+        db,
+        current_user["id"],
+        scheduled_from=scheduled_from,
+        scheduled_to=scheduled_to,
+        max_points=max_points,
+    )
 
 
 @router.get("/preferences/me", response_model=schemas.PreferenceProfileRead)
@@ -185,6 +257,7 @@ def simulate(
     current_user=Depends(get_current_user),
 ):
     engine = AnalyticsEngine()
+    effects = service.get_personal_effects(db, current_user["id"])
     preparations = {
         "journaling_10m": payload.prep_journaling_10m,
         "three_messages": payload.prep_three_messages,
@@ -197,6 +270,9 @@ def simulate(
         pre_crying_risk=payload.pre_crying_risk,
         pre_speech_block_risk=payload.pre_speech_block_risk,
         preparations=preparations,
+        effects=effects,
+        n_samples=payload.n_samples,
+        seed=payload.seed,
     )
 
     prefs = service.get_preference_profile(db, current_user["id"])
@@ -216,6 +292,126 @@ def simulate(
         predicted_expression_score=schemas.DeltaMetric(**prediction["expression_score"]),
         predicted_relationship_impact=schemas.DeltaMetric(**prediction["relationship_impact"]),
         total_reward=total_reward,
+        personalized=bool(effects),
+        disclaimer="これは予測であり、保証ではありません。実際の結果は異なる場合があります。",
+    )
+
+
+@router.post("/simulate/batch", response_model=schemas.SimulationBatchResponse)
+def simulate_batch(
+    payload: schemas.SimulationBatchRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    engine = AnalyticsEngine()
+    if payload.grid is not None:
+        plans = engine.plan_grid(payload.grid.model_dump())
+    else:
+        plans = engine.plan_matrix([plan.model_dump() for plan in payload.plans])
+    effects = service.get_personal_effects(db, current_user["id"])
+    if payload.n_samples:
+        prediction = engine.simulate_outcomes_batch(
+            pre_anxiety=payload.pre_anxiety,
+            pre_crying_risk=payload.pre_crying_risk,
+            pre_speech_block_risk=payload.pre_speech_block_risk,
+            plans=plans,
+            n_samples=payload.n_samples,
+            seed=payload.seed,
+            effects=effects,
+        )
+    else:
+        prediction = engine.predict_outcomes_batch(
+            pre_anxiety=payload.pre_anxiety,
+            pre_crying_risk=payload.pre_crying_risk,
+            pre_speech_block_risk=payload.pre_speech_block_risk,
+            plans=plans,
+            effects=effects,
+        )
+
+    prefs = service.get_preference_profile(db, current_user["id"])
+    total_reward = engine.calculate_total_reward(
+        predicted_stress_after=prediction["stress_after"]["mean"],
+        predicted_expression=prediction["expression_score"]["mean"],
+        predicted_relationship=prediction["relationship_impact"]["mean"],
+        pre_anxiety=float(payload.pre_anxiety),
+        weight_relief=prefs.weight_relief,
+        weight_expression=prefs.weight_expression,
+        weight_relationship=prefs.weight_relationship,
+    )
+
+    def metric(name: str) -> schemas.BatchMetric:
+        values = prediction[name]
+        quantiles = values.get("quantiles")
+        return schemas.BatchMetric(
+            mean=values["mean"].tolist(),
+            ci95_low=values["ci95_low"].tolist(),
+            ci95_high=values["ci95_high"].tolist(),
+            quantiles={level: q.tolist() for level, q in quantiles.items()} if quantiles else None,
+        )
+
+    return schemas.SimulationBatchResponse(
+        prep_keys=PREPARATION_KEYS,
+        plans=plans.astype(int).tolist(),
+        predicted_stress_after=metric("stress_after"),
+        predicted_crying_level=metric("crying_level"),
+        predicted_expression_score=metric("expression_score"),
+        predicted_relationship_impact=metric("relationship_impact"),
+        total_reward=total_reward.tolist(),
+        personalized=bool(effects),
+        disclaimer="これは予測であり、保証ではありません。実際の結果は異なる場合があります。",
+    )
+
+
+@router.post("/recommend/plan", response_model=schemas.PlanRecommendationResponse)
+def recommend_plan(
+    payload: schemas.PlanRecommendationRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    prefs = service.get_preference_profile(db, current_user["id"])
+    effects = service.get_personal_effects(db, current_user["id"])
+    result = recommend_plans(
+        AnalyticsEngine(),
+        pre_anxiety=payload.pre_anxiety,
+        pre_crying_risk=payload.pre_crying_risk,
+        pre_speech_block_risk=payload.pre_speech_block_risk,
+        weights={
+            "relief": prefs.weight_relief,
+            "expression": prefs.weight_expression,
+            "relationship": prefs.weight_relationship,
+        },
+        effort_budget=payload.effort_budget,
+        top_k=payload.top_k,
+        effects=effects,
+    )
+    return schemas.PlanRecommendationResponse(
+        top_plans=result["top"],
+        pareto_front=result["pareto"],
+        n_evaluated=result["n_evaluated"],
+        personalized=bool(effects),
+        disclaimer="これは予測であり、保証ではありません。実際の結果は異なる場合があります。",
+    )
+
+
+@router.post("/recommend/bandit", response_model=schemas.BanditRecommendationResponse)
+def recommend_bandit(
+    payload: schemas.BanditRecommendationRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    result = recommend_bandit_plan(
+        service.get_bandit_posterior(db, current_user["id"]),
+        scenario_type=payload.scenario_type,
+        pre_anxiety=payload.pre_anxiety,
+        pre_crying_risk=payload.pre_crying_risk,
+        pre_speech_block_risk=payload.pre_speech_block_risk,
+        eval_threat_level=payload.eval_threat_level,
+        suppress_intent_level=payload.suppress_intent_level,
+        effort_budget=payload.effort_budget,
+        seed=payload.seed,
+    )
+    return schemas.BanditRecommendationResponse(
+        **result,
         disclaimer="これは予測であり、保証ではありません。実際の結果は異なる場合があります。",
     )
 
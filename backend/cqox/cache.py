@@ -0,0 +1,268 @@
+"""
+Read-through cache for per-user analytics reads.
+
+Backends (settings.cache_backend / CACHE_BACKEND):
+- "redis" (default when REDIS_URL is set): shared by every API process and
+  the job worker (REDIS_URL)
+- "none" (default otherwise): caching disabled
+- "memory": per-process LRU with a TTL, opt-in. Only correct when every
+  write, including job runs, happens in the one serving process (tests,
+  single-process development): invalidations committed by the worker or
+  another API process never reach it.
+
+Values are stored as JSON under `emotion:<namespace>:<user_id>`. Writers
+call `invalidate_on_commit(session, namespace, user_ids)`; the keys are
+dropped right after that session commits and forgotten if it rolls back.
+A miss reserves the key before loading and only stores the loaded value if
+no invalidation removed the reservation meanwhile, so a loader that read
+the row before a commit cannot write the stale value back afterwards.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import lru_cache
+import logging
+import threading
+import time
+from typing import Callable, Iterable, Optional, Set, Tuple, TypeVar
+import uuid
+
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cqox.config import get_settings
+from cqox.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+KEY_PREFIX = "emotion:"
+
+EFFECTS = "effects"
+PATH_SUMMARY = "path_summary"
+PARTNER_PATHS = "partner_paths"
+PREFERENCES = "preferences"
+TRAITS = "traits"
+PREDICTOR = "predictor"
+BANDIT = "bandit"
+DECOMPOSITION = "decomposition"
+
+_PENDING_KEY = "cache_invalidations"
+
+
+def cache_key(namespace: str, user_id: int) -> str:
+    return f"{KEY_PREFIX}{namespace}:{user_id}"
+
+
+def _reservation_key(key: str) -> str:
+    # Shares the entry's prefix, so prefix invalidation drops it as well.
+    return f"{key}:loading"
+
+
+class MemoryCache:
+    """Thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, ttl: float, max_entries: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._reservations: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def reserve(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._reservations[key] = token
+            self._reservations.move_to_end(key)
+            # Loaders that raised never come back for theirs.
+            while len(self._reservations) > self.max_entries:
+                self._reservations.popitem(last=False)
+        return token
+
+    def set_if_reserved(self, key: str, value: str, token: Optional[str]) -> None:
+        with self._lock:
+            if token is None or self._reservations.get(key) != token:
+                return
+            del self._reservations[key]
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._reservations.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+            for key in [key for key in self._reservations if key.startswith(prefix)]:
+                del self._reservations[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._reservations.clear()
+
+
+class RedisCache:
+    """Shared backend. Redis errors degrade to cache misses instead of failing reads."""
+
+    # Store KEYS[1] only while the reservation KEYS[2] still holds our token.
+    _SET_IF_RESERVED = """
+    if redis.call('GET', KEYS[2]) == ARGV[1] then
+        redis.call('DEL', KEYS[2])
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self, url: str, ttl: float) -> None:
+        import redis  # optional: only needed when CACHE_BACKEND=redis
+
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+        self._errors = redis.RedisError
+        self._set_if_reserved = self._client.register_script(self._SET_IF_RESERVED)
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self._client.get(key)
+        except self._errors:
+            logger.warning("Cache read failed for %s", key, exc_info=True)
+            return None
+        return value.decode() if value is not None else None
+
+    def reserve(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            self._client.set(_reservation_key(key), token, ex=max(1, int(self.ttl)))
+        except self._errors:
+            logger.warning("Cache reservation failed for %s", key, exc_info=True)
+            return None
+        return token
+
+    def set_if_reserved(self, key: str, value: str, token: Optional[str]) -> None:
+        if token is None:
+            return
+        try:
+            self._set_if_reserved(keys=[key, _reservation_key(key)], args=[token, value, max(1, int(self.ttl))])
+        except self._errors:
+            logger.warning("Cache write failed for %s", key, exc_info=True)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        try:
+            self._client.delete(*keys, *map(_reservation_key, keys))
+        except self._errors:
+            logger.error("Cache invalidation failed; entries expire after %ss", self.ttl, exc_info=True)
+
+    def delete_prefix(self, prefix: str) -> None:
+        try:
+            self.delete(list(self._client.scan_iter(match=f"{prefix}*", count=1000)))
+        except self._errors:
+            logger.error("Cache invalidation failed; entries expire after %ss", self.ttl, exc_info=True)
+
+    def clear(self) -> None:
+        self.delete_prefix(KEY_PREFIX)
+
+
+class NullCache:
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def reserve(self, key: str) -> Optional[str]:
+        return None
+
+    def set_if_reserved(self, key: str, value: str, token: Optional[str]) -> None:
+        pass
+
+    def delete(self, keys: Iterable[str]) -> None:
+        pass
+
+    def delete_prefix(self, prefix: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+@lru_cache
+def get_cache():
+    settings = get_settings()
+    if settings.cache_backend == "redis":
+        if not settings.redis_url:
+            raise ValueError("CACHE_BACKEND=redis requires REDIS_URL")
+        return RedisCache(settings.redis_url, settings.cache_ttl_seconds)
+    if settings.cache_backend == "memory":
+        logger.warning("CACHE_BACKEND=memory: out-of-process writes (job worker, other API workers) are not invalidated")
+        return MemoryCache(settings.cache_ttl_seconds)
+    if settings.cache_backend != "none":
+        raise ValueError(f"Unknown CACHE_BACKEND {settings.cache_backend!r}")
+    return NullCache()
+
+
+def read_through(namespace: str, user_id: int, adapter: TypeAdapter, loader: Callable[[], T]) -> T:
+    """Return the cached value for (namespace, user_id), or load, cache and return it."""
+    cache = get_cache()
+    key = cache_key(namespace, user_id)
+    raw = cache.get(key)
+    if raw is not None:
+        CACHE_REQUESTS.labels(namespace, "hit").inc()
+        return adapter.validate_json(raw)
+    CACHE_REQUESTS.labels(namespace, "miss").inc()
+    token = cache.reserve(key)
+    value = loader()
+    cache.set_if_reserved(key, adapter.dump_json(value).decode(), token)
+    return value
+
+
+def invalidate_on_commit(session: Session, namespace: str, user_ids: Optional[Iterable[int]]) -> None:
+    """Drop the namespace's entries for `user_ids` (None: all users) once `session` commits."""
+    pending: Set[Tuple[str, Optional[int]]] = session.info.setdefault(_PENDING_KEY, set())
+    if user_ids is None:
+        pending.add((namespace, None))
+    else:
+        pending.update((namespace, int(user_id)) for user_id in user_ids)
+
+
+def invalidate(entries: Iterable[Tuple[str, Optional[int]]]) -> None:
+    cache = get_cache()
+    keys = []
+    for namespace, user_id in entries:
+        if user_id is None:
+            cache.delete_prefix(f"{KEY_PREFIX}{namespace}:")
+        else:
+            keys.append(cache_key(namespace, user_id))
+    cache.delete(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        invalidate(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
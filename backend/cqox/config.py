@@ -14,6 +14,14 @@ from functools import lru_cache
 class Settings:
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./emotion.db")
     redis_url: str | None = os.getenv("REDIS_URL")
+    # Process pool size for the per-user DML estimation (1 = run inline).
+    analytics_workers: int = int(os.getenv("ANALYTICS_WORKERS", "1"))
+    # Stream job inputs one user at a time (bounded memory) instead of one big DataFrame.
+    analytics_streaming: bool = os.getenv("ANALYTICS_STREAMING", "0") == "1"
+    # Read-through cache for per-user analytics reads: redis | memory | none (see cqox.cache).
+    # Defaults to redis when REDIS_URL is set and to no caching otherwise.
+    cache_backend: str = os.getenv("CACHE_BACKEND", "redis" if os.getenv("REDIS_URL") else "none")
+    cache_ttl_seconds: float = float(os.getenv("CACHE_TTL_SECONDS", "60"))
 
 
 @lru_cache
@@ -5,9 +5,10 @@ FastAPI dependencies as well as the analytics/batch jobs import from here,
 so keeping it in a single file avoids circular imports.
 """
 from contextlib import contextmanager
-from typing import Iterator
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
-from sqlalchemy import create_engine
+from sqlalchemy import and_, create_engine, or_, select
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 
 from .config import get_settings
@@ -53,3 +54,71 @@ def session_scope() -> Iterator[Session]:
     finally:
         session.close()
 
+
+
+# Bound-parameter budget per statement (SQLite builds before 3.32 cap at 999).
+_MAX_PARAMS = {"sqlite": 900, "postgresql": 30000}
+
+
+def bulk_upsert(
+    session: Session,
+    model: type[Base],
+    rows: List[Dict[str, Any]],
+    conflict_cols: Sequence[str],
+    update_cols: Optional[Sequence[str]] = None,
+) -> None:
+    """
+    Insert-or-update `rows` keyed on the unique `conflict_cols`.
+
+    SQLite/Postgres get chunked `INSERT ... ON CONFLICT DO UPDATE` statements
+    whose WHERE clause skips rows whose values did not change (so
+    `updated_at` only moves for real updates); an empty `update_cols` means
+    `ON CONFLICT DO NOTHING`. Other dialects fall back to a per-row
+    SELECT + update.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    if update_cols is None:
+        update_cols = [c for c in rows[0] if c not in conflict_cols]
+    has_updated_at = bool(update_cols) and "updated_at" in table.c and "updated_at" not in update_cols
+    now = datetime.utcnow()
+    if has_updated_at:
+        rows = [{**row, "updated_at": now} for row in rows]
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        _upsert_per_row(session, table, rows, conflict_cols, update=bool(update_cols))
+        return
+
+    chunk_size = max(1, _MAX_PARAMS[dialect] // len(rows[0]))
+    for start in range(0, len(rows), chunk_size):
+        stmt = insert(table).values(rows[start : start + chunk_size])
+        if not update_cols:
+            session.execute(stmt.on_conflict_do_nothing(index_elements=[table.c[c] for c in conflict_cols]))
+            continue
+        excluded = stmt.excluded
+        set_ = {c: excluded[c] for c in update_cols}
+        if has_updated_at:
+            set_["updated_at"] = excluded["updated_at"]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[c] for c in conflict_cols],
+            set_=set_,
+            where=or_(*[table.c[c].is_distinct_from(excluded[c]) for c in update_cols]),
+        )
+        session.execute(stmt)
+
+
+def _upsert_per_row(
+    session: Session, table, rows: List[Dict[str, Any]], conflict_cols: Sequence[str], update: bool = True
+) -> None:
+    for row in rows:
+        key = and_(*[table.c[c] == row[c] for c in conflict_cols])
+        if session.execute(select(table.c[conflict_cols[0]]).where(key)).first() is None:
+            session.execute(table.insert().values(**row))
+        elif update:
+            session.execute(table.update().where(key).values(**row))
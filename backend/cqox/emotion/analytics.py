@@ -2,13 +2,43 @@
 Analytics Engine for Emotion CQOx
 Implements Δ Stress, Δ Expression calculations with confidence intervals
 """
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple, Optional
 import math
 from dataclasses import dataclass
 from enum import Enum
 
+import numpy as np
+
 from .schemas import ScenarioType
 
+# Column order of plan matrices passed to the batch methods.
+PREPARATION_KEYS = ["journaling_10m", "three_messages", "breathing_4_7_8", "roleplay_self_qa", "safe_word_plan"]
+
+# Predicted outcomes: (lower, upper) bound of the scale and the predictive std.
+OUTCOME_RANGES = {
+    "stress_after": (0, 10),
+    "crying_level": (0, 10),
+    "expression_score": (0, 10),
+    "relationship_impact": (-5, 5),
+}
+OUTCOME_STDS = {
+    "stress_after": 2.0,
+    "crying_level": 2.0,
+    "expression_score": 2.5,
+    "relationship_impact": 1.8,
+}
+
+# Noise of every stage of the generator's outcome chain (see simulate_outcomes_batch).
+CHAIN_RANGES = {**OUTCOME_RANGES, "stress_during": (0, 10), "speech_block_level": (0, 10)}
+CHAIN_STDS = {**OUTCOME_STDS, "stress_during": 1.8, "speech_block_level": 2.0}
+MONTE_CARLO_QUANTILES = (0.025, 0.05, 0.25, 0.5, 0.75, 0.95, 0.975)
+# Plans are sampled in chunks of about this many draws to bound memory.
+MONTE_CARLO_CHUNK_DRAWS = 250_000
+
+# Per-user effects compiled for the predictor: outcome -> one ATE per
+# PREPARATION_KEYS entry (None where the user has no estimate).
+CompiledEffects = Dict[str, List[Optional[float]]]
+
 
 @dataclass
 class DeltaMetric:
@@ -185,89 +215,304 @@ class AnalyticsEngine:
         pre_anxiety: int,
         pre_crying_risk: int,
         pre_speech_block_risk: int,
-        preparations: dict[str, int]
+        preparations: dict[str, int],
+        effects: Optional[CompiledEffects] = None,
+        n_samples: Optional[int] = None,
+        seed: Optional[int] = None,
     ) -> dict:
         """
         Predict outcomes based on preparation plan
 
         Uses the same generative model as the CSV generator
-        for consistency
+        for consistency, personalised by `effects` when given.
+        With `n_samples`, the intervals are empirical quantiles of a
+        Monte Carlo run (see simulate_outcomes_batch) instead of mean ± 1.96·std.
+        """
+        plan = np.array([[preparations.get(key, 0) for key in PREPARATION_KEYS]], dtype=float)
+        if n_samples:
+            batch = self.simulate_outcomes_batch(
+                pre_anxiety, pre_crying_risk, pre_speech_block_risk, plan, n_samples, seed, effects
+            )
+        else:
+            batch = self.predict_outcomes_batch(pre_anxiety, pre_crying_risk, pre_speech_block_risk, plan, effects)
+        result = {}
+        for name, metric in batch.items():
+            result[name] = {"mean": float(metric["mean"][0]), "ci95": [float(metric["ci95_low"][0]), float(metric["ci95_high"][0])]}
+            if "quantiles" in metric:
+                result[name]["quantiles"] = {label: float(values[0]) for label, values in metric["quantiles"].items()}
+        return result
+
+    def predict_outcomes_batch(
+        self,
+        pre_anxiety: float,
+        pre_crying_risk: float,
+        pre_speech_block_risk: float,
+        plans: np.ndarray,
+        effects: Optional[CompiledEffects] = None,
+    ) -> Dict[str, Dict[str, np.ndarray]]:
         """
+        `predict_outcome` for many plans at once.
+
+        `plans` is an (n, 5) intensity matrix in PREPARATION_KEYS order.
+        Returns {outcome: {"mean", "ci95_low", "ci95_high"}} with (n,) arrays.
+        """
+        plans = np.asarray(plans, dtype=float).reshape(-1, len(PREPARATION_KEYS))
+        means = self._population_means(pre_anxiety, pre_crying_risk, pre_speech_block_risk, plans)
+        if effects:
+            means.update(self._personal_means(pre_anxiety, pre_crying_risk, pre_speech_block_risk, plans, effects))
+
+        result = {}
+        for name, mean in means.items():
+            low, high = OUTCOME_RANGES[name]
+            std = OUTCOME_STDS[name]
+            result[name] = {
+                "mean": mean,
+                "ci95_low": np.maximum(mean - 1.96 * std, low),
+                "ci95_high": np.minimum(mean + 1.96 * std, high),
+            }
+        return result
+
+    def simulate_outcomes_batch(
+        self,
+        pre_anxiety: float,
+        pre_crying_risk: float,
+        pre_speech_block_risk: float,
+        plans: np.ndarray,
+        n_samples: int,
+        seed: Optional[int] = None,
+        effects: Optional[CompiledEffects] = None,
+    ) -> Dict[str, Dict]:
+        """
+        Monte Carlo counterpart of `predict_outcomes_batch`.
+
+        Pushes `n_samples` draws per plan through the generator's noisy chain
+        (stress_during -> crying / speech block -> expression -> relationship,
+        each clipped and rounded like a recorded outcome), so the intervals
+        reflect the clipping and the propagated noise. All plans share the
+        same draws, which keeps comparisons between plans free of sampling
+        noise. With `effects`, each personalised outcome's location is moved
+        by the personal minus the population mean of `predict_outcomes_batch`.
+
+        Returns {outcome: {"mean", "ci95_low", "ci95_high", "quantiles"}};
+        "quantiles" maps each MONTE_CARLO_QUANTILES level (as a string) to
+        an (n,) array of the smallest value whose empirical CDF reaches it.
+        """
+        plans = np.asarray(plans, dtype=float).reshape(-1, len(PREPARATION_KEYS))
+        shifts: Dict[str, np.ndarray] = {}
+        if effects:
+            population = self._population_means(pre_anxiety, pre_crying_risk, pre_speech_block_risk, plans)
+            personal = self._personal_means(pre_anxiety, pre_crying_risk, pre_speech_block_risk, plans, effects)
+            shifts = {name: mean - population[name] for name, mean in personal.items()}
+
+        rng = np.random.default_rng(seed)
+        noise = dict(zip(CHAIN_STDS, rng.standard_normal((len(CHAIN_STDS), n_samples))))
+        labels = [f"{q:g}" for q in MONTE_CARLO_QUANTILES]
+        chunk = max(1, MONTE_CARLO_CHUNK_DRAWS // n_samples)
+        parts: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {name: [] for name in OUTCOME_RANGES}
+        for start in range(0, len(plans), chunk):
+            window = slice(start, start + chunk)
+            samples = self._sample_chain(
+                pre_anxiety,
+                pre_crying_risk,
+                pre_speech_block_risk,
+                plans[window],
+                noise,
+                {name: shift[window, None] for name, shift in shifts.items()},
+            )
+            for name, (low, high) in OUTCOME_RANGES.items():
+                # Draws are integers on a short scale: one bincount gives every
+                # plan's histogram, and mean / quantiles follow from it.
+                levels = np.arange(low, high + 1)
+                rows = np.arange(len(samples[name]))[:, None] * len(levels)
+                counts = np.bincount(
+                    (rows + samples[name].astype(np.int64) - low).ravel(), minlength=len(rows) * len(levels)
+                ).reshape(len(rows), len(levels))
+                cdf = np.cumsum(counts, axis=1) / n_samples
+                quantiles = levels[np.argmax(cdf[None, :, :] >= np.array(MONTE_CARLO_QUANTILES)[:, None, None], axis=2)]
+                parts[name].append((counts @ levels / n_samples, quantiles))
+
+        result = {}
+        for name, chunks in parts.items():
+            quantiles = np.concatenate([q for _, q in chunks], axis=1)
+            by_level = dict(zip(labels, quantiles))
+            result[name] = {
+                "mean": np.concatenate([mean for mean, _ in chunks]),
+                "ci95_low": by_level["0.025"],
+                "ci95_high": by_level["0.975"],
+                "quantiles": by_level,
+            }
+        return result
+
+    def _population_means(
+        self,
+        pre_anxiety: float,
+        pre_crying_risk: float,
+        pre_speech_block_risk: float,
+        plans: np.ndarray,
+    ) -> Dict[str, np.ndarray]:
+        """The generator's model: same coefficients for every user."""
+        journaling, three_messages, breathing, roleplay, _safe_word = plans.T
+
         # Calculate total prep effect
         total_prep_effect = (
-            0.25 * preparations.get("journaling_10m", 0)
-            + 0.35 * preparations.get("three_messages", 0)
-            + 0.20 * preparations.get("breathing_4_7_8", 0)
-            + 0.25 * preparations.get("roleplay_self_qa", 0)
+            0.25 * journaling
+            + 0.35 * three_messages
+            + 0.20 * breathing
+            + 0.25 * roleplay
         ) / 10.0
 
         # Predict stress_after
-        stress_after_mean = max(pre_anxiety - 1.0 - 1.5 * total_prep_effect, 0)
-        stress_after_std = 2.0
+        stress_after_mean = np.maximum(pre_anxiety - 1.0 - 1.5 * total_prep_effect, 0)
 
         # Predict crying_level
         crying_base = (
             pre_crying_risk
-            - 0.3 * preparations.get("journaling_10m", 0) / 2
-            - 0.2 * preparations.get("breathing_4_7_8", 0) / 2
+            - 0.3 * journaling / 2
+            - 0.2 * breathing / 2
         )
-        crying_mean = max(min(crying_base, 10), 0)
-        crying_std = 2.0
+        crying_mean = np.clip(crying_base, 0, 10)
 
         # Predict expression_score
         # Assume speech_block and stress_during for calculation
-        speech_block_est = pre_speech_block_risk - 0.3 * preparations.get("three_messages", 0) / 2
-        speech_block_est = max(min(speech_block_est, 10), 0)
+        speech_block_est = np.clip(pre_speech_block_risk - 0.3 * three_messages / 2, 0, 10)
 
         expr_base = (
             5.0
-            + 0.4 * preparations.get("three_messages", 0) / 2
-            + 0.3 * preparations.get("roleplay_self_qa", 0) / 2
+            + 0.4 * three_messages / 2
+            + 0.3 * roleplay / 2
             - 0.25 * speech_block_est
             - 0.15 * crying_mean
         )
-        expr_mean = max(min(expr_base, 10), 0)
-        expr_std = 2.5
+        expr_mean = np.clip(expr_base, 0, 10)
 
         # Predict relationship_impact
         rel_base = (
             -1
             + 0.4 * (expr_mean - 5) / 2
         )
-        rel_mean = max(min(rel_base, 5), -5)
-        rel_std = 1.8
+        rel_mean = np.clip(rel_base, -5, 5)
 
         return {
-            "stress_after": {
-                "mean": stress_after_mean,
-                "ci95": [
-                    max(stress_after_mean - 1.96 * stress_after_std, 0),
-                    min(stress_after_mean + 1.96 * stress_after_std, 10)
-                ]
-            },
-            "crying_level": {
-                "mean": crying_mean,
-                "ci95": [
-                    max(crying_mean - 1.96 * crying_std, 0),
-                    min(crying_mean + 1.96 * crying_std, 10)
-                ]
-            },
-            "expression_score": {
-                "mean": expr_mean,
-                "ci95": [
-                    max(expr_mean - 1.96 * expr_std, 0),
-                    min(expr_mean + 1.96 * expr_std, 10)
-                ]
-            },
-            "relationship_impact": {
-                "mean": rel_mean,
-                "ci95": [
-                    max(rel_mean - 1.96 * rel_std, -5),
-                    min(rel_mean + 1.96 * rel_std, 5)
-                ]
-            }
+            "stress_after": stress_after_mean,
+            "crying_level": crying_mean,
+            "expression_score": expr_mean,
+            "relationship_impact": rel_mean,
+        }
+
+    def _personal_means(
+        self,
+        pre_anxiety: float,
+        pre_crying_risk: float,
+        pre_speech_block_risk: float,
+        plans: np.ndarray,
+        effects: CompiledEffects,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Outcomes the user has effect estimates for, as the population
+        prediction for an empty plan plus a dot product of intensity / 10
+        with the user's ATEs (the same scaling as the episode
+        decomposition). Preparations without an estimate use the population
+        model's full-intensity effect for this pre-state instead.
+        """
+        probes = np.vstack([np.zeros(len(PREPARATION_KEYS)), 10.0 * np.eye(len(PREPARATION_KEYS))])
+        population = self._population_means(pre_anxiety, pre_crying_risk, pre_speech_block_risk, probes)
+        means = {}
+        for name, ates in effects.items():
+            if name not in OUTCOME_RANGES or all(ate is None for ate in ates):
+                continue
+            base = population[name][0]
+            slopes = np.array(
+                [population[name][i + 1] - base if ate is None else ate for i, ate in enumerate(ates)]
+            )
+            low, high = OUTCOME_RANGES[name]
+            means[name] = np.clip(base + plans @ slopes / 10.0, low, high)
+        return means
+
+    @staticmethod
+    def _sample_chain(
+        pre_anxiety: float,
+        pre_crying_risk: float,
+        pre_speech_block_risk: float,
+        plans: np.ndarray,
+        noise: Dict[str, np.ndarray],
+        shifts: Mapping[str, np.ndarray],
+    ) -> Dict[str, np.ndarray]:
+        """(m, n_samples) draws of every outcome; same formulas as the CSV generator."""
+        journaling, three_messages, breathing, roleplay, _safe_word = plans.T[:, :, None]
+
+        def draw(name: str, base) -> np.ndarray:
+            low, high = CHAIN_RANGES[name]
+            location = base + shifts.get(name, 0.0)
+            return np.rint(np.clip(location + CHAIN_STDS[name] * noise[name], low, high))
+
+        total_prep_effect = (
+            0.25 * journaling
+            + 0.35 * three_messages
+            + 0.20 * breathing
+            + 0.25 * roleplay
+        ) / 10.0
+        stress_during = draw("stress_during", pre_anxiety + 0.5 - 0.3 * total_prep_effect)
+        stress_after = draw("stress_after", np.maximum(pre_anxiety - 1.0 - 1.5 * total_prep_effect, 0))
+        crying = draw(
+            "crying_level",
+            pre_crying_risk
+            + 0.5 * (stress_during - pre_anxiety)
+            - 0.3 * journaling / 2
+            - 0.2 * breathing / 2,
+        )
+        speech_block = draw(
+            "speech_block_level",
+            pre_speech_block_risk
+            + 0.4 * (stress_during - pre_anxiety)
+            - 0.3 * three_messages / 2,
+        )
+        expression = draw(
+            "expression_score",
+            5.0
+            + 0.4 * three_messages / 2
+            + 0.3 * roleplay / 2
+            - 0.25 * speech_block
+            - 0.15 * crying,
+        )
+        relationship = draw(
+            "relationship_impact",
+            -1
+            + 0.4 * (expression - 5) / 2
+            - 0.25 * np.maximum(stress_during - 6, 0),
+        )
+        return {
+            "stress_after": stress_after,
+            "crying_level": crying,
+            "expression_score": expression,
+            "relationship_impact": relationship,
         }
 
+    @staticmethod
+    def compile_effects(rows: Iterable[Tuple[str, str, float]]) -> CompiledEffects:
+        """(treatment_key, outcome_name, ate) rows -> CompiledEffects."""
+        compiled: CompiledEffects = {}
+        for treatment_key, outcome_name, ate in rows:
+            if treatment_key not in PREPARATION_KEYS or outcome_name not in OUTCOME_RANGES:
+                continue
+            ates = compiled.setdefault(outcome_name, [None] * len(PREPARATION_KEYS))
+            ates[PREPARATION_KEYS.index(treatment_key)] = float(ate)
+        return compiled
+
+    @staticmethod
+    def plan_matrix(plans: Sequence[Mapping[str, int]]) -> np.ndarray:
+        """(n, 5) intensity matrix in PREPARATION_KEYS order from plan dicts."""
+        return np.array([[plan.get(key, 0) for key in PREPARATION_KEYS] for plan in plans], dtype=float)
+
+    @staticmethod
+    def plan_grid(values: Mapping[str, Sequence[int]]) -> np.ndarray:
+        """
+        Cartesian product of candidate intensities per preparation, as an
+        (n, 5) matrix in PREPARATION_KEYS order (missing keys stay at 0).
+        """
+        axes = [np.unique(np.asarray(values.get(key, [0]), dtype=float)) for key in PREPARATION_KEYS]
+        mesh = np.meshgrid(*axes, indexing="ij")
+        return np.stack([m.ravel() for m in mesh], axis=1)
+
     def calculate_total_reward(
         self,
         predicted_stress_after: float,
@@ -282,7 +527,9 @@ class AnalyticsEngine:
         Calculate total reward based on user preference weights
 
         This is the key function that connects slider Layer B (preferences)
-        to the recommendation/bandit algorithm
+        to the recommendation/bandit algorithm.
+
+        Pure arithmetic, so NumPy arrays of predictions score a whole batch.
         """
         # Relief (楽さ) = reduction in stress
         relief_reward = pre_anxiety - predicted_stress_after
@@ -0,0 +1,46 @@
+"""
+Largest-Triangle-Three-Buckets downsampling for chart series.
+
+`lttb_indices` picks which points to keep; callers index their own rows with
+the result, so the kept points are real episodes (ids and labels intact).
+Several y-series can share one selection: a candidate's triangle area is
+summed over the series, so a spike in any metric is preserved.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, ys: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indices of at most `max_points` representative points (first and last
+    always included). `x` has shape (n,), `ys` shape (n,) or (n, k).
+    """
+    n = len(x)
+    if max_points >= n or n <= 2:
+        return np.arange(n)
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+
+    x = np.asarray(x, dtype=float)
+    ys = np.asarray(ys, dtype=float).reshape(n, -1)
+    # Interior points are split into max_points - 2 buckets of near-equal size.
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # Third vertex: average of the next bucket (or the last point).
+        if i + 2 < len(edges):
+            nxt = slice(edges[i + 1], edges[i + 2])
+            cx, cy = x[nxt].mean(), ys[nxt].mean(axis=0)
+        else:
+            cx, cy = x[-1], ys[-1]
+        bx, by = x[start:end], ys[start:end]
+        area = np.abs((x[a] - cx) * (by - ys[a]) - (x[a] - bx)[:, None] * (cy - ys[a])).sum(axis=1)
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
@@ -7,6 +7,12 @@ The structures intentionally mirror the PDF specification:
 - EmotionOutcome: outcome + reflection (post episode)
 - EmotionPreferenceProfile: Layer-B preference weights
 - EmotionTreatmentEffect: persisted ATEs from the causal job
+- EmotionAnalyticsState: per-user bookkeeping for incremental job runs
+- EmotionPathMoments: sufficient statistics for incremental path estimates
+- EmotionAnalyticsJob: durable queue consumed by `python -m cqox.jobs.worker`
+- EmotionJobLock: cross-process run lock / rerun flag for the analytics jobs
+- EmotionUserRollup: write-maintained per-user dashboard counters
+- EmotionBanditPosterior: per-user plan bandit posterior (see cqox.jobs.bandit)
 """
 from __future__ import annotations
 
@@ -19,6 +25,7 @@ from sqlalchemy import (
     Enum as SQLEnum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
@@ -46,6 +53,13 @@ class EpisodeStatus(str, enum.Enum):
     CANCELLED = "cancelled"
 
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class PartnerReaction(str, enum.Enum):
     VERY_POSITIVE = "very_positive"
     POSITIVE = "positive"
@@ -59,6 +73,13 @@ class EmotionEpisode(Base):
     """Core episode log."""
 
     __tablename__ = "emotion_episode"
+    # Keyset pagination order (scheduled_at DESC, id DESC) per user, optionally
+    # narrowed by status or scenario first.
+    __table_args__ = (
+        Index("ix_episode_user_scheduled", "user_id", "scheduled_at", "id"),
+        Index("ix_episode_user_status_scheduled", "user_id", "status", "scheduled_at", "id"),
+        Index("ix_episode_user_scenario_scheduled", "user_id", "scenario_type", "scheduled_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
@@ -218,6 +239,15 @@ class EmotionPathSummary(Base):
     total_eval_to_cry_lo: Mapped[float | None] = mapped_column(Float, nullable=True)
     total_eval_to_cry_hi: Mapped[float | None] = mapped_column(Float, nullable=True)
     n_episodes: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Episode decomposition inputs, refreshed by the path and effect jobs
+    # (see cqox.jobs.estimate_paths.refresh_decomposition_baselines).
+    mean_eval_threat: Mapped[float | None] = mapped_column(Float, nullable=True)
+    mean_pre_anxiety: Mapped[float | None] = mapped_column(Float, nullable=True)
+    mean_suppress_intent: Mapped[float | None] = mapped_column(Float, nullable=True)
+    trait_crying_proneness: Mapped[float | None] = mapped_column(Float, nullable=True)
+    contrib_trait: Mapped[float | None] = mapped_column(Float, nullable=True)
+    baseline_crying: Mapped[float | None] = mapped_column(Float, nullable=True)
+    crying_effects: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON {treatment_key: ate}
     updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
@@ -235,3 +265,133 @@ class EmotionPathPartnerSummary(Base):
     total_eval_to_cry: Mapped[float | None] = mapped_column(Float, nullable=True)
     n_episodes: Mapped[int] = mapped_column(Integer, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class EmotionAnalyticsState(Base):
+    """
+    Per-user change / estimation bookkeeping driving incremental job runs.
+
+    `data_version` is incremented in the database by every write; each job
+    records the version it last estimated, so a user is dirty while the two
+    differ (the timestamps are informational). `*_fingerprint` is the hash of
+    the input the job last fit the user on; unchanged -> skip the refit.
+    """
+
+    __tablename__ = "emotion_analytics_state"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    data_changed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    data_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    effects_estimated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    effects_version: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    paths_estimated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    paths_version: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    effects_fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    paths_fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+
+class EmotionPathMoments(Base):
+    """
+    Running moment matrix sum(v v^T) of v = [1, E, S, R, C] per user and partner role.
+
+    partner_role "" holds the user's totals across all partners.
+    """
+
+    __tablename__ = "emotion_path_moments"
+    __table_args__ = (
+        UniqueConstraint("user_id", "partner_role", name="uq_path_moments"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    partner_role: Mapped[str] = mapped_column(String(32), nullable=False)
+    n_episodes: Mapped[int] = mapped_column(Integer, nullable=False)
+    moments: Mapped[str] = mapped_column(Text, nullable=False)  # JSON-encoded 5x5 matrix
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class EmotionAnalyticsJob(Base):
+    """
+    Queued analytics recompute request.
+
+    `dedupe_key` is set only while the job is queued; its unique constraint
+    coalesces duplicate requests for the same user (NULLs never collide).
+    `user_id` NULL requests a full rebuild.
+    """
+
+    __tablename__ = "emotion_analytics_job"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    status: Mapped[JobStatus] = mapped_column(SQLEnum(JobStatus), index=True, nullable=False, default=JobStatus.QUEUED)
+    dedupe_key: Mapped[str | None] = mapped_column(String(64), unique=True, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class EmotionJobLock(Base):
+    """
+    Named run lock shared by every worker process.
+
+    On SQLite the row itself is the lock (`owner` + lease); on Postgres the
+    lock is a session advisory lock and only `rerun_requested` is used.
+    `rerun_requested`: 0 = none, 1 = incremental, 2 = full rebuild.
+    """
+
+    __tablename__ = "emotion_job_lock"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    rerun_requested: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class EmotionUserRollup(Base):
+    """
+    Per-user dashboard counters, incremented in the same transaction as the
+    writes they summarise (see cqox.jobs.rollup). One column per preparation
+    template so updates stay single-row atomic increments; adding a template
+    means adding a column.
+    """
+
+    __tablename__ = "emotion_user_rollup"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    episodes_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    episodes_planned: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    episodes_completed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    episodes_cancelled: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    prep_journaling_10m_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    prep_three_messages_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    prep_breathing_4_7_8_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    prep_roleplay_self_qa_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    prep_safe_word_plan_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    outcomes_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_stress_during: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_stress_after: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_crying_level: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_speech_block_level: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_expression_score: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_relationship_impact: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class EmotionBanditPosterior(Base):
+    """
+    Sufficient statistics of a user's Thompson-sampling reward model: A^-1
+    and b of the Bayesian linear regression, updated by rank-1 steps as
+    outcomes are recorded (see cqox.jobs.bandit).
+    """
+
+    __tablename__ = "emotion_bandit_posterior"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # Feature layout the statistics belong to; other versions restart from the prior.
+    model_version: Mapped[str] = mapped_column(String(32), nullable=False)
+    n_updates: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    a_inv: Mapped[str] = mapped_column(Text, nullable=False)  # JSON-encoded d x d matrix
+    b: Mapped[str] = mapped_column(Text, nullable=False)  # JSON-encoded d vector
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,241 @@
+"""
+Preparation-plan search.
+
+`recommend_plans` scores the whole plan space (11^5 = 161,051 plans at
+intensities 0-10) in one vectorized pass of `AnalyticsEngine`, filters it
+by an optional effort budget (sum of intensities) and returns the top-k
+plans by preference-weighted reward plus a bounded, evenly thinned Pareto
+front over relief / expression / relationship.
+
+`recommend_bandit_plan` instead draws one plan from the user's Thompson-
+sampling posterior (cqox.jobs.bandit) over the coarser lattice
+BANDIT_INTENSITIES^5, trading exploration against exploitation as outcomes
+are recorded.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .analytics import PREPARATION_KEYS, AnalyticsEngine, CompiledEffects
+from cqox.jobs import bandit
+
+INTENSITIES = list(range(11))
+BANDIT_INTENSITIES = [0, 3, 5, 7, 10]
+# Pareto front: grid cells per objective axis, and the most plans returned.
+PARETO_RESOLUTION = 64
+MAX_PARETO_PLANS = 50
+
+
+@lru_cache(maxsize=1)
+def full_plan_grid() -> np.ndarray:
+    """Every plan as a read-only (161051, 5) matrix in PREPARATION_KEYS order."""
+    grid = AnalyticsEngine.plan_grid({key: INTENSITIES for key in PREPARATION_KEYS})
+    grid.setflags(write=False)
+    return grid
+
+
+@lru_cache(maxsize=1)
+def full_plan_effort() -> np.ndarray:
+    effort = full_plan_grid().sum(axis=1)
+    effort.setflags(write=False)
+    return effort
+
+
+def _axis_codes(values: np.ndarray, resolution: int) -> np.ndarray:
+    """Integer cell per value: exact ranks for at most `resolution` values, else equal-width bins."""
+    if len(values) <= resolution:
+        return np.unique(values, return_inverse=True)[1].reshape(-1)
+    low, high = values.min(), values.max()
+    if high == low:
+        return np.zeros(len(values), dtype=int)
+    return np.minimum(((values - low) * (resolution / (high - low))).astype(int), resolution - 1)
+
+
+def _skyline(codes: np.ndarray, score: np.ndarray, cost: np.ndarray) -> np.ndarray:
+    """
+    One representative (largest `score`, then lowest `cost`) per
+    non-dominated cell of the integer grid `codes` (n, k).
+
+    For every cell of the first k-1 axes only the largest last-axis code can
+    be on the front; a suffix-max sweep over that table then tells whether a
+    strictly larger cell exists, in O(n + cells) without pairwise checks.
+    """
+    dims = tuple(int(d) for d in codes[:, :-1].max(axis=0) + 1)
+    head = np.ravel_multi_index(tuple(codes[:, :-1].T), dims)
+    last = codes[:, -1]
+    best_last = np.full(int(np.prod(dims)), -1)
+    np.maximum.at(best_last, head, last)
+    best_last = best_last.reshape(dims)
+
+    covered = best_last
+    for axis in range(len(dims)):
+        covered = np.flip(np.maximum.accumulate(np.flip(covered, axis), axis=axis), axis)
+    # Best last-axis code among cells >= this one on every head axis, excluding itself.
+    beyond = np.full(dims, -1)
+    for axis in range(len(dims)):
+        shifted = np.full(dims, -1)
+        src = [slice(None)] * len(dims)
+        dst = [slice(None)] * len(dims)
+        src[axis], dst[axis] = slice(1, None), slice(None, -1)
+        shifted[tuple(dst)] = covered[tuple(src)]
+        beyond = np.maximum(beyond, shifted)
+    on_front = (best_last > beyond).reshape(-1)
+
+    candidates = np.flatnonzero(on_front[head] & (last == best_last.reshape(-1)[head]))
+    order = candidates[np.lexsort((cost[candidates], -score[candidates], head[candidates]))]
+    _, first = np.unique(head[order], return_index=True)
+    return order[first]
+
+
+def pareto_front(
+    objectives: np.ndarray,
+    cost: Optional[np.ndarray] = None,
+    max_points: Optional[int] = None,
+    resolution: int = PARETO_RESOLUTION,
+) -> np.ndarray:
+    """
+    Indices of non-dominated rows of `objectives` (n, k >= 2; larger is
+    better), one per occupied cell of a `resolution`-per-axis grid: within a
+    cell the row with the largest objective sum, then the lowest `cost`, is
+    kept. Inputs of at most `resolution` rows are ranked instead of binned,
+    so they get the exact front (one row per distinct point). Every returned
+    row is truly non-dominated; with binning, rows sharing a cell with a
+    returned one are thinned out (epsilon-Pareto).
+
+    With `max_points` the grid is coarsened (3/4 of the cells per axis per
+    step) until at most that many rows remain, so the front size stays bounded
+    however flat the trade-off surface is.
+    """
+    cost = np.zeros(len(objectives)) if cost is None else cost
+    if len(objectives) == 0:
+        return np.array([], dtype=int)
+    score = objectives.sum(axis=1)
+    codes = np.column_stack([_axis_codes(objectives[:, j], resolution) for j in range(objectives.shape[1])])
+    front = _skyline(codes, score, cost)
+    # Rows off the front sit in cells dominated by (or equal to) a front cell
+    # at every coarser level too, so coarsening only needs the front itself.
+    while max_points is not None and len(front) > max_points and codes[front].max() > 0:
+        codes = codes * 3 // 4
+        front = front[_skyline(codes[front], score[front], cost[front])]
+    return front
+
+
+def recommend_plans(
+    engine: AnalyticsEngine,
+    pre_anxiety: int,
+    pre_crying_risk: int,
+    pre_speech_block_risk: int,
+    weights: Dict[str, float],
+    effort_budget: Optional[int] = None,
+    top_k: int = 5,
+    effects: Optional[CompiledEffects] = None,
+    max_pareto: int = MAX_PARETO_PLANS,
+) -> Dict:
+    """
+    Returns {"top": [...], "pareto": [...], "n_evaluated": int}; each plan
+    entry is a dict of intensities, effort, predictions, relief and reward.
+    Ties in reward go to the cheaper plan. The Pareto front is thinned to at
+    most `max_pareto` plans (see `pareto_front`), each the lowest-effort plan
+    of its point.
+    """
+    plans = full_plan_grid()
+    effort = full_plan_effort()
+    if effort_budget is not None:
+        within = np.flatnonzero(effort <= effort_budget)
+        plans, effort = plans[within], effort[within]
+
+    prediction = engine.predict_outcomes_batch(pre_anxiety, pre_crying_risk, pre_speech_block_risk, plans, effects)
+    stress_after = prediction["stress_after"]["mean"]
+    expression = prediction["expression_score"]["mean"]
+    relationship = prediction["relationship_impact"]["mean"]
+    reward = engine.calculate_total_reward(
+        predicted_stress_after=stress_after,
+        predicted_expression=expression,
+        predicted_relationship=relationship,
+        pre_anxiety=float(pre_anxiety),
+        weight_relief=weights["relief"],
+        weight_expression=weights["expression"],
+        weight_relationship=weights["relationship"],
+    )
+
+    # Only plans reaching the k-th best reward can be in the top k; order that
+    # (small) set by reward, then effort.
+    k = min(top_k, len(reward))
+    threshold = np.partition(reward, len(reward) - k)[len(reward) - k]
+    candidates = np.flatnonzero(reward >= threshold)
+    top = candidates[np.lexsort((effort[candidates], -reward[candidates]))][:k]
+
+    relief = pre_anxiety - stress_after
+    pareto = pareto_front(np.column_stack([relief, expression, relationship]), cost=effort, max_points=max_pareto)
+    pareto = pareto[np.argsort(-relief[pareto], kind="stable")]
+
+    def entry(i: int) -> Dict:
+        return {
+            "plan": dict(zip(PREPARATION_KEYS, plans[i].astype(int).tolist())),
+            "effort": int(effort[i]),
+            "predicted_stress_after": float(stress_after[i]),
+            "predicted_crying_level": float(prediction["crying_level"]["mean"][i]),
+            "predicted_expression_score": float(expression[i]),
+            "predicted_relationship_impact": float(relationship[i]),
+            "relief": float(relief[i]),
+            "total_reward": float(reward[i]),
+        }
+
+    return {
+        "top": [entry(i) for i in top],
+        "pareto": [entry(i) for i in pareto],
+        "n_evaluated": int(len(reward)),
+    }
+
+
+@lru_cache(maxsize=1)
+def bandit_candidates() -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Read-only (plans, effort, plans / 10, (plans / 10)^2) for the bandit lattice."""
+    plans = AnalyticsEngine.plan_grid({key: BANDIT_INTENSITIES for key in PREPARATION_KEYS})
+    scaled = plans / 10.0
+    arrays = (plans, plans.sum(axis=1), scaled, scaled * scaled)
+    for array in arrays:
+        array.setflags(write=False)
+    return arrays
+
+
+def recommend_bandit_plan(
+    posterior: bandit.BanditPosterior,
+    scenario_type: str,
+    pre_anxiety: int,
+    pre_crying_risk: int,
+    pre_speech_block_risk: int,
+    eval_threat_level: Optional[int] = None,
+    suppress_intent_level: Optional[int] = None,
+    effort_budget: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> Dict:
+    """
+    Thompson sampling: draw coefficients from the posterior and return the
+    lattice plan that scores best under them, with its posterior mean / std.
+    """
+    context = bandit.context_vector(
+        pre_anxiety, pre_crying_risk, pre_speech_block_risk, eval_threat_level, suppress_intent_level
+    )
+    mean, factor = posterior.arrays()
+    theta = mean + factor @ np.random.default_rng(seed).standard_normal(len(mean))
+
+    plans, effort, scaled, squared = bandit_candidates()
+    linear, quadratic, constant = bandit.plan_weights(theta, scenario_type, context)
+    scores = scaled @ linear + squared @ quadratic
+    if effort_budget is not None:
+        scores = np.where(effort <= effort_budget, scores, -np.inf)
+    best = int(np.argmax(scores))
+
+    x = bandit.features(scenario_type, context, plans[best])[0]
+    return {
+        "plan": dict(zip(PREPARATION_KEYS, plans[best].astype(int).tolist())),
+        "effort": int(effort[best]),
+        "expected_reward": float(x @ mean),
+        "reward_std": float(np.linalg.norm(factor.T @ x)),
+        "sampled_reward": float(scores[best] + constant),
+        "n_observations": posterior.n_updates,
+    }
@@ -9,7 +9,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from enum import Enum
 
 
@@ -133,6 +133,12 @@ class EpisodeRead(BaseModel):
         from_attributes = True
 
 
+class EpisodePage(BaseModel):
+    items: List[EpisodeRead]
+    # Opaque; pass back as `cursor` to fetch the next page. None on the last page.
+    next_cursor: Optional[str] = None
+
+
 class PreparationExecutionRead(BaseModel):
     id: int
     episode_id: int
@@ -252,6 +258,8 @@ class TraitProfileRead(BaseModel):
 class DeltaMetric(BaseModel):
     mean: float
     ci95: List[float]
+    # Monte Carlo runs only: empirical quantile per level ("0.05", "0.5", ...).
+    quantiles: Optional[Dict[str, float]] = None
 
 
 class TreatmentEffectRead(BaseModel):
@@ -282,6 +290,8 @@ class TimelinePoint(BaseModel):
 
 class TimelineResponse(BaseModel):
     points: List[TimelinePoint]
+    # Points in the requested window before downsampling.
+    total_points: Optional[int] = None
 
 
 class PreparationCount(BaseModel):
@@ -294,6 +304,8 @@ class DashboardSummary(BaseModel):
     total_episodes: int
     total_completed: int
     total_planned: int
+    # Mean outcome metrics over completed episodes (empty until the first outcome).
+    outcome_means: Dict[str, float] = Field(default_factory=dict)
 
 
 class PathSummaryRead(BaseModel):
@@ -362,6 +374,11 @@ class SafetyCheckResponse(BaseModel):
     resources: List[SafetyResource]
 
 
+MAX_MONTE_CARLO_SAMPLES = 20000
+# Samples x plans per batch request; keeps a Monte Carlo batch well under a second.
+MAX_MONTE_CARLO_DRAWS = 2_000_000
+
+
 class SimulationRequest(BaseModel):
     pre_anxiety: int = Field(..., ge=0, le=10)
     pre_crying_risk: int = Field(..., ge=0, le=10)
@@ -371,6 +388,9 @@ class SimulationRequest(BaseModel):
     prep_breathing_4_7_8: int = Field(0, ge=0, le=10)
     prep_roleplay_self_qa: int = Field(0, ge=0, le=10)
     prep_safe_word_plan: int = Field(0, ge=0, le=10)
+    # Set to get Monte Carlo intervals instead of mean ± 1.96·std; `seed` makes them reproducible.
+    n_samples: Optional[int] = Field(None, ge=100, le=MAX_MONTE_CARLO_SAMPLES)
+    seed: Optional[int] = Field(None, ge=0)
 
 
 class SimulationResponse(BaseModel):
@@ -379,6 +399,133 @@ class SimulationResponse(BaseModel):
     predicted_expression_score: DeltaMetric
     predicted_relationship_impact: DeltaMetric
     total_reward: float
+    # True when the user's own effect estimates replaced the population model.
+    personalized: bool = False
+    disclaimer: str
+
+
+MAX_SIMULATION_PLANS = 20000
+
+
+class PreparationGrid(BaseModel):
+    """Candidate intensities per preparation; every combination is simulated."""
+
+    journaling_10m: List[int] = Field(default_factory=lambda: [0], min_length=1)
+    three_messages: List[int] = Field(default_factory=lambda: [0], min_length=1)
+    breathing_4_7_8: List[int] = Field(default_factory=lambda: [0], min_length=1)
+    roleplay_self_qa: List[int] = Field(default_factory=lambda: [0], min_length=1)
+    safe_word_plan: List[int] = Field(default_factory=lambda: [0], min_length=1)
+
+    @field_validator("journaling_10m", "three_messages", "breathing_4_7_8", "roleplay_self_qa", "safe_word_plan")
+    @classmethod
+    def ensure_bounds(cls, values: List[int]) -> List[int]:
+        if any(v < 0 or v > 10 for v in values):
+            raise ValueError("intensities must be within 0-10")
+        return sorted(set(values))
+
+    def size(self) -> int:
+        n = 1
+        for values in self.model_dump().values():
+            n *= len(values)
+        return n
+
+
+class SimulationBatchRequest(BaseModel):
+    pre_anxiety: int = Field(..., ge=0, le=10)
+    pre_crying_risk: int = Field(..., ge=0, le=10)
+    pre_speech_block_risk: int = Field(..., ge=0, le=10)
+    # Exactly one of: explicit plans, or a grid spec expanded server-side.
+    plans: Optional[List[PreparationPlan]] = Field(None, min_length=1, max_length=MAX_SIMULATION_PLANS)
+    grid: Optional[PreparationGrid] = None
+    n_samples: Optional[int] = Field(None, ge=100, le=MAX_MONTE_CARLO_SAMPLES)
+    seed: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def ensure_one_source(self) -> "SimulationBatchRequest":
+        if (self.plans is None) == (self.grid is None):
+            raise ValueError("provide either plans or grid")
+        n_plans = len(self.plans) if self.plans is not None else self.grid.size()
+        if n_plans > MAX_SIMULATION_PLANS:
+            raise ValueError(f"grid expands to more than {MAX_SIMULATION_PLANS} plans")
+        if self.n_samples and n_plans * self.n_samples > MAX_MONTE_CARLO_DRAWS:
+            raise ValueError(f"plans x n_samples must not exceed {MAX_MONTE_CARLO_DRAWS}")
+        return self
+
+
+class BatchMetric(BaseModel):
+    mean: List[float]
+    ci95_low: List[float]
+    ci95_high: List[float]
+    quantiles: Optional[Dict[str, List[float]]] = None
+
+
+class SimulationBatchResponse(BaseModel):
+    """Column-oriented: entry i of every list belongs to plans[i]."""
+
+    prep_keys: List[str]
+    # Intensities per plan, in prep_keys order.
+    plans: List[List[int]]
+    predicted_stress_after: BatchMetric
+    predicted_crying_level: BatchMetric
+    predicted_expression_score: BatchMetric
+    predicted_relationship_impact: BatchMetric
+    total_reward: List[float]
+    personalized: bool = False
+    disclaimer: str
+
+
+class PlanRecommendationRequest(BaseModel):
+    pre_anxiety: int = Field(..., ge=0, le=10)
+    pre_crying_risk: int = Field(..., ge=0, le=10)
+    pre_speech_block_risk: int = Field(..., ge=0, le=10)
+    # Upper bound on the sum of the five intensities (None: unconstrained).
+    effort_budget: Optional[int] = Field(None, ge=0, le=50)
+    top_k: int = Field(5, ge=1, le=100)
+
+
+class RecommendedPlan(BaseModel):
+    plan: PreparationPlan
+    effort: int
+    predicted_stress_after: float
+    predicted_crying_level: float
+    predicted_expression_score: float
+    predicted_relationship_impact: float
+    # pre_anxiety - predicted_stress_after
+    relief: float
+    total_reward: float
+
+
+class PlanRecommendationResponse(BaseModel):
+    top_plans: List[RecommendedPlan]
+    # Non-dominated over relief / expression / relationship, cheapest plan per point,
+    # thinned to at most recommend.MAX_PARETO_PLANS evenly spread plans.
+    pareto_front: List[RecommendedPlan]
+    n_evaluated: int
+    personalized: bool = False
+    disclaimer: str
+
+
+class BanditRecommendationRequest(BaseModel):
+    scenario_type: ScenarioType
+    pre_anxiety: int = Field(..., ge=0, le=10)
+    pre_crying_risk: int = Field(..., ge=0, le=10)
+    pre_speech_block_risk: int = Field(..., ge=0, le=10)
+    eval_threat_level: Optional[int] = Field(None, ge=0, le=10)
+    suppress_intent_level: Optional[int] = Field(None, ge=0, le=10)
+    effort_budget: Optional[int] = Field(None, ge=0, le=50)
+    # Fixes the posterior draw (reproducible recommendation).
+    seed: Optional[int] = Field(None, ge=0)
+
+
+class BanditRecommendationResponse(BaseModel):
+    plan: PreparationPlan
+    effort: int
+    # Posterior mean / std of this plan's reward in this context.
+    expected_reward: float
+    reward_std: float
+    # The plan's reward under the sampled coefficients that selected it.
+    sampled_reward: float
+    n_observations: int
     disclaimer: str
 
 
@@ -402,6 +549,11 @@ class CSVImportResponse(BaseModel):
 # ---------------------------------------------------------------------------
 
 
+class EpisodeDecompositionBatchRequest(BaseModel):
+    # None decomposes every episode with a recorded outcome.
+    episode_ids: Optional[List[int]] = Field(None, max_length=1000)
+
+
 class EpisodeDecompositionRead(BaseModel):
     episode_id: int
     observed_crying: float
@@ -415,3 +567,31 @@ class EpisodeDecompositionRead(BaseModel):
     beta_eval_to_cry: float
     beta_stress_to_cry: float
     beta_suppress_to_cry: float
+
+
+class EpisodeDecompositionBatch(BaseModel):
+    items: List[EpisodeDecompositionRead]
+
+
+class DashboardSection(str, Enum):
+    SUMMARY = "summary"
+    EFFECTS = "effects"
+    TIMELINE = "timeline"
+    PATH_SUMMARY = "path_summary"
+    PARTNER_PATHS = "partner_paths"
+    EPISODES = "episodes"
+    DECOMPOSITIONS = "decompositions"
+
+
+class DashboardBundle(BaseModel):
+    """Dashboard sections in one response; sections that were not requested are null."""
+
+    summary: Optional[DashboardSummary] = None
+    effects: Optional[List[TreatmentEffectRead]] = None
+    timeline: Optional[TimelineResponse] = None
+    # Also null while the user's path model is not available yet.
+    path_summary: Optional[PathSummaryRead] = None
+    partner_paths: Optional[List[PartnerPathSummary]] = None
+    episodes: Optional[List[EpisodeRead]] = None
+    # Decompositions of the episodes in `episodes` that have an outcome.
+    decompositions: Optional[List[EpisodeDecompositionRead]] = None
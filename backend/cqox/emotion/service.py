@@ -6,47 +6,52 @@ and make the logic easier to test.
 """
 from __future__ import annotations
 
+import base64
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional
+import json
+from typing import Iterable, List, Optional
 import logging
-import threading
 
-from sqlalchemy import func
+import numpy as np
+from pydantic import TypeAdapter
+from sqlalchemy import case, func, select, tuple_
 from sqlalchemy.orm import Session
 
 from . import models, schemas
-from cqox.jobs.estimate_effects import estimate_and_persist_effects
-from cqox.jobs.estimate_paths import estimate_and_persist_paths
+from .analytics import AnalyticsEngine, CompiledEffects
+from .downsample import lttb_indices
+from cqox import cache
+from cqox.jobs.bandit import BanditPosterior, posterior_from_record, update_bandit_on_outcome
+from cqox.jobs.estimate_paths import (
+    DEFAULT_TRAIT_CRYING_PRONENESS,
+    DEFAULT_TRAIT_SOCIAL_ANXIETY,
+    DEFAULT_TRAIT_SUPPRESSION,
+    accumulate_episode_moments,
+    decomposition_baseline,
+)
+from cqox.jobs.queue import enqueue_analytics_job
+from cqox.jobs.rollup import (
+    OUTCOME_FIELDS,
+    PREP_COLUMNS,
+    rollup_on_episode_created,
+    rollup_on_outcome,
+    rollup_on_preparation_added,
+)
+from cqox.jobs.state import mark_user_dirty
 
 logger = logging.getLogger(__name__)
-_job_lock = threading.Lock()
 
+_EFFECTS_ADAPTER = TypeAdapter(List[schemas.TreatmentEffectRead])
+_PATH_SUMMARY_ADAPTER = TypeAdapter(schemas.PathSummaryRead)
+_PARTNER_PATHS_ADAPTER = TypeAdapter(List[schemas.PartnerPathSummary])
+_PREFERENCES_ADAPTER = TypeAdapter(schemas.PreferenceProfileRead)
+_TRAITS_ADAPTER = TypeAdapter(schemas.TraitProfileRead)
+_PREDICTOR_ADAPTER = TypeAdapter(CompiledEffects)
+_BANDIT_ADAPTER = TypeAdapter(BanditPosterior)
 
-def _run_analytics_jobs_async():
-    def worker():
-        try:
-            estimate_and_persist_effects()
-        except Exception:
-            logger.exception("Failed to run treatment effect estimation job")
-        try:
-            estimate_and_persist_paths()
-        except Exception:
-            logger.exception("Failed to run path estimation job")
-        finally:
-            _job_lock.release()
-
-    acquired = _job_lock.acquire(blocking=False)
-    if not acquired:
-        return
-    threading.Thread(target=worker, daemon=True).start()
-
-PREPARATION_TEMPLATE_KEYS = [
-    "journaling_10m",
-    "three_messages",
-    "breathing_4_7_8",
-    "roleplay_self_qa",
-    "safe_word_plan",
-]
+# The dashboard reports exactly the templates the rollup keeps counters for.
+PREPARATION_TEMPLATE_KEYS = list(PREP_COLUMNS)
 
 
 # ---------------------------------------------------------------------------
@@ -83,6 +88,7 @@ def _upsert_preference_profile(db: Session, user_id: int, weights: dict[str, flo
         )
         db.add(profile)
 
+    cache.invalidate_on_commit(db, cache.PREFERENCES, [user_id])
     return profile
 
 
@@ -113,6 +119,7 @@ def create_episode_draft(db: Session, user_id: int, draft: schemas.EpisodeDraftC
     db.add(episode)
     db.flush()
 
+    planned_keys = []
     for template_key, intensity in _prep_intensity_map(draft.preparations_planned).items():
         if intensity <= 0:
             continue
@@ -123,9 +130,14 @@ def create_episode_draft(db: Session, user_id: int, draft: schemas.EpisodeDraftC
                 planned_intensity=intensity,
             )
         )
+        planned_keys.append(template_key)
+    rollup_on_episode_created(db, episode, planned_keys)
 
     normalized = draft.preference_weights_raw.normalized()
     _upsert_preference_profile(db, user_id, normalized)
+    # Planned episodes feed the decomposition means, so they change the user's analytics inputs too.
+    mark_user_dirty(db, user_id)
+    enqueue_analytics_job(db, user_id)
 
     db.commit()
     db.refresh(episode)
@@ -143,11 +155,63 @@ def list_episodes(
     status: Optional[models.EpisodeStatus] = None,
     limit: int = 50,
 ) -> List[schemas.EpisodeRead]:
-    query = db.query(models.EmotionEpisode).filter(models.EmotionEpisode.user_id == user_id)
+    return list_episodes_page(db, user_id, status=status, limit=limit).items
+
+
+def _encode_cursor(episode: models.EmotionEpisode) -> str:
+    raw = json.dumps([episode.scheduled_at.isoformat(), episode.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        scheduled_at, episode_id = json.loads(raw)
+        return datetime.fromisoformat(scheduled_at), int(episode_id)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def list_episodes_page(
+    db: Session,
+    user_id: int,
+    status: Optional[models.EpisodeStatus] = None,
+    scenario_type: Optional[models.ScenarioType] = None,
+    partner_role: Optional[str] = None,
+    scheduled_from: Optional[datetime] = None,
+    scheduled_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> schemas.EpisodePage:
+    """
+    Newest-first episodes, keyset-paginated on (scheduled_at, id).
+
+    `scheduled_from` is inclusive, `scheduled_to` exclusive. Each page walks
+    a (user_id[, status | scenario_type], scheduled_at, id) index, so the
+    cost does not grow with how deep the cursor is.
+    """
+    Episode = models.EmotionEpisode
+    query = db.query(Episode).filter(Episode.user_id == user_id)
     if status:
-        query = query.filter(models.EmotionEpisode.status == status)
-    episodes = query.order_by(models.EmotionEpisode.scheduled_at.desc()).limit(limit).all()
-    return [schemas.EpisodeRead.model_validate(ep) for ep in episodes]
+        query = query.filter(Episode.status == status)
+    if scenario_type:
+        query = query.filter(Episode.scenario_type == scenario_type)
+    if partner_role:
+        query = query.filter(Episode.context_partner_role == partner_role)
+    if scheduled_from:
+        query = query.filter(Episode.scheduled_at >= scheduled_from)
+    if scheduled_to:
+        query = query.filter(Episode.scheduled_at < scheduled_to)
+    if cursor:
+        query = query.filter(tuple_(Episode.scheduled_at, Episode.id) < tuple_(*_decode_cursor(cursor)))
+
+    episodes = query.order_by(Episode.scheduled_at.desc(), Episode.id.desc()).limit(limit + 1).all()
+    has_more = len(episodes) > limit
+    episodes = episodes[:limit]
+    return schemas.EpisodePage(
+        items=[schemas.EpisodeRead.model_validate(ep) for ep in episodes],
+        next_cursor=_encode_cursor(episodes[-1]) if has_more else None,
+    )
 
 
 def get_episode_detail(db: Session, user_id: int, episode_id: int) -> schemas.EpisodeComplete:
@@ -188,6 +252,9 @@ def add_preparation_execution(
         actual_intensity=payload.actual_intensity,
     )
     db.add(execution)
+    rollup_on_preparation_added(db, user_id, payload.template_key)
+    mark_user_dirty(db, user_id)
+    enqueue_analytics_job(db, user_id)
     db.commit()
     db.refresh(execution)
     return schemas.PreparationExecutionRead.model_validate(execution)
@@ -203,6 +270,7 @@ def record_outcome(db: Session, user_id: int, episode_id: int, outcome: schemas.
         raise ValueError("Episode not found")
     if episode.outcome:
         raise ValueError("Outcome already recorded")
+    prefs = get_preference_profile(db, user_id)
 
     outcome_record = models.EmotionOutcome(
         episode_id=episode_id,
@@ -218,12 +286,21 @@ def record_outcome(db: Session, user_id: int, episode_id: int, outcome: schemas.
         reflection_short=outcome.reflection_short,
     )
     db.add(outcome_record)
+    previous_status = episode.status
     episode.status = models.EpisodeStatus.COMPLETED
+    rollup_on_outcome(db, user_id, previous_status, outcome_record)
+    accumulate_episode_moments(db, episode, outcome.crying_level)
+    update_bandit_on_outcome(
+        db,
+        episode,
+        outcome_record,
+        {"relief": prefs.weight_relief, "expression": prefs.weight_expression, "relationship": prefs.weight_relationship},
+    )
+    mark_user_dirty(db, user_id)
+    enqueue_analytics_job(db, user_id)
     db.commit()
     db.refresh(outcome_record)
 
-    _run_analytics_jobs_async()
-
     return schemas.OutcomeRead.model_validate(outcome_record)
 
 
@@ -233,17 +310,23 @@ def record_outcome(db: Session, user_id: int, episode_id: int, outcome: schemas.
 
 
 def get_preference_profile(db: Session, user_id: int) -> schemas.PreferenceProfileRead:
+    return cache.read_through(
+        cache.PREFERENCES, user_id, _PREFERENCES_ADAPTER, lambda: _load_preference_profile(db, user_id)
+    )
+
+
+def _load_preference_profile(db: Session, user_id: int) -> schemas.PreferenceProfileRead:
+    # Read-only (it runs inside read_through, and inside record_outcome's
+    # transaction): users without a profile get the defaults, unsaved.
     profile = db.query(models.EmotionPreferenceProfile).filter_by(user_id=user_id).first()
     if not profile:
-        profile = models.EmotionPreferenceProfile(
+        return schemas.PreferenceProfileRead(
             user_id=user_id,
             weight_relief=0.33,
             weight_expression=0.33,
             weight_relationship=0.34,
+            updated_at=datetime.utcnow(),
         )
-        db.add(profile)
-        db.commit()
-        db.refresh(profile)
     return schemas.PreferenceProfileRead.model_validate(profile)
 
 
@@ -266,17 +349,21 @@ def update_preference_profile(
 
 
 def get_trait_profile(db: Session, user_id: int) -> schemas.TraitProfileRead:
+    return cache.read_through(cache.TRAITS, user_id, _TRAITS_ADAPTER, lambda: _load_trait_profile(db, user_id))
+
+
+def _load_trait_profile(db: Session, user_id: int) -> schemas.TraitProfileRead:
+    # Read-only like _load_preference_profile. Users without a row get the
+    # same defaults the path job fits them with.
     profile = db.query(models.EmotionTraitProfile).filter_by(user_id=user_id).first()
     if not profile:
-        profile = models.EmotionTraitProfile(
+        return schemas.TraitProfileRead(
             user_id=user_id,
-            trait_social_anxiety=5,
-            trait_crying_proneness=5,
-            trait_suppression=5,
+            trait_social_anxiety=DEFAULT_TRAIT_SOCIAL_ANXIETY,
+            trait_crying_proneness=DEFAULT_TRAIT_CRYING_PRONENESS,
+            trait_suppression=DEFAULT_TRAIT_SUPPRESSION,
+            updated_at=datetime.utcnow(),
         )
-        db.add(profile)
-        db.commit()
-        db.refresh(profile)
     return schemas.TraitProfileRead.model_validate(profile)
 
 
@@ -297,6 +384,9 @@ def update_trait_profile(
             trait_suppression=payload.trait_suppression,
         )
         db.add(profile)
+    mark_user_dirty(db, user_id)
+    enqueue_analytics_job(db, user_id)
+    cache.invalidate_on_commit(db, cache.TRAITS, [user_id])
     db.commit()
     db.refresh(profile)
     return schemas.TraitProfileRead.model_validate(profile)
@@ -308,84 +398,171 @@ def update_trait_profile(
 
 
 def get_treatment_effects_for_user(db: Session, user_id: int) -> List[schemas.TreatmentEffectRead]:
-    effects = db.query(models.EmotionTreatmentEffect).filter_by(user_id=user_id).all()
-    return [schemas.TreatmentEffectRead.model_validate(eff) for eff in effects]
+    def load() -> List[schemas.TreatmentEffectRead]:
+        effects = db.query(models.EmotionTreatmentEffect).filter_by(user_id=user_id).all()
+        return [schemas.TreatmentEffectRead.model_validate(eff) for eff in effects]
 
+    return cache.read_through(cache.EFFECTS, user_id, _EFFECTS_ADAPTER, load)
 
-def get_timeline_points(db: Session, user_id: int) -> schemas.TimelineResponse:
-    episodes = (
-        db.query(models.EmotionEpisode)
-        .join(models.EmotionOutcome)
-        .filter(models.EmotionEpisode.user_id == user_id)
-        .order_by(models.EmotionEpisode.scheduled_at.asc())
-        .all()
+
+def get_personal_effects(db: Session, user_id: int) -> CompiledEffects:
+    """
+    The user's ATEs compiled for `AnalyticsEngine` predictions; empty for
+    users without estimates, which the engine treats as the population model.
+    """
+    def load() -> CompiledEffects:
+        rows = db.execute(
+            select(
+                models.EmotionTreatmentEffect.treatment_key,
+                models.EmotionTreatmentEffect.outcome_name,
+                models.EmotionTreatmentEffect.ate,
+            ).where(models.EmotionTreatmentEffect.user_id == user_id)
+        ).all()
+        return AnalyticsEngine.compile_effects(rows)
+
+    return cache.read_through(cache.PREDICTOR, user_id, _PREDICTOR_ADAPTER, load)
+
+
+def get_bandit_posterior(db: Session, user_id: int) -> BanditPosterior:
+    """The user's plan bandit posterior (the prior for users without outcomes)."""
+    def load() -> BanditPosterior:
+        record = db.query(models.EmotionBanditPosterior).filter_by(user_id=user_id).one_or_none()
+        return posterior_from_record(record)
+
+    return cache.read_through(cache.BANDIT, user_id, _BANDIT_ADAPTER, load)
+
+
+def get_timeline_points(
+    db: Session,
+    user_id: int,
+    scheduled_from: Optional[datetime] = None,
+    scheduled_to: Optional[datetime] = None,
+    max_points: Optional[int] = None,
+) -> schemas.TimelineResponse:
+    """
+    Completed episodes in time order, optionally windowed to
+    [scheduled_from, scheduled_to) and LTTB-downsampled to `max_points`.
+
+    One column-only statement; the `#n` label is the episode's position in
+    the user's full history, so it stays stable under windowing.
+    """
+    episode = models.EmotionEpisode.__table__
+    outcome = models.EmotionOutcome.__table__
+    history = (
+        select(
+            episode.c.id,
+            episode.c.scenario_type,
+            episode.c.scheduled_at,
+            outcome.c.crying_level,
+            outcome.c.expression_score,
+            outcome.c.relationship_impact,
+            func.row_number().over(order_by=(episode.c.scheduled_at, episode.c.id)).label("position"),
+        )
+        .join(outcome, outcome.c.episode_id == episode.c.id)
+        .where(episode.c.user_id == user_id)
+        .subquery()
     )
-    points = []
-    for idx, ep in enumerate(episodes, start=1):
-        points.append(
-            schemas.TimelinePoint(
-                episode_id=ep.id,
-                label=f"{ep.scenario_type.value} #{idx}",
-                crying_level=ep.outcome.crying_level,
-                expression_score=ep.outcome.expression_score,
-                relationship_impact=ep.outcome.relationship_impact,
-            )
+    stmt = select(history).order_by(history.c.scheduled_at, history.c.id)
+    if scheduled_from:
+        stmt = stmt.where(history.c.scheduled_at >= scheduled_from)
+    if scheduled_to:
+        stmt = stmt.where(history.c.scheduled_at < scheduled_to)
+    rows = db.execute(stmt).all()
+
+    total = len(rows)
+    if max_points and total > max_points:
+        x = np.array([row.scheduled_at.timestamp() for row in rows])
+        ys = np.array([(row.crying_level, row.expression_score, row.relationship_impact) for row in rows])
+        rows = [rows[i] for i in lttb_indices(x, ys, max_points)]
+
+    points = [
+        schemas.TimelinePoint(
+            episode_id=row.id,
+            label=f"{row.scenario_type.value} #{row.position}",
+            crying_level=row.crying_level,
+            expression_score=row.expression_score,
+            relationship_impact=row.relationship_impact,
         )
-    return schemas.TimelineResponse(points=points)
+        for row in rows
+    ]
+    return schemas.TimelineResponse(points=points, total_points=total)
 
 
 def get_dashboard_summary(db: Session, user_id: int) -> schemas.DashboardSummary:
-    total = db.query(func.count(models.EmotionEpisode.id)).filter_by(user_id=user_id).scalar() or 0
-    total_completed = (
-        db.query(func.count(models.EmotionEpisode.id))
-        .filter_by(user_id=user_id, status=models.EpisodeStatus.COMPLETED)
-        .scalar()
-        or 0
-    )
-    total_planned = (
-        db.query(func.count(models.EmotionEpisode.id))
-        .filter_by(user_id=user_id, status=models.EpisodeStatus.PLANNED)
-        .scalar()
-        or 0
+    rollup = db.execute(
+        select(models.EmotionUserRollup.__table__).where(models.EmotionUserRollup.user_id == user_id)
+    ).mappings().first()
+    if rollup is None:
+        return _dashboard_summary_from_episodes(db, user_id)
+
+    n_outcomes = rollup["outcomes_count"]
+    return schemas.DashboardSummary(
+        by_preparation=[
+            {"template_key": key, "count": rollup[PREP_COLUMNS[key]]} for key in PREPARATION_TEMPLATE_KEYS
+        ],
+        total_episodes=rollup["episodes_total"],
+        total_completed=rollup["episodes_completed"],
+        total_planned=rollup["episodes_planned"],
+        outcome_means={field: rollup[f"sum_{field}"] / n_outcomes for field in OUTCOME_FIELDS} if n_outcomes else {},
     )
 
-    by_prep = []
-    for key in PREPARATION_TEMPLATE_KEYS:
-        count = (
-            db.query(func.count(models.EmotionPreparationExecution.id))
-            .join(models.EmotionEpisode, models.EmotionPreparationExecution.episode_id == models.EmotionEpisode.id)
-            .filter(
-                models.EmotionEpisode.user_id == user_id,
-                models.EmotionPreparationExecution.template_key == key,
-            )
-            .scalar()
-            or 0
+
+def _dashboard_summary_from_episodes(db: Session, user_id: int) -> schemas.DashboardSummary:
+    """Grouped-query fallback for users without a rollup row yet."""
+    Episode = models.EmotionEpisode
+    Outcome = models.EmotionOutcome
+    total, total_completed, total_planned, n_outcomes, *sums = (
+        db.query(
+            func.count(Episode.id),
+            func.coalesce(func.sum(case((Episode.status == models.EpisodeStatus.COMPLETED, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((Episode.status == models.EpisodeStatus.PLANNED, 1), else_=0)), 0),
+            func.count(Outcome.episode_id),
+            *[func.sum(getattr(Outcome, field)) for field in OUTCOME_FIELDS],
         )
-        by_prep.append({"template_key": key, "count": count})
+        .outerjoin(Outcome, Outcome.episode_id == Episode.id)
+        .filter(Episode.user_id == user_id)
+        .one()
+    )
+
+    prep_counts = dict(
+        db.query(models.EmotionPreparationExecution.template_key, func.count(models.EmotionPreparationExecution.id))
+        .join(Episode, models.EmotionPreparationExecution.episode_id == Episode.id)
+        .filter(Episode.user_id == user_id)
+        .group_by(models.EmotionPreparationExecution.template_key)
+        .all()
+    )
+    by_prep = [{"template_key": key, "count": prep_counts.get(key, 0)} for key in PREPARATION_TEMPLATE_KEYS]
 
     return schemas.DashboardSummary(
         by_preparation=by_prep,
         total_episodes=total,
         total_completed=total_completed,
         total_planned=total_planned,
+        outcome_means={field: value / n_outcomes for field, value in zip(OUTCOME_FIELDS, sums)} if n_outcomes else {},
     )
 
 
 def get_path_summary(db: Session, user_id: int) -> schemas.PathSummaryRead:
-    summary = db.query(models.EmotionPathSummary).filter_by(user_id=user_id).first()
-    if not summary:
-        raise ValueError("Path summary not available yet")
-    return schemas.PathSummaryRead.model_validate(summary)
+    def load() -> schemas.PathSummaryRead:
+        summary = db.query(models.EmotionPathSummary).filter_by(user_id=user_id).first()
+        if not summary:
+            raise ValueError("Path summary not available yet")
+        return schemas.PathSummaryRead.model_validate(summary)
+
+    return cache.read_through(cache.PATH_SUMMARY, user_id, _PATH_SUMMARY_ADAPTER, load)
 
 
 def get_partner_path_summaries(db: Session, user_id: int) -> List[schemas.PartnerPathSummary]:
-    rows = (
-        db.query(models.EmotionPathPartnerSummary)
-        .filter_by(user_id=user_id)
-        .order_by(models.EmotionPathPartnerSummary.n_episodes.desc())
-        .all()
-    )
-    return [schemas.PartnerPathSummary.model_validate(r) for r in rows]
+    def load() -> List[schemas.PartnerPathSummary]:
+        rows = (
+            db.query(models.EmotionPathPartnerSummary)
+            .filter_by(user_id=user_id)
+            .order_by(models.EmotionPathPartnerSummary.n_episodes.desc())
+            .all()
+        )
+        return [schemas.PartnerPathSummary.model_validate(r) for r in rows]
+
+    return cache.read_through(cache.PARTNER_PATHS, user_id, _PARTNER_PATHS_ADAPTER, load)
 
 
 def _episode_mean_stats(db: Session, user_id: int) -> dict[str, float]:
@@ -404,21 +581,165 @@ def _episode_mean_stats(db: Session, user_id: int) -> dict[str, float]:
     return {"E": mean_eval, "S": mean_stress, "R": mean_suppress}
 
 
-def _preparation_contribution(db: Session, user_id: int, episode: models.EmotionEpisode) -> float:
+@dataclass(frozen=True)
+class DecompositionContext:
+    """Per-user inputs shared by every episode decomposition."""
+
+    mean_eval: float
+    mean_stress: float
+    mean_suppress: float
+    beta_eval: float
+    beta_stress: float
+    beta_suppress: float
+    contrib_trait: float
+    baseline: float
+    crying_effects: dict[str, float]
+
+
+_DECOMPOSITION_ADAPTER = TypeAdapter(DecompositionContext)
+
+
+def _load_decomposition_context(db: Session, user_id: int) -> DecompositionContext:
+    summary = db.query(models.EmotionPathSummary).filter_by(user_id=user_id).first()
+    if not summary:
+        raise ValueError("Path summary not available")
+    if summary.baseline_crying is not None and summary.crying_effects is not None:
+        # Materialised by the path job; no aggregation needed.
+        return DecompositionContext(
+            mean_eval=summary.mean_eval_threat,
+            mean_stress=summary.mean_pre_anxiety,
+            mean_suppress=summary.mean_suppress_intent,
+            beta_eval=summary.beta_eval_to_cry or 0.0,
+            beta_stress=summary.beta_stress_to_cry or 0.0,
+            beta_suppress=summary.beta_suppress_to_cry or 0.0,
+            contrib_trait=summary.contrib_trait,
+            baseline=summary.baseline_crying,
+            crying_effects=json.loads(summary.crying_effects),
+        )
+    return _live_decomposition_context(db, summary)
+
+
+def _live_decomposition_context(db: Session, summary: models.EmotionPathSummary) -> DecompositionContext:
+    """Fallback for summaries the path job has not materialised yet."""
+    user_id = summary.user_id
+    trait_profile = db.query(models.EmotionTraitProfile).filter_by(user_id=user_id).first()
+    trait_value = trait_profile.trait_crying_proneness if trait_profile else DEFAULT_TRAIT_CRYING_PRONENESS
+    stats = _episode_mean_stats(db, user_id)
     effects = (
-        db.query(models.EmotionTreatmentEffect)
+        db.query(models.EmotionTreatmentEffect.treatment_key, models.EmotionTreatmentEffect.ate)
         .filter_by(user_id=user_id, outcome_name="crying_level")
         .all()
     )
-    effect_map = {eff.treatment_key: eff.ate for eff in effects}
-    total = 0.0
-    for prep in episode.preparations:
-        intensity = prep.actual_intensity or prep.planned_intensity or 0
-        ate = effect_map.get(prep.template_key)
-        if ate is None:
-            continue
-        total += ate * (intensity / 10.0)
-    return total
+    coefficients = {
+        key: getattr(summary, key)
+        for key in ("intercept", "beta_eval_to_cry", "beta_stress_to_cry", "beta_suppress_to_cry", "beta_trait_to_cry")
+    }
+    baseline = decomposition_baseline(coefficients, (stats["E"], stats["S"], stats["R"]), trait_value)
+    return DecompositionContext(
+        mean_eval=stats["E"],
+        mean_stress=stats["S"],
+        mean_suppress=stats["R"],
+        beta_eval=summary.beta_eval_to_cry or 0.0,
+        beta_stress=summary.beta_stress_to_cry or 0.0,
+        beta_suppress=summary.beta_suppress_to_cry or 0.0,
+        contrib_trait=baseline["contrib_trait"],
+        baseline=baseline["baseline_crying"],
+        crying_effects=dict(effects),
+    )
+
+
+def _decomposition_context(db: Session, user_id: int) -> DecompositionContext:
+    """
+    Cached per-user context. Its inputs change through user writes
+    (`mark_user_dirty`) or through the path summary (point-estimate
+    refreshes and `refresh_decomposition_baselines`, which every job run
+    that writes effects or paths calls); each invalidates the entry on commit.
+    """
+    return cache.read_through(
+        cache.DECOMPOSITION, user_id, _DECOMPOSITION_ADAPTER, lambda: _load_decomposition_context(db, user_id)
+    )
+
+
+def _or_mean(values: np.ndarray, mean: float) -> np.ndarray:
+    """Vector form of `value or mean` (None and 0 both fall back to the mean)."""
+    return np.where(np.isnan(values) | (values == 0), mean, values)
+
+
+def decompose_episodes(
+    db: Session,
+    user_id: int,
+    episode_ids: Optional[List[int]] = None,
+) -> List[schemas.EpisodeDecompositionRead]:
+    """
+    Decompose many episodes (default: all with an outcome) in three queries
+    plus the cached per-user context; contributions are computed as arrays.
+    Episodes without an outcome or not owned by the user are skipped.
+    """
+    context = _decomposition_context(db, user_id)
+    episode = models.EmotionEpisode.__table__
+    outcome = models.EmotionOutcome.__table__
+    prep = models.EmotionPreparationExecution.__table__
+
+    stmt = (
+        select(
+            episode.c.id,
+            episode.c.eval_threat_level,
+            episode.c.pre_anxiety,
+            episode.c.suppress_intent_level,
+            outcome.c.crying_level,
+        )
+        .join(outcome, outcome.c.episode_id == episode.c.id)
+        .where(episode.c.user_id == user_id)
+        .order_by(episode.c.scheduled_at, episode.c.id)
+    )
+    if episode_ids is not None:
+        stmt = stmt.where(episode.c.id.in_(episode_ids))
+    rows = db.execute(stmt).all()
+    if not rows:
+        return []
+
+    ids, E, S, R, observed = (np.array(col, dtype=float) for col in zip(*rows))
+    contrib_eval = context.beta_eval * (_or_mean(E, context.mean_eval) - context.mean_eval)
+    contrib_stress = context.beta_stress * (_or_mean(S, context.mean_stress) - context.mean_stress)
+    contrib_suppress = context.beta_suppress * (_or_mean(R, context.mean_suppress) - context.mean_suppress)
+
+    contrib_prep = np.zeros(len(rows))
+    if context.crying_effects:
+        position = {int(episode_id): i for i, episode_id in enumerate(ids)}
+        prep_rows = db.execute(
+            select(prep.c.episode_id, prep.c.template_key, prep.c.actual_intensity, prep.c.planned_intensity)
+            .join(episode, prep.c.episode_id == episode.c.id)
+            .where(
+                episode.c.user_id == user_id,
+                prep.c.template_key.in_(list(context.crying_effects)),
+                *([prep.c.episode_id.in_(episode_ids)] if episode_ids is not None else []),
+            )
+        ).all()
+        prep_rows = [r for r in prep_rows if r.episode_id in position]
+        if prep_rows:
+            index = np.array([position[r.episode_id] for r in prep_rows])
+            intensity = np.array([r.actual_intensity or r.planned_intensity or 0 for r in prep_rows], dtype=float)
+            ate = np.array([context.crying_effects[r.template_key] for r in prep_rows])
+            contrib_prep = np.bincount(index, weights=ate * intensity / 10.0, minlength=len(rows))
+
+    predicted = context.baseline + contrib_eval + contrib_stress + contrib_suppress + contrib_prep
+    return [
+        schemas.EpisodeDecompositionRead(
+            episode_id=int(ids[i]),
+            observed_crying=observed[i],
+            predicted_crying=predicted[i],
+            baseline_crying=context.baseline,
+            contrib_trait=context.contrib_trait,
+            contrib_eval_threat=contrib_eval[i],
+            contrib_stress=contrib_stress[i],
+            contrib_suppress=contrib_suppress[i],
+            contrib_preparations=contrib_prep[i],
+            beta_eval_to_cry=context.beta_eval,
+            beta_stress_to_cry=context.beta_stress,
+            beta_suppress_to_cry=context.beta_suppress,
+        )
+        for i in range(len(rows))
+    ]
 
 
 def decompose_episode(
@@ -426,56 +747,58 @@ def decompose_episode(
     user_id: int,
     episode_id: int,
 ) -> schemas.EpisodeDecompositionRead:
-    episode = (
-        db.query(models.EmotionEpisode)
+    found = (
+        db.query(models.EmotionEpisode.id, models.EmotionOutcome.episode_id)
+        .outerjoin(models.EmotionOutcome, models.EmotionOutcome.episode_id == models.EmotionEpisode.id)
         .filter(models.EmotionEpisode.id == episode_id, models.EmotionEpisode.user_id == user_id)
         .first()
     )
-    if not episode:
+    if not found:
         raise ValueError("Episode not found")
-    outcome = db.query(models.EmotionOutcome).filter_by(episode_id=episode_id).first()
-    if not outcome:
+    if found[1] is None:
         raise ValueError("Episode outcome missing")
+    return decompose_episodes(db, user_id, [episode_id])[0]
 
-    summary = db.query(models.EmotionPathSummary).filter_by(user_id=user_id).first()
-    if not summary:
-        raise ValueError("Path summary not available")
-    trait_profile = db.query(models.EmotionTraitProfile).filter_by(user_id=user_id).first()
-    trait_value = trait_profile.trait_crying_proneness if trait_profile else 5
-
-    stats = _episode_mean_stats(db, user_id)
-    intercept = summary.intercept or 0.0
-    beta_eval = summary.beta_eval_to_cry or 0.0
-    beta_stress = summary.beta_stress_to_cry or 0.0
-    beta_suppress = summary.beta_suppress_to_cry or 0.0
-    beta_trait = summary.beta_trait_to_cry or 0.0
-
-    baseline = (
-        intercept
-        + beta_eval * stats["E"]
-        + beta_stress * stats["S"]
-        + beta_suppress * stats["R"]
-        + beta_trait * trait_value
-    )
-    contrib_eval = beta_eval * ((episode.eval_threat_level or stats["E"]) - stats["E"])
-    contrib_stress = beta_stress * ((episode.pre_anxiety or stats["S"]) - stats["S"])
-    contrib_suppress = beta_suppress * ((episode.suppress_intent_level or stats["R"]) - stats["R"])
-    contrib_trait = beta_trait * trait_value
-    contrib_prep = _preparation_contribution(db, user_id, episode)
-
-    predicted = baseline + contrib_eval + contrib_stress + contrib_suppress + contrib_prep
 
-    return schemas.EpisodeDecompositionRead(
-        episode_id=episode_id,
-        observed_crying=outcome.crying_level,
-        predicted_crying=predicted,
-        baseline_crying=baseline,
-        contrib_trait=contrib_trait,
-        contrib_eval_threat=contrib_eval,
-        contrib_stress=contrib_stress,
-        contrib_suppress=contrib_suppress,
-        contrib_preparations=contrib_prep,
-        beta_eval_to_cry=beta_eval,
-        beta_stress_to_cry=beta_stress,
-        beta_suppress_to_cry=beta_suppress,
-    )
+def get_dashboard_bundle(
+    db: Session,
+    user_id: int,
+    sections: Optional[Iterable[schemas.DashboardSection]] = None,
+    timeline_max_points: Optional[int] = None,
+    episode_status: Optional[models.EpisodeStatus] = None,
+    episode_limit: int = 50,
+) -> schemas.DashboardBundle:
+    """
+    Every dashboard section (default) or only `sections`, on one session.
+    Each section runs its own reader, so a bundle costs no more queries than
+    the separate endpoints (fewer once the per-user reads are cached).
+    """
+    Section = schemas.DashboardSection
+    wanted = set(sections) if sections else set(Section)
+    if Section.DECOMPOSITIONS in wanted:
+        wanted.add(Section.EPISODES)
+    bundle = schemas.DashboardBundle()
+
+    if Section.SUMMARY in wanted:
+        bundle.summary = get_dashboard_summary(db, user_id)
+    if Section.EFFECTS in wanted:
+        bundle.effects = get_treatment_effects_for_user(db, user_id)
+    if Section.TIMELINE in wanted:
+        bundle.timeline = get_timeline_points(db, user_id, max_points=timeline_max_points)
+    if Section.PATH_SUMMARY in wanted:
+        try:
+            bundle.path_summary = get_path_summary(db, user_id)
+        except ValueError:
+            bundle.path_summary = None
+    if Section.PARTNER_PATHS in wanted:
+        bundle.partner_paths = get_partner_path_summaries(db, user_id)
+    if Section.EPISODES in wanted:
+        bundle.episodes = list_episodes(db, user_id, status=episode_status, limit=episode_limit)
+    if Section.DECOMPOSITIONS in wanted:
+        bundle.decompositions = []
+        try:
+            if bundle.episodes:
+                bundle.decompositions = decompose_episodes(db, user_id, [ep.id for ep in bundle.episodes])
+        except ValueError:
+            pass  # no path model yet
+    return bundle
@@ -0,0 +1,286 @@
+"""
+Per-user Thompson-sampling bandit over preparation plans (`emotion_bandit_posterior`).
+
+Reward model: Bayesian linear regression r ~ N(theta . phi(context, plan),
+NOISE_SCALE^2) with prior theta ~ N(0, NOISE_SCALE^2 / PRIOR_PRECISION * I).
+Each row keeps A^-1 and b for A = PRIOR_PRECISION * I + sum(phi phi^T),
+b = sum(r phi); `record_outcome` folds a new episode in with a
+Sherman-Morrison rank-1 update (O(d^2), caller commits). The reward is
+`AnalyticsEngine.calculate_total_reward` of the recorded outcome under the
+user's preference weights at that time.
+
+Context is scenario_type, the pre-state and the eval-threat / suppress-intent
+levels (DEFAULT_LEVEL when unset). Features, with levels and intensities
+scaled to 0-1: scenario one-hot, context, plan, plan^2, plan x context and
+plan x scenario (so the best plan depends on the context).
+
+Repair / backfill (existing outcomes, current preference weights):
+
+    python -m cqox.jobs.bandit               # rebuild every user
+    python -m cqox.jobs.bandit --user 42     # rebuild one user
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+from dataclasses import dataclass
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from cqox import cache
+from cqox.db import bulk_upsert, session_scope
+from cqox.emotion import models
+from cqox.emotion.analytics import PREPARATION_KEYS, AnalyticsEngine
+
+MODEL_VERSION = "lin_ts_v1"
+PRIOR_PRECISION = 1.0
+NOISE_SCALE = 0.2
+DEFAULT_LEVEL = 5
+# Preference weights of a user without a profile (same as the service default).
+DEFAULT_WEIGHTS = {"relief": 0.33, "expression": 0.33, "relationship": 0.34}
+
+SCENARIOS = list(models.ScenarioType)
+CONTEXT_FIELDS = ["pre_anxiety", "pre_crying_risk", "pre_speech_block_risk", "eval_threat_level", "suppress_intent_level"]
+
+_N_SCENARIOS = len(SCENARIOS)
+_N_CONTEXT = len(CONTEXT_FIELDS)
+_N_PLAN = len(PREPARATION_KEYS)
+# Feature layout: [scenario | context | plan | plan^2 | plan x context | plan x scenario]
+_CONTEXT = slice(_N_SCENARIOS, _N_SCENARIOS + _N_CONTEXT)
+_PLAN = slice(_CONTEXT.stop, _CONTEXT.stop + _N_PLAN)
+_PLAN_SQ = slice(_PLAN.stop, _PLAN.stop + _N_PLAN)
+_PLAN_X_CONTEXT = slice(_PLAN_SQ.stop, _PLAN_SQ.stop + _N_PLAN * _N_CONTEXT)
+_PLAN_X_SCENARIO = slice(_PLAN_X_CONTEXT.stop, _PLAN_X_CONTEXT.stop + _N_PLAN * _N_SCENARIOS)
+N_FEATURES = _PLAN_X_SCENARIO.stop
+
+
+@dataclass
+class BanditPosterior:
+    """
+    Posterior mean and a factor L of its covariance (L L^T). L is kept as
+    base64 float32 bytes (ample for sampling) so a cached posterior decodes
+    without parsing d^2 JSON numbers.
+    """
+
+    n_updates: int
+    mean: List[float]
+    cov_factor: str
+
+    @classmethod
+    def from_arrays(cls, n_updates: int, mean: np.ndarray, factor: np.ndarray) -> "BanditPosterior":
+        raw = np.ascontiguousarray(factor, dtype=np.float32).tobytes()
+        return cls(n_updates=n_updates, mean=mean.tolist(), cov_factor=base64.b64encode(raw).decode())
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        mean = np.array(self.mean)
+        factor = np.frombuffer(base64.b64decode(self.cov_factor), dtype=np.float32).reshape(len(mean), len(mean))
+        return mean, factor
+
+
+def context_vector(
+    pre_anxiety: int,
+    pre_crying_risk: int,
+    pre_speech_block_risk: int,
+    eval_threat_level: Optional[int],
+    suppress_intent_level: Optional[int],
+) -> np.ndarray:
+    levels = [pre_anxiety, pre_crying_risk, pre_speech_block_risk, eval_threat_level, suppress_intent_level]
+    return np.array([DEFAULT_LEVEL if level is None else level for level in levels], dtype=float) / 10.0
+
+
+def features(scenario: models.ScenarioType, context: np.ndarray, plans: np.ndarray) -> np.ndarray:
+    """(m, N_FEATURES) feature rows for intensity `plans` (m, 5) in one context."""
+    x = np.asarray(plans, dtype=float).reshape(-1, _N_PLAN) / 10.0
+    m = len(x)
+    onehot = np.zeros(_N_SCENARIOS)
+    onehot[SCENARIOS.index(models.ScenarioType(scenario))] = 1.0
+    return np.hstack(
+        [
+            np.broadcast_to(onehot, (m, _N_SCENARIOS)),
+            np.broadcast_to(context, (m, _N_CONTEXT)),
+            x,
+            x * x,
+            (x[:, :, None] * context).reshape(m, -1),
+            (x[:, :, None] * onehot).reshape(m, -1),
+        ]
+    )
+
+
+def plan_weights(
+    theta: np.ndarray, scenario: models.ScenarioType, context: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    (linear, quadratic, constant) with features(scenario, context, P) @ theta
+    == (P / 10) @ linear + (P / 10)^2 @ quadratic + constant, so scoring
+    many plans never builds their feature rows.
+    """
+    s = SCENARIOS.index(models.ScenarioType(scenario))
+    constant = float(theta[s] + context @ theta[_CONTEXT])
+    linear = (
+        theta[_PLAN]
+        + theta[_PLAN_X_CONTEXT].reshape(_N_PLAN, _N_CONTEXT) @ context
+        + theta[_PLAN_X_SCENARIO].reshape(_N_PLAN, _N_SCENARIOS)[:, s]
+    )
+    return linear, theta[_PLAN_SQ], constant
+
+
+def prior_posterior() -> BanditPosterior:
+    factor = np.eye(N_FEATURES) * NOISE_SCALE / np.sqrt(PRIOR_PRECISION)
+    return BanditPosterior.from_arrays(0, np.zeros(N_FEATURES), factor)
+
+
+def posterior_from_record(record: Optional[models.EmotionBanditPosterior]) -> BanditPosterior:
+    if record is None or record.model_version != MODEL_VERSION:
+        return prior_posterior()
+    a_inv = np.array(json.loads(record.a_inv))
+    b = np.array(json.loads(record.b))
+    cov = NOISE_SCALE**2 * (a_inv + a_inv.T) / 2
+    try:
+        factor = np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # Rounding from many rank-1 updates; clip tiny negative eigenvalues.
+        values, vectors = np.linalg.eigh(cov)
+        factor = vectors * np.sqrt(np.clip(values, 0, None))
+    return BanditPosterior.from_arrays(record.n_updates, a_inv @ b, factor)
+
+
+def sherman_morrison(a_inv: np.ndarray, b: np.ndarray, x: np.ndarray, reward: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Posterior statistics after one observation (x, reward): (A + x x^T)^-1 and b + reward x."""
+    a_inv_x = a_inv @ x
+    a_inv = a_inv - np.outer(a_inv_x, a_inv_x) / (1.0 + x @ a_inv_x)
+    return a_inv, b + reward * x
+
+
+def episode_reward(pre_anxiety: int, outcome: models.EmotionOutcome, weights: Dict[str, float]) -> float:
+    return float(
+        AnalyticsEngine().calculate_total_reward(
+            predicted_stress_after=outcome.stress_after,
+            predicted_expression=outcome.expression_score,
+            predicted_relationship=outcome.relationship_impact,
+            pre_anxiety=float(pre_anxiety),
+            weight_relief=weights["relief"],
+            weight_expression=weights["expression"],
+            weight_relationship=weights["relationship"],
+        )
+    )
+
+
+def update_bandit_on_outcome(
+    session: Session,
+    episode: models.EmotionEpisode,
+    outcome: models.EmotionOutcome,
+    weights: Dict[str, float],
+) -> None:
+    """Fold one completed episode into its user's posterior (caller commits)."""
+    intensities: Dict[str, int] = {}
+    for prep in episode.preparations:
+        value = prep.actual_intensity if prep.actual_intensity is not None else prep.planned_intensity
+        intensities[prep.template_key] = max(intensities.get(prep.template_key, 0), value or 0)
+    context = context_vector(*(getattr(episode, field) for field in CONTEXT_FIELDS))
+    x = features(episode.scenario_type, context, np.array([[intensities.get(key, 0) for key in PREPARATION_KEYS]]))[0]
+
+    # Seed a placeholder row (empty version, so it reads as "start from the
+    # prior") before locking: FOR UPDATE cannot lock a row that is missing.
+    bulk_upsert(
+        session,
+        models.EmotionBanditPosterior,
+        [{"user_id": episode.user_id, "model_version": "", "n_updates": 0, "a_inv": "", "b": ""}],
+        ["user_id"],
+        [],
+    )
+    record = (
+        session.query(models.EmotionBanditPosterior)
+        .filter_by(user_id=episode.user_id)
+        .with_for_update()
+        .one()
+    )
+    if record.model_version != MODEL_VERSION:
+        # New user or an older feature layout: start again from the prior.
+        a_inv, b, n_updates = np.eye(N_FEATURES) / PRIOR_PRECISION, np.zeros(N_FEATURES), 0
+    else:
+        a_inv, b, n_updates = np.array(json.loads(record.a_inv)), np.array(json.loads(record.b)), record.n_updates
+    a_inv, b = sherman_morrison(a_inv, b, x, episode_reward(episode.pre_anxiety, outcome, weights))
+    record.model_version = MODEL_VERSION
+    record.n_updates = n_updates + 1
+    record.a_inv = json.dumps(a_inv.tolist())
+    record.b = json.dumps(b.tolist())
+    cache.invalidate_on_commit(session, cache.BANDIT, [episode.user_id])
+
+
+def rebuild_bandit_posteriors(session: Session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute posteriors from every completed episode; returns the number of users."""
+    episode = models.EmotionEpisode.__table__
+    outcome = models.EmotionOutcome.__table__
+    prep = models.EmotionPreparationExecution.__table__
+    profile = models.EmotionPreferenceProfile.__table__
+    chosen = func.coalesce(prep.c.actual_intensity, prep.c.planned_intensity)
+
+    ids = list(user_ids) if user_ids is not None else None
+    stmt = (
+        select(
+            episode.c.user_id,
+            episode.c.scenario_type,
+            *[episode.c[field] for field in CONTEXT_FIELDS],
+            outcome.c.stress_after,
+            outcome.c.expression_score,
+            outcome.c.relationship_impact,
+            *[func.coalesce(func.max(case((prep.c.template_key == key, chosen))), 0) for key in PREPARATION_KEYS],
+        )
+        .join(outcome, outcome.c.episode_id == episode.c.id)
+        .outerjoin(prep, prep.c.episode_id == episode.c.id)
+        .where(episode.c.status == models.EpisodeStatus.COMPLETED)
+        .group_by(episode.c.id, outcome.c.episode_id)
+        .order_by(episode.c.user_id, episode.c.id)
+    )
+    weight_stmt = select(
+        profile.c.user_id, profile.c.weight_relief, profile.c.weight_expression, profile.c.weight_relationship
+    )
+    if ids is not None:
+        stmt = stmt.where(episode.c.user_id.in_(ids))
+        weight_stmt = weight_stmt.where(profile.c.user_id.in_(ids))
+    weights = {
+        user_id: {"relief": float(relief), "expression": float(expression), "relationship": float(relationship)}
+        for user_id, relief, expression, relationship in session.execute(weight_stmt)
+    }
+
+    per_user: Dict[int, Tuple[List[np.ndarray], List[float]]] = {}
+    engine = AnalyticsEngine()
+    for user_id, scenario, *values in session.execute(stmt):
+        levels, (stress_after, expression, relationship), plan = values[:5], values[5:8], values[8:]
+        w = weights.get(user_id, DEFAULT_WEIGHTS)
+        reward = engine.calculate_total_reward(
+            stress_after, expression, relationship, float(levels[0]), w["relief"], w["expression"], w["relationship"]
+        )
+        xs, rewards = per_user.setdefault(user_id, ([], []))
+        xs.append(features(scenario, context_vector(*levels), np.array([plan]))[0])
+        rewards.append(float(reward))
+
+    rows = []
+    for user_id, (xs, rewards) in per_user.items():
+        X = np.array(xs)
+        a_inv = np.linalg.inv(PRIOR_PRECISION * np.eye(N_FEATURES) + X.T @ X)
+        rows.append(
+            {
+                "user_id": user_id,
+                "model_version": MODEL_VERSION,
+                "n_updates": len(rewards),
+                "a_inv": json.dumps(a_inv.tolist()),
+                "b": json.dumps((X.T @ np.array(rewards)).tolist()),
+            }
+        )
+    bulk_upsert(session, models.EmotionBanditPosterior, rows, conflict_cols=["user_id"])
+    cache.invalidate_on_commit(session, cache.BANDIT, ids)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild emotion_bandit_posterior from completed episodes")
+    parser.add_argument("--user", type=int, action="append", help="rebuild only this user (repeatable)")
+    args = parser.parse_args()
+    with session_scope() as session:
+        n = rebuild_bandit_posteriors(session, args.user)
+    print(f"Rebuilt bandit posteriors for {n} users")
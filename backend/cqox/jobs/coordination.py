@@ -0,0 +1,203 @@
+"""
+Cross-process coordination for the analytics estimators.
+
+Every process that wants the estimators to run goes through
+`run_analytics_jobs`. It first records a rerun request, then tries to take a
+cross-process lock:
+
+- Postgres: a session-level `pg_try_advisory_lock`, released automatically
+  if the holder's connection dies.
+- SQLite / others: the `emotion_job_lock` row, claimed with a conditional
+  UPDATE and protected by a lease in case the holder crashes.
+
+Whoever holds the lock keeps consuming rerun requests until none are left,
+so a trigger that arrives mid-run costs one extra incremental pass rather
+than a duplicate concurrent run. Because requests are recorded *before* the
+lock attempt and re-checked *after* release, no request can be lost.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import os
+import socket
+from typing import Callable, Optional
+
+from sqlalchemy import case, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from cqox.db import bulk_upsert, engine as default_engine
+from cqox.emotion import models
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = "analytics"
+LEASE = timedelta(hours=2)
+
+RERUN_NONE = 0
+RERUN_INCREMENTAL = 1
+RERUN_FULL = 2
+
+_lock_table = models.EmotionJobLock.__table__
+
+
+def _owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _ensure_lock_row(engine: Engine, name: str) -> None:
+    with Session(engine) as session:
+        bulk_upsert(session, models.EmotionJobLock, [{"name": name, "rerun_requested": RERUN_NONE}], ["name"], update_cols=[])
+        session.commit()
+
+
+def request_rerun(engine: Engine, name: str, level: int) -> None:
+    _ensure_lock_row(engine, name)
+    current = _lock_table.c.rerun_requested
+    with engine.begin() as conn:
+        conn.execute(
+            update(_lock_table)
+            .where(_lock_table.c.name == name)
+            .values(rerun_requested=case((current < level, level), else_=current))
+        )
+
+
+def _take_rerun_request(engine: Engine, name: str) -> int:
+    """Atomically read and clear the pending rerun level."""
+    c = _lock_table.c
+    while True:
+        with engine.begin() as conn:
+            level = conn.scalar(select(c.rerun_requested).where(c.name == name)) or RERUN_NONE
+            if level == RERUN_NONE:
+                return RERUN_NONE
+            # Compare-and-swap: retry if a higher-level request landed meanwhile.
+            result = conn.execute(
+                update(_lock_table).where(c.name == name, c.rerun_requested == level).values(rerun_requested=RERUN_NONE)
+            )
+        if result.rowcount == 1:
+            return level
+
+
+def _rerun_pending(engine: Engine, name: str) -> bool:
+    with engine.connect() as conn:
+        return bool(conn.scalar(select(_lock_table.c.rerun_requested).where(_lock_table.c.name == name)))
+
+
+class _AdvisoryLock:
+    """Postgres session advisory lock held on a dedicated connection."""
+
+    def __init__(self, engine: Engine, name: str):
+        self.engine = engine
+        self.key = int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], "big", signed=True)
+        self.conn: Optional[Connection] = None
+
+    def acquire(self) -> bool:
+        conn = self.engine.connect()
+        if conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}):
+            conn.commit()
+            self.conn = conn
+            return True
+        conn.close()
+        return False
+
+    def renew(self) -> None:
+        pass
+
+    def release(self) -> None:
+        if self.conn is None:
+            return
+        try:
+            self.conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            self.conn.commit()
+        finally:
+            self.conn.close()
+            self.conn = None
+
+
+class _LeaseLock:
+    """Lock row with an owner and lease, for backends without advisory locks."""
+
+    def __init__(self, engine: Engine, name: str):
+        self.engine = engine
+        self.name = name
+        self.owner = _owner_id()
+
+    def acquire(self) -> bool:
+        now = datetime.utcnow()
+        c = _lock_table.c
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(_lock_table)
+                .where(c.name == self.name, (c.owner.is_(None)) | (c.lease_expires_at < now))
+                .values(owner=self.owner, lease_expires_at=now + LEASE)
+            )
+        return result.rowcount == 1
+
+    def renew(self) -> None:
+        c = _lock_table.c
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(_lock_table)
+                .where(c.name == self.name, c.owner == self.owner)
+                .values(lease_expires_at=datetime.utcnow() + LEASE)
+            )
+
+    def release(self) -> None:
+        c = _lock_table.c
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(_lock_table)
+                .where(c.name == self.name, c.owner == self.owner)
+                .values(owner=None, lease_expires_at=None)
+            )
+
+
+def _make_lock(engine: Engine, name: str):
+    if engine.dialect.name == "postgresql":
+        return _AdvisoryLock(engine, name)
+    return _LeaseLock(engine, name)
+
+
+def _run_estimators(full_rebuild: bool) -> None:
+    from cqox.jobs.estimate_effects import estimate_and_persist_effects
+    from cqox.jobs.estimate_paths import estimate_and_persist_paths
+
+    estimate_and_persist_effects(full_rebuild=full_rebuild)
+    estimate_and_persist_paths(full_rebuild=full_rebuild)
+
+
+def run_analytics_jobs(
+    full_rebuild: bool = False,
+    engine: Optional[Engine] = None,
+    runner: Callable[[bool], None] = _run_estimators,
+    name: str = LOCK_NAME,
+) -> bool:
+    """
+    Run the estimators unless another process already is.
+
+    Returns True if this call ran them; False means the current holder was
+    asked to do another pass and will pick the request up.
+    """
+    engine = engine or default_engine
+    request_rerun(engine, name, RERUN_FULL if full_rebuild else RERUN_INCREMENTAL)
+    lock = _make_lock(engine, name)
+    ran = False
+    while lock.acquire():
+        try:
+            while True:
+                level = _take_rerun_request(engine, name)
+                if level == RERUN_NONE:
+                    break
+                lock.renew()
+                runner(level == RERUN_FULL)
+                ran = True
+        finally:
+            lock.release()
+        # A request that lost the lock race just before release is ours to run.
+        if not _rerun_pending(engine, name):
+            break
+    if not ran:
+        logger.info("Analytics run already in progress elsewhere; rerun requested")
+    return ran
@@ -6,17 +6,34 @@ matching the outline from CQOx_gen 拡張案④.
 """
 from __future__ import annotations
 
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import math
-from typing import Dict, List
+import multiprocessing
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.linear_model import LinearRegression
+from sqlalchemy import Select, case, func, select
 from sqlalchemy.orm import Session
 
-from cqox.db import session_scope
+from cqox import cache
+from cqox.config import get_settings
+from cqox.db import bulk_upsert, session_scope
 from cqox.emotion import models
+from cqox.jobs.state import (
+    JOB_EFFECTS,
+    data_versions,
+    dirty_user_ids,
+    frame_fingerprint,
+    mark_users_estimated,
+    store_fingerprints,
+    stored_fingerprints,
+)
+from cqox.metrics import JobRun, StageClock
 
 TREATMENTS = [
     "journaling_10m",
@@ -35,75 +52,134 @@ OUTCOMES = [
 
 MODEL_VERSION = "v1.0-dml"
 
+# Rows fetched per round trip in streaming mode.
+STREAM_BATCH_SIZE = 5000
 
-def load_episode_dataframe(db: Session) -> pd.DataFrame:
-    """Load completed episodes with outcomes + preparations into a flat DF."""
-    episodes = (
-        db.query(models.EmotionEpisode)
-        .join(models.EmotionOutcome)
-        .filter(models.EmotionEpisode.status == models.EpisodeStatus.COMPLETED)
-        .all()
+
+EPISODE_COLUMNS = [
+    "episode_id",
+    "user_id",
+    "scenario_type",
+    "topic",
+    "location",
+    "pre_anxiety",
+    "pre_crying_risk",
+    "pre_speech_block_risk",
+    *OUTCOMES,
+    *[f"prep_{key}_intensity" for key in TREATMENTS],
+]
+
+_SCENARIO_VALUES = {scenario: scenario.value for scenario in models.ScenarioType}
+
+
+def frame_from_rows(columns: List[str], rows: List[Tuple]) -> pd.DataFrame:
+    """Build a DataFrame from result tuples column-wise (no per-row dicts)."""
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(dict(zip(columns, zip(*rows))), columns=columns)
+
+
+def episode_select(user_ids: Optional[Iterable[int]] = None) -> Select:
+    """
+    Single Core SELECT of completed episodes, their outcome and the
+    preparation intensities pivoted into one column per treatment.
+
+    The intensity is the actual one when recorded, else the planned one;
+    duplicate entries for a template collapse to their maximum.
+    """
+    episode = models.EmotionEpisode.__table__
+    outcome = models.EmotionOutcome.__table__
+    prep = models.EmotionPreparationExecution.__table__
+    chosen = func.coalesce(prep.c.actual_intensity, prep.c.planned_intensity)
+    stmt = (
+        select(
+            episode.c.id.label("episode_id"),
+            episode.c.user_id,
+            episode.c.scenario_type,
+            episode.c.topic,
+            episode.c.location,
+            episode.c.pre_anxiety,
+            episode.c.pre_crying_risk,
+            episode.c.pre_speech_block_risk,
+            *[outcome.c[name] for name in OUTCOMES],
+            *[
+                func.coalesce(func.max(case((prep.c.template_key == key, chosen))), 0).label(f"prep_{key}_intensity")
+                for key in TREATMENTS
+            ],
+        )
+        .join(outcome, outcome.c.episode_id == episode.c.id)
+        .outerjoin(prep, prep.c.episode_id == episode.c.id)
+        .where(episode.c.status == models.EpisodeStatus.COMPLETED)
+        .group_by(episode.c.id, outcome.c.episode_id)
+        .order_by(episode.c.user_id, episode.c.id)
     )
-    rows: List[Dict] = []
-
-    for ep in episodes:
-        base = {
-            "episode_id": ep.id,
-            "user_id": ep.user_id,
-            "scenario_type": ep.scenario_type.value,
-            "topic": ep.topic,
-            "location": ep.location,
-            "pre_anxiety": ep.pre_anxiety,
-            "pre_crying_risk": ep.pre_crying_risk,
-            "pre_speech_block_risk": ep.pre_speech_block_risk,
-            "crying_level": ep.outcome.crying_level,
-            "stress_after": ep.outcome.stress_after,
-            "expression_score": ep.outcome.expression_score,
-            "relationship_impact": ep.outcome.relationship_impact,
-        }
-        intensity = {f"prep_{key}_intensity": 0 for key in TREATMENTS}
-        for prep in ep.preparations:
-            if prep.template_key in TREATMENTS:
-                chosen = prep.actual_intensity if prep.actual_intensity is not None else prep.planned_intensity
-                intensity[f"prep_{prep.template_key}_intensity"] = chosen or 0
-        rows.append({**base, **intensity})
+    if user_ids is not None:
+        stmt = stmt.where(episode.c.user_id.in_(list(user_ids)))
+    return stmt
 
-    return pd.DataFrame(rows)
 
+def _episode_frame(rows: List[Tuple]) -> pd.DataFrame:
+    df = frame_from_rows(EPISODE_COLUMNS, rows)
+    df["scenario_type"] = df["scenario_type"].map(_SCENARIO_VALUES)
+    return df
 
-def dml_ate(
-    df: pd.DataFrame,
-    treatment_col: str,
-    outcome_col: str,
-    confounder_cols: List[str],
-) -> Dict[str, float]:
+
+def load_episode_dataframe(db: Session, user_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """Load completed episodes with outcomes + preparations into a flat DF."""
+    return _episode_frame(db.execute(episode_select(user_ids)).all())
+
+
+def iter_user_rows(db: Session, stmt: Select) -> Iterator[Tuple[int, List[Tuple]]]:
     """
-    Simplified DML estimator:
-    1. Predict Y ~ X using RandomForest
-    2. Predict binary treatment ~ X using Linear Regression
-    3. Regress residualised y on residualised t
+    Stream `stmt` (ordered by its user_id column) and yield one user's rows
+    at a time.
+
+    `yield_per` fetches in batches and uses a server-side cursor where the
+    driver supports one, so memory stays bounded by the largest user.
     """
-    data = df.dropna(subset=[treatment_col, outcome_col] + confounder_cols)
-    if len(data) < 4:
-        return {"ate": 0.0, "se": math.inf, "n_treated": 0, "n_control": 0}
+    result = db.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+    user_index = list(result.keys()).index("user_id")
+    current_user = None
+    chunk: List[Tuple] = []
+    for row in result:
+        if row[user_index] != current_user:
+            if chunk:
+                yield current_user, chunk
+            current_user, chunk = row[user_index], []
+        chunk.append(tuple(row))
+    if chunk:
+        yield current_user, chunk
 
-    T = data[treatment_col].values.astype(float)
-    Y = data[outcome_col].values.astype(float)
-    X = pd.get_dummies(
+
+def iter_episode_frames(db: Session, user_ids: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """Streaming counterpart of `load_episode_dataframe`: one (user_id, frame) per user."""
+    for user_id, rows in iter_user_rows(db, episode_select(user_ids)):
+        yield user_id, _episode_frame(rows)
+
+
+def _design_matrix(data: pd.DataFrame, confounder_cols: List[str]) -> pd.DataFrame:
+    return pd.get_dummies(
         data[confounder_cols],
         columns=["scenario_type", "location", "topic"],
         drop_first=True,
     )
-    T_bin = (T >= 3).astype(float)
 
-    y_model = RandomForestRegressor(n_estimators=200, max_depth=6, min_samples_leaf=10, n_jobs=-1)
+
+def _outcome_residuals(X: pd.DataFrame, Y: np.ndarray, n_jobs: int = -1) -> np.ndarray:
+    """Y - E[Y|X]; independent of the treatment, so shareable across treatments."""
+    y_model = RandomForestRegressor(n_estimators=200, max_depth=6, min_samples_leaf=10, n_jobs=n_jobs)
     y_model.fit(X, Y)
-    res_y = Y - y_model.predict(X)
+    return Y - y_model.predict(X)
+
 
+def _treatment_residuals(X: pd.DataFrame, T_bin: np.ndarray) -> np.ndarray:
+    """T - E[T|X]; independent of the outcome, so shareable across outcomes."""
     t_model = LinearRegression()
     t_model.fit(X, T_bin)
-    res_t = T_bin - t_model.predict(X)
+    return T_bin - t_model.predict(X)
+
 
+def _final_stage(res_t: np.ndarray, res_y: np.ndarray, T_bin: np.ndarray) -> Dict[str, float]:
     lr = LinearRegression()
     lr.fit(res_t.reshape(-1, 1), res_y)
     ate = float(lr.coef_[0])
@@ -122,56 +198,262 @@ def dml_ate(
     }
 
 
-def estimate_and_persist_effects() -> None:
-    """Main entrypoint for the batch job."""
-    with session_scope() as db:
-        df = load_episode_dataframe(db)
-        if df.empty:
-            return
-
-        for user_id, df_user in df.groupby("user_id"):
-            for t_key in TREATMENTS:
-                t_col = f"prep_{t_key}_intensity"
-                for outcome in OUTCOMES:
-                    stats = dml_ate(
-                        df_user,
-                        treatment_col=t_col,
-                        outcome_col=outcome,
-                        confounder_cols=[
-                            "pre_anxiety",
-                            "pre_crying_risk",
-                            "pre_speech_block_risk",
-                            "scenario_type",
-                            "location",
-                            "topic",
-                        ],
-                    )
-                    if math.isinf(stats["se"]) or stats["n_treated"] == 0 or stats["n_control"] == 0:
-                        continue
-                    z = 1.96
-                    ci_lower = stats["ate"] - z * stats["se"]
-                    ci_upper = stats["ate"] + z * stats["se"]
-
-                    effect = (
-                        db.query(models.EmotionTreatmentEffect)
-                            .filter_by(user_id=user_id, treatment_key=t_key, outcome_name=outcome)
-                            .one_or_none()
-                    )
-                    if effect is None:
-                        effect = models.EmotionTreatmentEffect(
-                            user_id=user_id,
-                            treatment_key=t_key,
-                            outcome_name=outcome,
-                        )
-                        db.add(effect)
-
-                    effect.ate = stats["ate"]
-                    effect.ci_lower = ci_lower
-                    effect.ci_upper = ci_upper
-                    effect.n_treated = stats["n_treated"]
-                    effect.n_control = stats["n_control"]
-                    effect.model_version = MODEL_VERSION
+def dml_ate(
+    df: pd.DataFrame,
+    treatment_col: str,
+    outcome_col: str,
+    confounder_cols: List[str],
+    n_jobs: int = -1,
+) -> Dict[str, float]:
+    """
+    Simplified DML estimator:
+    1. Predict Y ~ X using RandomForest
+    2. Predict binary treatment ~ X using Linear Regression
+    3. Regress residualised y on residualised t
+
+    Fits both nuisances for a single pair; `estimate_user_effects` shares
+    them across all pairs of a user instead.
+    """
+    data = df.dropna(subset=[treatment_col, outcome_col] + confounder_cols)
+    if len(data) < 4:
+        return {"ate": 0.0, "se": math.inf, "n_treated": 0, "n_control": 0}
+
+    T = data[treatment_col].values.astype(float)
+    Y = data[outcome_col].values.astype(float)
+    X = _design_matrix(data, confounder_cols)
+    T_bin = (T >= 3).astype(float)
+
+    res_y = _outcome_residuals(X, Y, n_jobs=n_jobs)
+    res_t = _treatment_residuals(X, T_bin)
+    return _final_stage(res_t, res_y, T_bin)
+
+
+CONFOUNDER_COLS = [
+    "pre_anxiety",
+    "pre_crying_risk",
+    "pre_speech_block_risk",
+    "scenario_type",
+    "location",
+    "topic",
+]
+
+
+def estimate_user_effects(
+    user_id: int,
+    df_user: pd.DataFrame,
+    n_jobs: int = -1,
+    clock: Optional[StageClock] = None,
+) -> List[Dict]:
+    """
+    Fit every treatment x outcome pair for one user.
+
+    The design matrix is built once, the Y~X nuisance once per outcome and
+    the T~X nuisance once per treatment; the 20 final-stage regressions
+    reuse them (4 forests instead of 20). Pure function (no DB access) so
+    it can run inside a worker process. Stage times go to `clock` if given.
+    """
+    clock = clock or StageClock()
+    t_cols = [f"prep_{t_key}_intensity" for t_key in TREATMENTS]
+    with clock.stage("encode"):
+        data = df_user.dropna(subset=t_cols + OUTCOMES + CONFOUNDER_COLS)
+        if len(data) < 4:
+            return []
+        X = _design_matrix(data, CONFOUNDER_COLS)
+
+    with clock.stage("fit"):
+        res_y = {
+            outcome: _outcome_residuals(X, data[outcome].values.astype(float), n_jobs=n_jobs)
+            for outcome in OUTCOMES
+        }
+        return _final_stage_rows(user_id, data, X, t_cols, res_y)
+
+
+def _final_stage_rows(
+    user_id: int,
+    data: pd.DataFrame,
+    X: pd.DataFrame,
+    t_cols: List[str],
+    res_y: Dict[str, np.ndarray],
+) -> List[Dict]:
+    results: List[Dict] = []
+    for t_key, t_col in zip(TREATMENTS, t_cols):
+        T_bin = (data[t_col].values.astype(float) >= 3).astype(float)
+        res_t = _treatment_residuals(X, T_bin)
+        for outcome in OUTCOMES:
+            stats = _final_stage(res_t, res_y[outcome], T_bin)
+            if math.isinf(stats["se"]) or stats["n_treated"] == 0 or stats["n_control"] == 0:
+                continue
+            z = 1.96
+            results.append(
+                {
+                    "user_id": int(user_id),
+                    "treatment_key": t_key,
+                    "outcome_name": outcome,
+                    "ate": stats["ate"],
+                    "ci_lower": stats["ate"] - z * stats["se"],
+                    "ci_upper": stats["ate"] + z * stats["se"],
+                    "n_treated": stats["n_treated"],
+                    "n_control": stats["n_control"],
+                }
+            )
+    return results
+
+
+def _estimate_user_effects_task(
+    args: Tuple[int, pd.DataFrame], n_jobs: int = 1
+) -> Tuple[int, int, List[Dict], StageClock]:
+    user_id, df_user = args
+    clock = StageClock()
+    # In a pool: one process per core already; nested RandomForest threads only oversubscribe.
+    rows = estimate_user_effects(user_id, df_user, n_jobs=n_jobs, clock=clock)
+    return user_id, len(df_user), rows, clock
+
+
+def estimate_all_effects(df: pd.DataFrame, workers: int = 1, run: Optional[JobRun] = None) -> List[Dict]:
+    """
+    Estimate effects for every user in `df`.
+
+    With `workers > 1` users are fanned out over a process pool, largest
+    first so a heavy user does not end up as the straggler.
+    """
+    groups = _largest_first(df)
+    return estimate_user_groups(groups, workers=min(workers, len(groups)), run=run)
+
+
+def _largest_first(df: pd.DataFrame) -> List[Tuple[int, pd.DataFrame]]:
+    if df.empty:
+        return []
+    return sorted(df.groupby("user_id"), key=lambda item: len(item[1]), reverse=True)
+
+
+def _changed_groups(
+    groups: Iterable[Tuple[int, pd.DataFrame]],
+    known: Dict[int, str],
+    fingerprints: Dict[int, str],
+    run: JobRun,
+) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """Drop users whose input fingerprint matches `known`; record the rest in `fingerprints`."""
+    for user_id, df_user in groups:
+        fingerprint = frame_fingerprint(df_user, MODEL_VERSION)
+        if known.get(user_id) == fingerprint:
+            run.skip_user()
+            continue
+        fingerprints[user_id] = fingerprint
+        yield user_id, df_user
+
+
+def estimate_user_groups(
+    groups: Iterable[Tuple[int, pd.DataFrame]],
+    workers: int = 1,
+    run: Optional[JobRun] = None,
+) -> List[Dict]:
+    """
+    Estimate effects for an iterable of (user_id, frame) pairs.
+
+    The iterable is consumed lazily: at most `2 * workers` user frames are
+    in flight at once, so a streaming source keeps memory bounded. Per-user
+    timings (measured inside the worker processes) are reported to `run`.
+    """
+    results: List[Dict] = []
+
+    def collect(outcome: Tuple[int, int, List[Dict], StageClock]) -> None:
+        user_id, n_episodes, rows, clock = outcome
+        results.extend(rows)
+        if run is not None:
+            run.observe_user(user_id, clock, n_episodes)
+
+    if workers <= 1:
+        for group in groups:
+            collect(_estimate_user_effects_task(group, n_jobs=-1))
+        return results
+
+    # spawn: the API process runs threads, which do not survive a fork safely.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending: deque = deque()
+        for group in groups:
+            pending.append(pool.submit(_estimate_user_effects_task, group))
+            if len(pending) >= 2 * workers:
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
+    return results
+
+
+def estimate_and_persist_effects(
+    user_ids: Optional[Iterable[int]] = None,
+    full_rebuild: bool = False,
+    workers: Optional[int] = None,
+    streaming: Optional[bool] = None,
+    force: bool = False,
+) -> None:
+    """
+    Main entrypoint for the batch job.
+
+    By default only users marked dirty since their last estimate are refit;
+    `user_ids` restricts the run explicitly and `full_rebuild` refits everyone.
+    Either way, users whose input fingerprint matches the persisted one are
+    skipped unless `force` is set.
+    `workers` (default: settings.analytics_workers) sizes the process pool;
+    `streaming` (default: settings.analytics_streaming) reads episodes one
+    user at a time instead of materialising them all up front.
+    """
+    settings = get_settings()
+    if workers is None:
+        workers = settings.analytics_workers
+    if streaming is None:
+        streaming = settings.analytics_streaming
+    with JobRun(JOB_EFFECTS) as run, session_scope() as db:
+        if full_rebuild:
+            targets = None
+        else:
+            targets = list(user_ids) if user_ids is not None else dirty_user_ids(db, JOB_EFFECTS)
+            if not targets:
+                return
+
+        versions = data_versions(db, targets)
+        known = {} if force else stored_fingerprints(db, JOB_EFFECTS, targets)
+        fingerprints: Dict[int, str] = {}
+        if streaming:
+            frames = run.timed_iter(iter_episode_frames(db, user_ids=targets), "load")
+        else:
+            with run.stage("load"):
+                frames = _largest_first(load_episode_dataframe(db, user_ids=targets))
+            workers = max(1, min(workers, len(frames)))
+        groups = _changed_groups(frames, known, fingerprints, run)
+        with run.stage("estimate"):
+            results = estimate_user_groups(groups, workers=workers, run=run)
+        with run.stage("persist"):
+            _persist_effects(db, results, fingerprints)
+            mark_users_estimated(db, JOB_EFFECTS, versions)
+
+
+def _persist_effects(db: Session, results: List[Dict], fingerprints: Optional[Dict[int, str]] = None) -> None:
+    fingerprints = fingerprints or {}
+    user_ids = {row["user_id"] for row in results}
+    cache.invalidate_on_commit(db, cache.EFFECTS, user_ids)
+    cache.invalidate_on_commit(db, cache.PREDICTOR, user_ids)
+    bulk_upsert(
+        db,
+        models.EmotionTreatmentEffect,
+        [{**row, "model_version": MODEL_VERSION} for row in results],
+        conflict_cols=["user_id", "treatment_key", "outcome_name"],
+    )
+    store_fingerprints(db, JOB_EFFECTS, fingerprints)
+    if user_ids:
+        # The stored decomposition baseline includes the crying-level ATEs.
+        # Imported here: estimate_paths imports this module.
+        from cqox.jobs.estimate_paths import refresh_decomposition_baselines
+
+        refresh_decomposition_baselines(db, user_ids)
+        cache.invalidate_on_commit(db, cache.PATH_SUMMARY, user_ids)
 
 
 if __name__ == "__main__":
-    estimate_and_persist_effects()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--full", action="store_true", help="refit every user, not only dirty ones (nightly)")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: ANALYTICS_WORKERS)")
+    parser.add_argument("--stream", action="store_true", default=None, help="read episodes one user at a time")
+    parser.add_argument("--force", action="store_true", help="refit even users whose input fingerprint is unchanged")
+    args = parser.parse_args()
+    estimate_and_persist_effects(full_rebuild=args.full, workers=args.workers, streaming=args.stream, force=args.force)
@@ -1,48 +1,101 @@
 """
 Estimate evaluation -> crying path coefficients with ridge regression and bootstrap.
+
+Besides the batch job, the path model's sufficient statistics (the moment
+matrix of [1, E, S, R, C]) are kept per user / partner role and updated as
+each outcome is recorded, so point estimates refresh without rescanning
+history. Those refreshes write plain ridge point estimates; the next job run
+replaces them with the bootstrap means and fills in the CIs.
+
+Each run also materialises the per-user inputs of the episode decomposition
+(episode means, trait term, baseline, crying-level ATEs) on the summary row,
+so decomposition reads need no aggregation; the effect job refreshes them
+too whenever it persists new ATEs.
 """
 from __future__ import annotations
 
+import argparse
 from datetime import datetime
-from typing import Dict, Tuple
+import json
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import Ridge
+from sqlalchemy import Select, func, select, true, update
 
-from cqox.db import session_scope
+from cqox import cache
+from cqox.config import get_settings
+from cqox.db import bulk_upsert, session_scope
 from cqox.emotion import models
+from cqox.jobs.estimate_effects import frame_from_rows, iter_user_rows
+from cqox.jobs.state import (
+    JOB_PATHS,
+    data_versions,
+    dirty_user_ids,
+    frame_fingerprint,
+    mark_users_estimated,
+    store_fingerprints,
+    stored_fingerprints,
+)
+from cqox.metrics import JobRun, StageClock
 
+MODEL_VERSION = "v1.0-ridge-boot"
 MIN_EPISODES = 10
 BOOTSTRAP_SAMPLES = 100
 
+UNSET_PARTNER_ROLE = "未設定"
+ALL_PARTNERS = ""
+# Column order of the moment vector v = [1, *MOMENT_FIELDS].
+MOMENT_FIELDS = ["E", "S", "R", "C"]
+# Trait values assumed for users who never filled in their trait profile
+# (the path fit, the decomposition baseline and the profile API all use them).
+DEFAULT_TRAIT_SOCIAL_ANXIETY = 5
+DEFAULT_TRAIT_CRYING_PRONENESS = 5
+DEFAULT_TRAIT_SUPPRESSION = 5
+
 
-def build_user_dataframe(session) -> pd.DataFrame:
-    query = (
-        session.query(models.EmotionEpisode, models.EmotionOutcome, models.EmotionTraitProfile)
-        .join(models.EmotionOutcome, models.EmotionEpisode.id == models.EmotionOutcome.episode_id)
-        .outerjoin(
-            models.EmotionTraitProfile,
-            models.EmotionTraitProfile.user_id == models.EmotionEpisode.user_id,
+PATH_COLUMNS = ["user_id", "episode_id", "partner_role", "E", "S", "R", "C", "A_sa", "A_cp"]
+
+
+def path_select(user_ids: Optional[Iterable[int]] = None) -> Select:
+    """Core SELECT of the path model inputs (one row per episode with an outcome)."""
+    episode = models.EmotionEpisode.__table__
+    outcome = models.EmotionOutcome.__table__
+    trait = models.EmotionTraitProfile.__table__
+    stmt = (
+        select(
+            episode.c.user_id,
+            episode.c.id,
+            func.coalesce(func.nullif(episode.c.context_partner_role, ""), UNSET_PARTNER_ROLE),
+            episode.c.eval_threat_level,
+            episode.c.pre_anxiety,
+            episode.c.suppress_intent_level,
+            outcome.c.crying_level,
+            func.coalesce(trait.c.trait_social_anxiety, DEFAULT_TRAIT_SOCIAL_ANXIETY),
+            func.coalesce(trait.c.trait_crying_proneness, DEFAULT_TRAIT_CRYING_PRONENESS),
         )
-    )
-    rows: list[Dict] = []
-    for ep, outcome, trait in query:
-        if ep.eval_threat_level is None or ep.suppress_intent_level is None:
-            continue
-        rows.append(
-            {
-                "user_id": ep.user_id,
-                "partner_role": ep.context_partner_role or "未設定",
-                "E": ep.eval_threat_level,
-                "S": ep.pre_anxiety,
-                "R": ep.suppress_intent_level,
-                "C": outcome.crying_level,
-                "A_sa": trait.trait_social_anxiety if trait else None,
-                "A_cp": trait.trait_crying_proneness if trait else None,
-            }
+        .join(outcome, outcome.c.episode_id == episode.c.id)
+        .outerjoin(trait, trait.c.user_id == episode.c.user_id)
+        .where(
+            episode.c.eval_threat_level.is_not(None),
+            episode.c.suppress_intent_level.is_not(None),
         )
-    return pd.DataFrame(rows)
+        .order_by(episode.c.user_id, episode.c.id)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(episode.c.user_id.in_(list(user_ids)))
+    return stmt
+
+
+def build_user_dataframe(session, user_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    return frame_from_rows(PATH_COLUMNS, session.execute(path_select(user_ids)).all())
+
+
+def iter_user_dataframes(session, user_ids: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """Streaming counterpart of `build_user_dataframe`: one (user_id, frame) per user."""
+    for user_id, rows in iter_user_rows(session, path_select(user_ids)):
+        yield user_id, frame_from_rows(PATH_COLUMNS, rows)
 
 
 def _fit_ridge_coeffs(X: np.ndarray, y: np.ndarray) -> Tuple[float, np.ndarray]:
@@ -58,18 +111,47 @@ def _fit_ridge_coeffs(X: np.ndarray, y: np.ndarray) -> Tuple[float, np.ndarray]:
     return intercept, coef
 
 
+def _batched_ridge_coeffs(
+    X: np.ndarray, y: np.ndarray, weights: np.ndarray, alpha: float = 1.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `_fit_ridge_coeffs` for B resamples at once.
+
+    `weights` is a (B, n) matrix of row multiplicities, so resample b is
+    X repeated by weights[b]. Standardisation and the ridge normal equations
+    are formed as weighted Gram matrices and solved with one batched
+    `np.linalg.solve`. Returns intercepts (B,) and coefficients (B, p).
+    """
+    n = weights.sum(axis=1, keepdims=True)
+    means = (weights @ X) / n
+    y_mean = (weights @ y) / n[:, 0]
+    Xc = X[None, :, :] - means[:, None, :]
+    yc = y[None, :] - y_mean[:, None]
+    gram = np.einsum("bn,bni,bnj->bij", weights, Xc, Xc)
+    xty = np.einsum("bn,bni,bn->bi", weights, Xc, yc)
+
+    stds = np.sqrt(np.einsum("bii->bi", gram) / n)
+    stds[stds == 0] = 1.0
+    gram_scaled = gram / (stds[:, :, None] * stds[:, None, :])
+    xty_scaled = xty / stds
+    eye = np.eye(X.shape[1])
+    coef_scaled = np.linalg.solve(gram_scaled + alpha * eye, xty_scaled[:, :, None])[:, :, 0]
+
+    intercepts = y_mean - np.sum(coef_scaled * means / stds, axis=1)
+    return intercepts, coef_scaled / stds
+
+
 def _bootstrap_stats(
     X: np.ndarray, y: np.ndarray, feature_names: list[str]
 ) -> Dict[str, Tuple[float, float, float]]:
-    intercepts = []
-    coefs = []
-    for _ in range(BOOTSTRAP_SAMPLES):
-        idx = np.random.choice(len(y), size=len(y), replace=True)
-        inter, coef = _fit_ridge_coeffs(X[idx], y[idx])
-        intercepts.append(inter)
-        coefs.append(coef)
-    intercepts = np.array(intercepts)
-    coefs = np.array(coefs)
+    n = len(y)
+    # Same draws as BOOTSTRAP_SAMPLES sequential np.random.choice(n, n) calls.
+    idx = np.random.choice(n, size=(BOOTSTRAP_SAMPLES, n), replace=True)
+    offsets = np.arange(BOOTSTRAP_SAMPLES)[:, None] * n
+    weights = np.bincount((idx + offsets).ravel(), minlength=BOOTSTRAP_SAMPLES * n).reshape(BOOTSTRAP_SAMPLES, n)
+    intercepts, coefs = _batched_ridge_coeffs(
+        np.asarray(X, dtype=float), np.asarray(y, dtype=float), weights.astype(float)
+    )
 
     def summarize(series: np.ndarray):
         return series.mean(), np.percentile(series, 2.5), np.percentile(series, 97.5)
@@ -80,20 +162,20 @@ def _bootstrap_stats(
     return stats
 
 
-def estimate_for_user(df_u: pd.DataFrame):
+def estimate_for_user(df_u: pd.DataFrame, clock: Optional[StageClock] = None):
+    clock = clock or StageClock()
     df_u = df_u.dropna(subset=["E", "S", "R", "C"])
     if len(df_u) < MIN_EPISODES:
         return None
 
     X_s = df_u[["E", "A_sa"]].fillna(df_u[["E", "A_sa"]].mean(numeric_only=True)).values
     y_s = df_u["S"].values
-    (_, _), stats_s = _fit_and_bootstrap(X_s, y_s, ["E", "A_sa"])
+    (_, _), stats_s = _fit_and_bootstrap(X_s, y_s, ["E", "A_sa"], clock)
     alpha_eval = stats_s["E"][0]
 
     X_c = df_u[["E", "S", "R", "A_cp"]].fillna(df_u[["E", "S", "R", "A_cp"]].mean(numeric_only=True)).values
     y_c = df_u["C"].values
-    intercept, coef = _fit_ridge_coeffs(X_c, y_c)
-    boot_stats = _bootstrap_stats(X_c, y_c, ["E", "S", "R", "A_cp"])
+    (intercept, coef), boot_stats = _fit_and_bootstrap(X_c, y_c, ["E", "S", "R", "A_cp"], clock)
 
     beta_eval = boot_stats["E"][0]
     beta_stress = boot_stats["S"][0]
@@ -131,55 +213,345 @@ def estimate_for_user(df_u: pd.DataFrame):
     }
 
 
-def _fit_and_bootstrap(X, y, feature_names):
-    inter, coef = _fit_ridge_coeffs(X, y)
-    stats = _bootstrap_stats(X, y, feature_names)
+def _fit_and_bootstrap(X, y, feature_names, clock: StageClock):
+    with clock.stage("fit"):
+        inter, coef = _fit_ridge_coeffs(X, y)
+    with clock.stage("bootstrap"):
+        stats = _bootstrap_stats(X, y, feature_names)
     return (inter, coef), stats
 
 
-def update_partner_summary(session, user_id: int, df_u: pd.DataFrame):
+def partner_summary_rows(user_id: int, df_u: pd.DataFrame, clock: Optional[StageClock] = None) -> list[Dict]:
+    rows: list[Dict] = []
     for partner_role, df_partner in df_u.groupby("partner_role"):
         if len(df_partner) < MIN_EPISODES:
             continue
-        stats = estimate_for_user(df_partner)
+        stats = estimate_for_user(df_partner, clock)
         if not stats:
             continue
+        rows.append(
+            {
+                "user_id": int(user_id),
+                "partner_role": partner_role,
+                "total_eval_to_cry": stats["total_eval_to_cry"],
+                "n_episodes": stats["n_episodes"],
+            }
+        )
+    return rows
+
+
+def episode_moments(values: np.ndarray) -> np.ndarray:
+    """sum(v v^T) over rows of `values` (n, 4 in MOMENT_FIELDS order), v = [1, E, S, R, C]."""
+    v = np.column_stack([np.ones(len(values)), np.asarray(values, dtype=float)])
+    return v.T @ v
+
+
+def ridge_from_moments(
+    M: np.ndarray, x_fields: list[str], y_field: str, alpha: float = 1.0
+) -> Tuple[float, np.ndarray]:
+    """
+    `_fit_ridge_coeffs` computed from the moment matrix alone.
+
+    Constant trait columns standardise to zero in the full fit and get a zero
+    coefficient, so they are simply left out of `x_fields`.
+    """
+    xi = [MOMENT_FIELDS.index(name) + 1 for name in x_fields]
+    yi = MOMENT_FIELDS.index(y_field) + 1
+    n = M[0, 0]
+    means = M[0, xi] / n
+    y_mean = M[0, yi] / n
+    gram = M[np.ix_(xi, xi)] - n * np.outer(means, means)
+    xty = M[xi, yi] - n * means * y_mean
+    stds = np.sqrt(np.clip(np.diag(gram) / n, 0.0, None))
+    stds[stds == 0] = 1.0
+    coef_scaled = np.linalg.solve(gram / np.outer(stds, stds) + alpha * np.eye(len(xi)), xty / stds)
+    intercept = y_mean - float(np.sum(coef_scaled * means / stds))
+    return intercept, coef_scaled / stds
+
+
+def point_estimates_from_moments(M: np.ndarray) -> Dict[str, float]:
+    """Point estimates of the `EmotionPathSummary` coefficients (no CIs)."""
+    _, coef_s = ridge_from_moments(M, ["E"], "S")
+    intercept, coef_c = ridge_from_moments(M, ["E", "S", "R"], "C")
+    alpha_eval = float(coef_s[0])
+    beta_eval, beta_stress, beta_suppress = (float(c) for c in coef_c)
+    indirect = alpha_eval * beta_stress
+    return {
+        "intercept": float(intercept),
+        "alpha_eval_to_stress": alpha_eval,
+        "beta_eval_to_cry": beta_eval,
+        "beta_stress_to_cry": beta_stress,
+        "beta_suppress_to_cry": beta_suppress,
+        "beta_trait_to_cry": 0.0,
+        "indirect_eval_to_cry": indirect,
+        "total_eval_to_cry": beta_eval + indirect,
+        "n_episodes": int(round(M[0, 0])),
+    }
+
+
+def moment_rows(user_id: int, df_u: pd.DataFrame) -> list[Dict]:
+    """Moment rows for a user's totals and each partner role, rebuilt from history."""
+    df_u = df_u.dropna(subset=MOMENT_FIELDS)
+    groups = [(ALL_PARTNERS, df_u), *df_u.groupby("partner_role")]
+    return [
+        {
+            "user_id": int(user_id),
+            "partner_role": partner_role,
+            "n_episodes": len(df_group),
+            "moments": json.dumps(episode_moments(df_group[MOMENT_FIELDS].values).tolist()),
+        }
+        for partner_role, df_group in groups
+        if len(df_group)
+    ]
+
+
+def accumulate_episode_moments(session, episode: models.EmotionEpisode, crying_level: int) -> None:
+    """
+    Add one completed episode to its user's moment matrices (caller commits)
+    and refresh the point estimates once enough episodes have accumulated.
+    """
+    if episode.eval_threat_level is None or episode.suppress_intent_level is None:
+        return
+    delta = episode_moments(
+        np.array([[episode.eval_threat_level, episode.pre_anxiety, episode.suppress_intent_level, crying_level]])
+    )
+    roles = [ALL_PARTNERS, episode.context_partner_role or UNSET_PARTNER_ROLE]
+    # Seed missing rows first: a row lock cannot cover a row that does not
+    # exist yet, so two first episodes would otherwise race on the insert.
+    empty = json.dumps(np.zeros_like(delta).tolist())
+    bulk_upsert(
+        session,
+        models.EmotionPathMoments,
+        [{"user_id": episode.user_id, "partner_role": role, "n_episodes": 0, "moments": empty} for role in roles],
+        ["user_id", "partner_role"],
+        [],
+    )
+    for partner_role in roles:
         record = (
-            session.query(models.EmotionPathPartnerSummary)
-            .filter_by(user_id=user_id, partner_role=partner_role)
-            .one_or_none()
+            session.query(models.EmotionPathMoments)
+            .filter_by(user_id=episode.user_id, partner_role=partner_role)
+            .with_for_update()
+            .one()
         )
-        if record is None:
-            record = models.EmotionPathPartnerSummary(
-                user_id=user_id,
-                partner_role=partner_role,
-            )
-            session.add(record)
-        record.total_eval_to_cry = stats["total_eval_to_cry"]
-        record.n_episodes = stats["n_episodes"]
-        record.updated_at = datetime.utcnow()
-
-
-def estimate_and_persist_paths() -> None:
-    with session_scope() as session:
-        df = build_user_dataframe(session)
-        if df.empty:
-            return
-        for user_id, df_user in df.groupby("user_id"):
-            stats = estimate_for_user(df_user)
-            if not stats:
-                continue
-            summary = (
-                session.query(models.EmotionPathSummary).filter_by(user_id=user_id).one_or_none()
+        M = np.array(json.loads(record.moments)) + delta
+        record.moments = json.dumps(M.tolist())
+        record.n_episodes = int(round(M[0, 0]))
+        if record.n_episodes >= MIN_EPISODES:
+            _refresh_point_estimates(session, episode.user_id, partner_role, M)
+
+
+def _refresh_point_estimates(session, user_id: int, partner_role: str, M: np.ndarray) -> None:
+    estimates = point_estimates_from_moments(M)
+    namespace = cache.PATH_SUMMARY if partner_role == ALL_PARTNERS else cache.PARTNER_PATHS
+    cache.invalidate_on_commit(session, namespace, [user_id])
+    if partner_role == ALL_PARTNERS:
+        cache.invalidate_on_commit(session, cache.DECOMPOSITION, [user_id])
+        summary = session.query(models.EmotionPathSummary).filter_by(user_id=user_id).one_or_none()
+        if summary is None:
+            summary = models.EmotionPathSummary(user_id=user_id)
+            session.add(summary)
+        for key, value in estimates.items():
+            setattr(summary, key, value)
+        if summary.mean_eval_threat is not None:
+            # Keep the materialised baseline in step with the new coefficients.
+            baseline = decomposition_baseline(
+                estimates,
+                (summary.mean_eval_threat, summary.mean_pre_anxiety, summary.mean_suppress_intent),
+                summary.trait_crying_proneness,
             )
-            if summary is None:
-                summary = models.EmotionPathSummary(user_id=user_id)
-                session.add(summary)
-            for key, value in stats.items():
+            for key, value in baseline.items():
                 setattr(summary, key, value)
-            summary.updated_at = datetime.utcnow()
-            update_partner_summary(session, user_id, df_user)
+        summary.updated_at = datetime.utcnow()
+        return
+
+    record = (
+        session.query(models.EmotionPathPartnerSummary)
+        .filter_by(user_id=user_id, partner_role=partner_role)
+        .one_or_none()
+    )
+    if record is None:
+        record = models.EmotionPathPartnerSummary(user_id=user_id, partner_role=partner_role)
+        session.add(record)
+    record.total_eval_to_cry = estimates["total_eval_to_cry"]
+    record.n_episodes = estimates["n_episodes"]
+    record.updated_at = datetime.utcnow()
+
+
+def decomposition_baseline(
+    coefficients: Mapping[str, Optional[float]],
+    means: Tuple[float, float, float],
+    trait_value: float,
+) -> Dict[str, float]:
+    """Predicted crying at the user's mean E/S/R, and its trait term."""
+    def coef(key: str) -> float:
+        return coefficients.get(key) or 0.0
+
+    contrib_trait = coef("beta_trait_to_cry") * trait_value
+    baseline = (
+        coef("intercept")
+        + coef("beta_eval_to_cry") * means[0]
+        + coef("beta_stress_to_cry") * means[1]
+        + coef("beta_suppress_to_cry") * means[2]
+        + contrib_trait
+    )
+    return {"contrib_trait": contrib_trait, "baseline_crying": baseline}
+
+
+def refresh_decomposition_baselines(session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute the decomposition inputs stored on `EmotionPathSummary` for
+    `user_ids` (default: every summary row) with four grouped queries.
+    Returns the number of rows updated.
+    """
+    summary = models.EmotionPathSummary.__table__
+    episode = models.EmotionEpisode.__table__
+    trait = models.EmotionTraitProfile.__table__
+    effect = models.EmotionTreatmentEffect.__table__
+    ids = list(user_ids) if user_ids is not None else None
+    cache.invalidate_on_commit(session, cache.DECOMPOSITION, ids)
+
+    def scope(column):
+        return column.in_(ids) if ids is not None else true()
+
+    summaries = session.execute(
+        select(
+            summary.c.id,
+            summary.c.user_id,
+            summary.c.intercept,
+            summary.c.beta_eval_to_cry,
+            summary.c.beta_stress_to_cry,
+            summary.c.beta_suppress_to_cry,
+            summary.c.beta_trait_to_cry,
+        ).where(scope(summary.c.user_id))
+    ).mappings().all()
+    if not summaries:
+        return 0
+
+    means = {
+        user_id: (mean_e or 0.0, mean_s or 0.0, mean_r or 0.0)
+        for user_id, mean_e, mean_s, mean_r in session.execute(
+            select(
+                episode.c.user_id,
+                func.avg(episode.c.eval_threat_level),
+                func.avg(episode.c.pre_anxiety),
+                func.avg(episode.c.suppress_intent_level),
+            )
+            .where(scope(episode.c.user_id))
+            .group_by(episode.c.user_id)
+        )
+    }
+    traits = dict(
+        session.execute(
+            select(trait.c.user_id, trait.c.trait_crying_proneness).where(scope(trait.c.user_id))
+        ).all()
+    )
+    effects: Dict[int, Dict[str, float]] = {}
+    for user_id, key, ate in session.execute(
+        select(effect.c.user_id, effect.c.treatment_key, effect.c.ate).where(
+            scope(effect.c.user_id), effect.c.outcome_name == "crying_level"
+        )
+    ):
+        effects.setdefault(user_id, {})[key] = ate
+
+    rows = []
+    for row in summaries:
+        user_id = row["user_id"]
+        user_means = means.get(user_id, (0.0, 0.0, 0.0))
+        trait_value = traits.get(user_id, DEFAULT_TRAIT_CRYING_PRONENESS)
+        rows.append(
+            {
+                "id": row["id"],
+                "mean_eval_threat": user_means[0],
+                "mean_pre_anxiety": user_means[1],
+                "mean_suppress_intent": user_means[2],
+                "trait_crying_proneness": trait_value,
+                "crying_effects": json.dumps(effects.get(user_id, {}), sort_keys=True),
+                **decomposition_baseline(row, user_means, trait_value),
+            }
+        )
+    session.execute(update(models.EmotionPathSummary), rows)
+    return len(rows)
+
+
+def estimate_and_persist_paths(
+    user_ids: Optional[Iterable[int]] = None,
+    full_rebuild: bool = False,
+    streaming: Optional[bool] = None,
+    force: bool = False,
+) -> None:
+    """
+    Refit path models for dirty users (or `user_ids`, or everyone on `full_rebuild`).
+
+    `streaming` (default: settings.analytics_streaming) reads one user at a time.
+    Users whose input fingerprint matches the stored one are skipped
+    unless `force` is set.
+    """
+    if streaming is None:
+        streaming = get_settings().analytics_streaming
+    with JobRun(JOB_PATHS) as run, session_scope() as session:
+        if full_rebuild:
+            targets = None
+        else:
+            targets = list(user_ids) if user_ids is not None else dirty_user_ids(session, JOB_PATHS)
+            if not targets:
+                return
+
+        versions = data_versions(session, targets)
+        known = {} if force else stored_fingerprints(session, JOB_PATHS, targets)
+        if streaming:
+            groups = run.timed_iter(iter_user_dataframes(session, user_ids=targets), "load")
+        else:
+            with run.stage("load"):
+                df = build_user_dataframe(session, user_ids=targets)
+            groups = df.groupby("user_id") if not df.empty else []
+        _persist_paths(session, groups, run, known)
+        with run.stage("persist"):
+            # Not gated by the fingerprint: episode means and ATEs move without the path inputs.
+            refresh_decomposition_baselines(session, targets)
+            cache.invalidate_on_commit(session, cache.PATH_SUMMARY, targets)
+            cache.invalidate_on_commit(session, cache.PARTNER_PATHS, targets)
+            mark_users_estimated(session, JOB_PATHS, versions)
+
+
+def _persist_paths(
+    session,
+    groups: Iterable[Tuple[int, pd.DataFrame]],
+    run: JobRun,
+    known_fingerprints: Optional[Dict[int, str]] = None,
+) -> None:
+    known_fingerprints = known_fingerprints or {}
+    summaries: list[Dict] = []
+    partners: list[Dict] = []
+    moments: list[Dict] = []
+    fingerprints: Dict[int, str] = {}
+    with run.stage("estimate"):
+        for user_id, df_user in groups:
+            fingerprint = frame_fingerprint(df_user, MODEL_VERSION)
+            if known_fingerprints.get(user_id) == fingerprint:
+                run.skip_user()
+                continue
+            fingerprints[int(user_id)] = fingerprint
+            clock = StageClock()
+            with clock.stage("fit"):
+                # Resync the incremental accumulators with the full history.
+                moments.extend(moment_rows(user_id, df_user))
+            stats = estimate_for_user(df_user, clock)
+            if stats:
+                summaries.append({"user_id": int(user_id), **stats})
+                partners.extend(partner_summary_rows(user_id, df_user, clock))
+            run.observe_user(user_id, clock, len(df_user))
+
+    with run.stage("persist"):
+        bulk_upsert(session, models.EmotionPathSummary, summaries, conflict_cols=["user_id"])
+        bulk_upsert(session, models.EmotionPathPartnerSummary, partners, conflict_cols=["user_id", "partner_role"])
+        bulk_upsert(session, models.EmotionPathMoments, moments, conflict_cols=["user_id", "partner_role"])
+        store_fingerprints(session, JOB_PATHS, fingerprints)
 
 
 if __name__ == "__main__":
-    estimate_and_persist_paths()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--full", action="store_true", help="refit every user, not only dirty ones (nightly)")
+    parser.add_argument("--stream", action="store_true", default=None, help="read episodes one user at a time")
+    parser.add_argument("--force", action="store_true", help="refit even users whose input fingerprint is unchanged")
+    args = parser.parse_args()
+    estimate_and_persist_paths(full_rebuild=args.full, streaming=args.stream, force=args.force)
@@ -0,0 +1,123 @@
+"""
+DB-backed queue for analytics recompute requests.
+
+Write paths call `enqueue_analytics_job` inside their own transaction, so a
+request is durable exactly when the data change is. While a job is queued its
+`dedupe_key` makes further requests for the same user no-ops; claiming clears
+the key, so changes that land while a worker is busy queue a fresh job
+instead of being dropped.
+
+Claiming selects with `FOR UPDATE SKIP LOCKED` (Postgres; ignored on SQLite)
+and then flips each row with `UPDATE ... WHERE status = 'queued'`, so two
+workers never run the same job on either backend.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from cqox.db import bulk_upsert
+from cqox.emotion import models
+
+MAX_ATTEMPTS = 3
+# Running jobs older than this are assumed to belong to a dead worker.
+STALE_AFTER = timedelta(hours=1)
+
+_Job = models.EmotionAnalyticsJob
+_Status = models.JobStatus
+
+
+def _dedupe_key(user_id: Optional[int]) -> str:
+    return f"analytics:{'*' if user_id is None else user_id}"
+
+
+def enqueue_analytics_job(db: Session, user_id: Optional[int]) -> None:
+    """Queue a recompute for `user_id` (None = full rebuild); caller commits."""
+    row = {
+        "user_id": user_id,
+        "status": _Status.QUEUED,
+        "dedupe_key": _dedupe_key(user_id),
+        "attempts": 0,
+        "created_at": datetime.utcnow(),
+    }
+    bulk_upsert(db, _Job, [row], conflict_cols=["dedupe_key"], update_cols=[])
+
+
+def claim_jobs(db: Session, limit: int = 100) -> List[models.EmotionAnalyticsJob]:
+    """Atomically move up to `limit` queued jobs to running and return them."""
+    candidates = db.scalars(
+        select(_Job.id)
+        .where(_Job.status == _Status.QUEUED)
+        .order_by(_Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    now = datetime.utcnow()
+    claimed: List[int] = []
+    for job_id in candidates:
+        result = db.execute(
+            update(_Job)
+            .where(_Job.id == job_id, _Job.status == _Status.QUEUED)
+            .values(
+                status=_Status.RUNNING,
+                dedupe_key=None,
+                attempts=_Job.attempts + 1,
+                started_at=now,
+            )
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.commit()
+    if not claimed:
+        return []
+    return list(db.scalars(select(_Job).where(_Job.id.in_(claimed)).order_by(_Job.id)))
+
+
+def complete_jobs(db: Session, job_ids: Sequence[int]) -> None:
+    db.execute(
+        update(_Job)
+        .where(_Job.id.in_(list(job_ids)))
+        .values(status=_Status.DONE, finished_at=datetime.utcnow(), last_error=None)
+    )
+    db.commit()
+
+
+def fail_jobs(db: Session, jobs: Sequence[models.EmotionAnalyticsJob], error: str) -> None:
+    """Requeue jobs with attempts left (unless an equivalent one is queued)."""
+    now = datetime.utcnow()
+    for job in jobs:
+        job.last_error = error
+        job.finished_at = now
+        key = _dedupe_key(job.user_id)
+        already_queued = db.scalar(select(_Job.id).where(_Job.dedupe_key == key)) is not None
+        if job.attempts < MAX_ATTEMPTS and not already_queued:
+            job.status = _Status.QUEUED
+            job.dedupe_key = key
+        else:
+            job.status = _Status.FAILED
+    db.commit()
+
+
+def release_jobs(db: Session, jobs: Sequence[models.EmotionAnalyticsJob]) -> None:
+    """Hand claimed jobs back to the queue without using up an attempt."""
+    for job in jobs:
+        key = _dedupe_key(job.user_id)
+        already_queued = db.scalar(select(_Job.id).where(_Job.dedupe_key == key)) is not None
+        job.status = _Status.QUEUED
+        job.dedupe_key = None if already_queued else key
+        job.attempts = max(job.attempts - 1, 0)
+        job.started_at = None
+    db.commit()
+
+
+def requeue_stale_jobs(db: Session, now: Optional[datetime] = None) -> int:
+    """Hand jobs left running by a crashed worker back to the queue."""
+    cutoff = (now or datetime.utcnow()) - STALE_AFTER
+    stale = db.scalars(select(_Job).where(_Job.status == _Status.RUNNING, _Job.started_at < cutoff)).all()
+    if stale:
+        fail_jobs(db, stale, "worker lost (stale running job)")
+    return len(stale)
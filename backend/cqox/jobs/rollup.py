@@ -0,0 +1,169 @@
+"""
+Write-maintained per-user dashboard rollup (`emotion_user_rollup`).
+
+The service write paths call the `rollup_on_*` helpers inside their own
+transaction; each is a single-row `UPDATE ... SET col = col + delta`. The
+first write for a user without a rollup row (e.g. data from before this
+table existed) first seeds the row from the source tables as they stood
+before the change, with `ON CONFLICT DO NOTHING` so concurrent first
+writes seed it once, and then applies the same increment.
+
+Repair / backfill:
+
+    python -m cqox.jobs.rollup               # rebuild every user
+    python -m cqox.jobs.rollup --user 42     # rebuild one user
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import case, func, select, true, update
+from sqlalchemy.orm import Session
+
+from cqox.db import bulk_upsert, session_scope
+from cqox.emotion import models
+from cqox.jobs.estimate_effects import TREATMENTS
+
+STATUS_COLUMNS = {
+    models.EpisodeStatus.PLANNED: "episodes_planned",
+    models.EpisodeStatus.COMPLETED: "episodes_completed",
+    models.EpisodeStatus.CANCELLED: "episodes_cancelled",
+}
+PREP_COLUMNS = {key: f"prep_{key}_count" for key in TREATMENTS}
+OUTCOME_FIELDS = [
+    "stress_during",
+    "stress_after",
+    "crying_level",
+    "speech_block_level",
+    "expression_score",
+    "relationship_impact",
+]
+
+_table = models.EmotionUserRollup.__table__
+
+
+def rollup_on_episode_created(db: Session, episode: models.EmotionEpisode, template_keys: Iterable[str]) -> None:
+    deltas = {"episodes_total": 1, STATUS_COLUMNS[episode.status]: 1}
+    for key in template_keys:
+        _add_prep(deltas, key)
+    _bump(db, episode.user_id, deltas)
+
+
+def rollup_on_preparation_added(db: Session, user_id: int, template_key: str) -> None:
+    _bump(db, user_id, _add_prep({}, template_key))
+
+
+def rollup_on_outcome(
+    db: Session,
+    user_id: int,
+    previous_status: models.EpisodeStatus,
+    outcome: models.EmotionOutcome,
+) -> None:
+    deltas: Dict[str, int] = {"outcomes_count": 1}
+    deltas.update({f"sum_{field}": getattr(outcome, field) for field in OUTCOME_FIELDS})
+    if previous_status != models.EpisodeStatus.COMPLETED:
+        deltas[STATUS_COLUMNS[previous_status]] = -1
+        deltas["episodes_completed"] = 1
+    _bump(db, user_id, deltas)
+
+
+def _add_prep(deltas: Dict[str, int], template_key: str) -> Dict[str, int]:
+    column = PREP_COLUMNS.get(template_key)
+    if column:
+        deltas[column] = deltas.get(column, 0) + 1
+    return deltas
+
+
+def _bump(db: Session, user_id: int, deltas: Dict[str, int]) -> None:
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    db.flush()
+    stmt = (
+        update(_table)
+        .where(_table.c.user_id == user_id)
+        .values({**{c: _table.c[c] + d for c, d in deltas.items()}, "updated_at": datetime.utcnow()})
+    )
+    if db.execute(stmt).rowcount == 0:
+        # The flushed source rows already include this change; seed without it.
+        seed = _source_rollups(db, [user_id]).get(user_id, _empty_rollup(user_id))
+        seed.update({column: seed[column] - delta for column, delta in deltas.items()})
+        bulk_upsert(db, models.EmotionUserRollup, [seed], conflict_cols=["user_id"], update_cols=[])
+        db.execute(stmt)
+
+
+def rebuild_user_rollups(db: Session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute rollup rows from the source tables; returns the number of users."""
+    rows = _source_rollups(db, user_ids)
+    bulk_upsert(db, models.EmotionUserRollup, list(rows.values()), conflict_cols=["user_id"])
+    return len(rows)
+
+
+def _source_rollups(db: Session, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict]:
+    """user_id -> rollup row counted from the source tables (users with episodes only)."""
+    episode = models.EmotionEpisode.__table__
+    prep = models.EmotionPreparationExecution.__table__
+    outcome = models.EmotionOutcome.__table__
+
+    def count_if(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+    ids = list(user_ids) if user_ids is not None else None
+    scope = episode.c.user_id.in_(ids) if ids is not None else true()
+
+    rows: Dict[int, Dict] = {}
+    status_stmt = (
+        select(
+            episode.c.user_id,
+            func.count(episode.c.id),
+            *[count_if(episode.c.status == status) for status in STATUS_COLUMNS],
+        )
+        .where(scope)
+        .group_by(episode.c.user_id)
+    )
+    for user_id, total, *by_status in db.execute(status_stmt):
+        row = _empty_rollup(user_id)
+        row["episodes_total"] = total
+        row.update(zip(STATUS_COLUMNS.values(), by_status))
+        rows[user_id] = row
+
+    prep_stmt = (
+        select(episode.c.user_id, *[count_if(prep.c.template_key == key) for key in PREP_COLUMNS])
+        .join(episode, prep.c.episode_id == episode.c.id)
+        .where(scope)
+        .group_by(episode.c.user_id)
+    )
+    for user_id, *counts in db.execute(prep_stmt):
+        rows[user_id].update(zip(PREP_COLUMNS.values(), counts))
+
+    outcome_stmt = (
+        select(
+            episode.c.user_id,
+            func.count(outcome.c.episode_id),
+            *[func.coalesce(func.sum(outcome.c[field]), 0) for field in OUTCOME_FIELDS],
+        )
+        .join(episode, outcome.c.episode_id == episode.c.id)
+        .where(scope)
+        .group_by(episode.c.user_id)
+    )
+    for user_id, n_outcomes, *sums in db.execute(outcome_stmt):
+        rows[user_id]["outcomes_count"] = n_outcomes
+        rows[user_id].update(zip([f"sum_{field}" for field in OUTCOME_FIELDS], sums))
+    return rows
+
+
+def _empty_rollup(user_id: int) -> Dict:
+    row = {c.name: 0 for c in _table.columns if c.name not in ("user_id", "updated_at")}
+    row["user_id"] = user_id
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild emotion_user_rollup from the source tables")
+    parser.add_argument("--user", type=int, action="append", help="rebuild only this user (repeatable)")
+    args = parser.parse_args()
+    with session_scope() as session:
+        n = rebuild_user_rollups(session, args.user)
+    print(f"Rebuilt rollups for {n} users")
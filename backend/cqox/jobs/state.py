@@ -0,0 +1,136 @@
+"""
+Dirty-user tracking for the analytics jobs.
+
+Write paths call `mark_user_dirty` inside their own transaction, which
+increments the user's `data_version` in the database. A job snapshots the
+versions (`data_versions`) before it loads data and afterwards records
+exactly those values as estimated, so a write committed while the job ran
+leaves its user dirty regardless of clock skew between processes.
+`full_rebuild=True` on the jobs bypasses the dirty set (nightly).
+
+Independently of the dirty flags, each job stores one input fingerprint
+per user (hash of the user's estimator input frame + model version) in its
+`*_fingerprint` column and skips users whose fingerprint is unchanged, so
+even a full rebuild only refits users whose inputs actually differ. The
+fingerprint is written for every user the job fit, including users whose
+fit produced no result rows.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.orm import Session
+
+from cqox import cache
+from cqox.db import bulk_upsert
+from cqox.emotion import models
+
+JOB_EFFECTS = "effects"
+JOB_PATHS = "paths"
+
+_State = models.EmotionAnalyticsState
+_table = _State.__table__
+# job -> (estimated version column, estimated-at column)
+_ESTIMATED = {
+    JOB_EFFECTS: ("effects_version", "effects_estimated_at"),
+    JOB_PATHS: ("paths_version", "paths_estimated_at"),
+}
+_FINGERPRINT = {JOB_EFFECTS: "effects_fingerprint", JOB_PATHS: "paths_fingerprint"}
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit.
+_CHUNK_SIZE = 500
+
+
+def mark_user_dirty(db: Session, user_id: int) -> None:
+    """Flag a user's analytics inputs as changed (caller commits)."""
+    now = datetime.utcnow()
+    # Seed the row without racing a concurrent first write, then bump in SQL.
+    bulk_upsert(db, _State, [{"user_id": user_id, "data_changed_at": now, "data_version": 0}], ["user_id"], [])
+    db.execute(
+        update(_table)
+        .where(_table.c.user_id == user_id)
+        .values(data_version=_table.c.data_version + 1, data_changed_at=now)
+    )
+    # The cached decomposition context is built from the user's episodes and traits.
+    cache.invalidate_on_commit(db, cache.DECOMPOSITION, [user_id])
+
+
+def dirty_user_ids(db: Session, job: str) -> List[int]:
+    """Users whose data changed since `job` last estimated them."""
+    estimated = _table.c[_ESTIMATED[job][0]]
+    stmt = (
+        select(_table.c.user_id)
+        .where(or_(estimated.is_(None), estimated < _table.c.data_version))
+        .order_by(_table.c.user_id)
+    )
+    return list(db.scalars(stmt))
+
+
+def data_versions(db: Session, user_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """Snapshot of user_id -> data_version; take it before loading the job's data."""
+    stmt = select(_table.c.user_id, _table.c.data_version)
+    if user_ids is None:
+        return dict(db.execute(stmt).all())
+    ids = list(user_ids)
+    versions: Dict[int, int] = {}
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        versions.update(db.execute(stmt.where(_table.c.user_id.in_(ids[start : start + _CHUNK_SIZE]))).all())
+    return versions
+
+
+def mark_users_estimated(db: Session, job: str, versions: Dict[int, int]) -> None:
+    """
+    Record `job` as having estimated each user at the snapshot `versions`.
+
+    Compare-and-set: a version is only ever raised, so an older snapshot
+    cannot overwrite a newer run's, and writes after the snapshot (a
+    higher data_version) keep the user dirty for the next run.
+    """
+    if not versions:
+        return
+    version_col, estimated_at_col = _ESTIMATED[job]
+    current = _table.c[version_col]
+    stmt = (
+        update(_table)
+        .where(_table.c.user_id == bindparam("uid"), or_(current.is_(None), current < bindparam("version")))
+        .values({version_col: bindparam("version"), estimated_at_col: bindparam("now")})
+    )
+    now = datetime.utcnow()
+    db.execute(stmt, [{"uid": user_id, "version": version, "now": now} for user_id, version in versions.items()])
+
+
+def frame_fingerprint(df_user: pd.DataFrame, model_version: str) -> str:
+    """Order-independent SHA-256 of a user's estimator input frame."""
+    frame = df_user.sort_values("episode_id").reset_index(drop=True)
+    digest = hashlib.sha256(model_version.encode())
+    digest.update("\x1f".join(map(str, frame.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def stored_fingerprints(db: Session, job: str, user_ids: Optional[Iterable[int]] = None) -> Dict[int, str]:
+    """user_id -> input fingerprint `job` last fit the user on."""
+    column = _table.c[_FINGERPRINT[job]]
+    stmt = select(_table.c.user_id, column).where(column.is_not(None))
+    if user_ids is None:
+        return dict(db.execute(stmt).all())
+    ids = list(user_ids)
+    fingerprints: Dict[int, str] = {}
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        fingerprints.update(db.execute(stmt.where(_table.c.user_id.in_(ids[start : start + _CHUNK_SIZE]))).all())
+    return fingerprints
+
+
+def store_fingerprints(db: Session, job: str, fingerprints: Dict[int, str]) -> None:
+    """Record the input fingerprints `job` just fit (caller commits)."""
+    column = _FINGERPRINT[job]
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": int(user_id), "data_changed_at": now, "data_version": 0, column: fingerprint}
+        for user_id, fingerprint in fingerprints.items()
+    ]
+    bulk_upsert(db, _State, rows, ["user_id"], [column])
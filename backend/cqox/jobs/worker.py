@@ -0,0 +1,86 @@
+"""
+Analytics job worker.
+
+Polls `emotion_analytics_job`, claims a batch of queued jobs and runs the
+effect and path estimators once for the whole batch:
+
+    python -m cqox.jobs.worker            # run forever
+    python -m cqox.jobs.worker --once     # drain what is queued, then exit
+    python -m cqox.jobs.worker --metrics-port 9100   # serve /metrics for Prometheus
+
+Per-user jobs run the incremental (dirty-user) path, which already covers
+every claimed user; a queued full-rebuild job (user_id NULL) refits everyone.
+Runs go through `run_analytics_jobs`, so any number of workers share one
+estimator run at a time; a worker that finds the run lock taken hands its
+jobs back to the queue instead of marking them done.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+
+from prometheus_client import start_http_server
+
+from cqox.db import session_scope
+from cqox.jobs.coordination import run_analytics_jobs
+from cqox.jobs.queue import claim_jobs, complete_jobs, fail_jobs, release_jobs, requeue_stale_jobs
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 5.0
+BATCH_SIZE = 500
+
+
+def run_once(batch_size: int = BATCH_SIZE) -> int:
+    """Claim and process one batch; returns the number of jobs handled (0 if released)."""
+    with session_scope() as session:
+        requeue_stale_jobs(session)
+        jobs = claim_jobs(session, limit=batch_size)
+        if not jobs:
+            return 0
+
+        full_rebuild = any(job.user_id is None for job in jobs)
+        logger.info("Running analytics for %d queued jobs (full_rebuild=%s)", len(jobs), full_rebuild)
+        try:
+            ran = run_analytics_jobs(full_rebuild=full_rebuild)
+        except Exception as exc:
+            logger.exception("Analytics job batch failed")
+            session.rollback()
+            fail_jobs(session, jobs, repr(exc))
+            return len(jobs)
+        if not ran:
+            # Another worker holds the run lock; its extra pass is not ours to
+            # vouch for, so the jobs go back to the queue until we run them.
+            release_jobs(session, jobs)
+            return 0
+        complete_jobs(session, [job.id for job in jobs])
+        return len(jobs)
+
+
+def run_forever(poll_interval: float = POLL_INTERVAL_SECONDS, batch_size: int = BATCH_SIZE) -> None:
+    while True:
+        if run_once(batch_size) == 0:
+            time.sleep(poll_interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Emotion CQOx analytics job worker")
+    parser.add_argument("--once", action="store_true", help="drain the queue and exit")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL_SECONDS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--metrics-port", type=int, default=None, help="expose job metrics on this port")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
+    if args.once:
+        while run_once(args.batch_size):
+            pass
+        return
+    run_forever(args.poll_interval, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
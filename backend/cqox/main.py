@@ -3,6 +3,7 @@ FastAPI Main Application for Emotion CQOx
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import make_asgi_app
 
 from .api import emotion
 
@@ -26,6 +27,9 @@ app.add_middleware(
 # Include routers
 app.include_router(emotion.router)
 
+# Prometheus scrape endpoint (job worker metrics are served by the worker itself)
+app.mount("/metrics", make_asgi_app())
+
 
 @app.get("/")
 async def root():
@@ -0,0 +1,183 @@
+"""
+Prometheus metrics for Emotion CQOx.
+
+The API exposes them on `/metrics`; the job worker runs in its own process
+and serves its registry with `--metrics-port` (see cqox.jobs.worker).
+
+Job metrics:
+- emotion_job_stage_seconds{job,stage}: parent-process wall time per stage
+  per run (load / estimate / persist)
+- emotion_job_user_stage_seconds{job,stage}: per-user stage time summed over
+  the run (encode / fit / bootstrap); measured inside the worker processes,
+  so with `workers > 1` it can exceed the run's wall time
+- emotion_job_user_fit_seconds{job}: per-user estimation time
+- emotion_job_users_fit_total{job}
+- emotion_job_users_skipped_total{job}: input fingerprint unchanged
+- emotion_job_runs_total{job,status}: status = success | failure
+- emotion_job_last_success_timestamp_seconds{job}: alert on staleness
+
+Cache metrics (see cqox.cache):
+- emotion_cache_requests_total{namespace,result}: result = hit | miss
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+import heapq
+import logging
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SLOWEST_USERS_LOGGED = 5
+
+JOB_STAGE_SECONDS = Histogram(
+    "emotion_job_stage_seconds",
+    "Wall time spent in each analytics job stage per run",
+    ["job", "stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600),
+)
+JOB_USER_STAGE_SECONDS = Histogram(
+    "emotion_job_user_stage_seconds",
+    "Per-user estimation stage time summed over a run's users (across worker processes)",
+    ["job", "stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600),
+)
+JOB_USER_FIT_SECONDS = Histogram(
+    "emotion_job_user_fit_seconds",
+    "Per-user model fitting time",
+    ["job"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+JOB_USERS_FIT = Counter("emotion_job_users_fit_total", "Users fitted by analytics jobs", ["job"])
+JOB_USERS_SKIPPED = Counter(
+    "emotion_job_users_skipped_total", "Users skipped because their input fingerprint was unchanged", ["job"]
+)
+JOB_RUNS = Counter("emotion_job_runs_total", "Analytics job runs", ["job", "status"])
+JOB_LAST_SUCCESS = Gauge(
+    "emotion_job_last_success_timestamp_seconds",
+    "Unix time of the last successful analytics job run",
+    ["job"],
+)
+CACHE_REQUESTS = Counter(
+    "emotion_cache_requests_total", "Read-through cache lookups for per-user analytics reads", ["namespace", "result"]
+)
+
+
+class StageClock:
+    """Accumulates wall time per stage. Plain dict inside, so it pickles."""
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def merge(self, other: "StageClock") -> None:
+        for name, seconds in other.seconds.items():
+            self.add(name, seconds)
+
+    def total(self) -> float:
+        return sum(self.seconds.values())
+
+
+class JobRun:
+    """
+    One analytics job run: collects stage/per-user timings and exports them
+    when the `with` block exits (success or failure). `clock` holds the
+    parent's wall time per stage; `user_clock` the per-user times reported
+    by `observe_user`.
+    """
+
+    def __init__(self, job: str) -> None:
+        self.job = job
+        self.clock = StageClock()
+        self.user_clock = StageClock()
+        self.users_fit = 0
+        self.users_skipped = 0
+        self._slowest: List[Tuple[float, int, int]] = []
+        self._started = 0.0
+
+    def __enter__(self) -> "JobRun":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        for stage, seconds in self.clock.seconds.items():
+            JOB_STAGE_SECONDS.labels(self.job, stage).observe(seconds)
+        for stage, seconds in self.user_clock.seconds.items():
+            JOB_USER_STAGE_SECONDS.labels(self.job, stage).observe(seconds)
+        status = "failure" if exc_type else "success"
+        JOB_RUNS.labels(self.job, status).inc()
+        if exc_type is None:
+            JOB_LAST_SUCCESS.labels(self.job).set_to_current_time()
+        self._log_summary(status)
+        return False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Wall time of the block, less what it attributed to other stages (e.g. streamed loads)."""
+        start, attributed = time.perf_counter(), self.clock.total()
+        try:
+            yield
+        finally:
+            nested = self.clock.total() - attributed
+            self.clock.add(name, time.perf_counter() - start - nested)
+
+    def timed_iter(self, iterable: Iterable[T], stage: str) -> Iterator[T]:
+        """Attribute the time spent producing each item (e.g. DB reads) to `stage`."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.clock.add(stage, time.perf_counter() - start)
+                return
+            self.clock.add(stage, time.perf_counter() - start)
+            yield item
+
+    def skip_user(self) -> None:
+        JOB_USERS_SKIPPED.labels(self.job).inc()
+        self.users_skipped += 1
+
+    def observe_user(self, user_id: int, clock: StageClock, n_episodes: int) -> None:
+        seconds = clock.total()
+        JOB_USER_FIT_SECONDS.labels(self.job).observe(seconds)
+        JOB_USERS_FIT.labels(self.job).inc()
+        self.user_clock.merge(clock)
+        self.users_fit += 1
+        entry = (seconds, int(user_id), int(n_episodes))
+        if len(self._slowest) < SLOWEST_USERS_LOGGED:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def _log_summary(self, status: str) -> None:
+        elapsed = time.perf_counter() - self._started
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.clock.seconds.items())
+        slowest = ", ".join(
+            f"user {user_id} {seconds:.2f}s/{n} ep" for seconds, user_id, n in sorted(self._slowest, reverse=True)
+        )
+        logger.info(
+            "%s job %s: %d users fit, %d unchanged skipped in %.2fs (%s)%s",
+            self.job,
+            status,
+            self.users_fit,
+            self.users_skipped,
+            elapsed,
+            stages or "no work",
+            f"; slowest: {slowest}" if slowest else "",
+        )
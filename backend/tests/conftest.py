@@ -1,9 +1,15 @@
+import os
 from pathlib import Path
 
 import pytest
-from sqlalchemy import create_engine
+
+# The tests run writers and readers in one process, where the memory cache is exact.
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
+from cqox.cache import get_cache
 from cqox.db import Base
 
 TEST_DB_PATH = Path("/tmp/emotion_cqox_test.db")
@@ -30,6 +36,12 @@ def clean_database(engine):
     yield
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    get_cache().clear()
+    yield
+
+
 @pytest.fixture
 def db_session(session_factory):
     session = session_factory()
@@ -37,3 +49,18 @@ def db_session(session_factory):
         yield session
     finally:
         session.close()
+
+
+@pytest.fixture
+def query_log(engine):
+    """(statement, parameters) pairs executed on the test engine while the test runs."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
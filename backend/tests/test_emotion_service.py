@@ -1,6 +1,11 @@
 from datetime import datetime, timedelta
+import json
+
+import numpy as np
+import pytest
 
 from cqox.emotion import service, schemas
+from cqox.jobs import estimate_paths
 
 
 def sample_draft():
@@ -53,9 +58,49 @@ def test_episode_lifecycle(db_session):
     assert timeline.points[0].episode_id == 1
 
 
+def test_preparation_changes_queue_an_analytics_job(db_session):
+    from cqox.jobs.queue import claim_jobs
+
+    service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    assert [job.user_id for job in claim_jobs(db_session)] == [1]
+
+    service.add_preparation_execution(
+        db_session,
+        user_id=1,
+        episode_id=1,
+        payload=schemas.PreparationExecutionCreate(template_key="safe_word_plan", planned_intensity=4),
+    )
+    assert [job.user_id for job in claim_jobs(db_session)] == [1]
+
+
+def test_record_outcome_commits_once(db_session):
+    from sqlalchemy import event
+
+    res = service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    db_session.query(service.models.EmotionPreferenceProfile).delete()
+    db_session.commit()
+    service.cache.get_cache().clear()
+
+    commits = []
+
+    def count(session):
+        commits.append(session)
+
+    event.listen(db_session, "after_commit", count)
+    try:
+        service.record_outcome(db_session, user_id=1, episode_id=res.episode_id, outcome=sample_outcome())
+    finally:
+        event.remove(db_session, "after_commit", count)
+    assert len(commits) == 1
+
+
 def test_preference_profile(db_session):
     profile = service.get_preference_profile(db_session, user_id=1)
     assert profile.weight_relief > 0
+    # Reads do not write: the defaults are served without creating rows.
+    assert service.get_trait_profile(db_session, user_id=1).trait_crying_proneness == 5
+    assert db_session.query(service.models.EmotionPreferenceProfile).count() == 0
+    assert db_session.query(service.models.EmotionTraitProfile).count() == 0
 
     updated = service.update_preference_profile(
         db_session,
@@ -63,3 +108,541 @@ def test_preference_profile(db_session):
         payload=schemas.PreferenceProfileCreate(weight_relief=0.6, weight_expression=0.3, weight_relationship=0.1),
     )
     assert abs(updated.weight_relief - 0.6) < 1e-6
+
+
+def test_path_point_estimates_refresh_on_outcome(db_session):
+    for i in range(10):
+        draft = sample_draft()
+        draft.eval_threat_level = i
+        draft.context_partner_role = "上司"
+        res = service.create_episode_draft(db_session, user_id=1, draft=draft)
+        payload = schemas.OutcomeCreate(
+            stress_during=5,
+            stress_after=3,
+            crying_level=min(i + 1, 10),
+            speech_block_level=1,
+            expression_score=7,
+            relationship_impact=1,
+        )
+        service.record_outcome(db_session, user_id=1, episode_id=res.episode_id, outcome=payload)
+
+    summary = service.get_path_summary(db_session, user_id=1)
+    assert summary.n_episodes == 10
+    assert summary.beta_eval_to_cry > 0
+    assert summary.beta_eval_to_cry_lo is None  # CIs are left to the batch job
+    partners = service.get_partner_path_summaries(db_session, user_id=1)
+    assert [p.partner_role for p in partners] == ["上司"]
+
+
+def sample_outcome(crying_level=2):
+    return schemas.OutcomeCreate(
+        stress_during=5,
+        stress_after=3,
+        crying_level=crying_level,
+        speech_block_level=1,
+        expression_score=7,
+        relationship_impact=1,
+    )
+
+
+def test_dashboard_summary_query_count_is_flat(db_session, query_log):
+    service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    service.create_episode_draft(db_session, user_id=2, draft=sample_draft())
+    service.record_outcome(db_session, user_id=1, episode_id=1, outcome=sample_outcome())
+
+    query_log.clear()
+    from_rollup = service.get_dashboard_summary(db_session, user_id=1)
+    assert len(query_log) == 1
+
+    db_session.query(service.models.EmotionUserRollup).delete()
+    db_session.commit()
+    query_log.clear()
+    from_episodes = service.get_dashboard_summary(db_session, user_id=1)
+    assert len(query_log) == 3  # rollup miss + grouped fallback
+
+    assert from_rollup == from_episodes
+    assert (from_rollup.total_episodes, from_rollup.total_completed, from_rollup.total_planned) == (2, 1, 1)
+    counts = {p.template_key: p.count for p in from_rollup.by_preparation}
+    assert counts["three_messages"] == 2
+    assert list(counts) == service.PREPARATION_TEMPLATE_KEYS
+    assert from_rollup.outcome_means["crying_level"] == 2
+
+
+def test_rollup_increments_match_rebuild(db_session):
+    from cqox.jobs.rollup import rebuild_user_rollups
+
+    for _ in range(3):
+        service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    service.add_preparation_execution(
+        db_session,
+        user_id=1,
+        episode_id=2,
+        payload=schemas.PreparationExecutionCreate(template_key="safe_word_plan", planned_intensity=4),
+    )
+    service.record_outcome(db_session, user_id=1, episode_id=1, outcome=sample_outcome(crying_level=4))
+    service.record_outcome(db_session, user_id=1, episode_id=3, outcome=sample_outcome(crying_level=7))
+
+    Rollup = service.models.EmotionUserRollup
+    columns = [c.name for c in Rollup.__table__.columns if c.name != "updated_at"]
+    incremental = db_session.query(*[getattr(Rollup, c) for c in columns]).one()
+    assert incremental.episodes_completed == 2 and incremental.episodes_planned == 1
+    assert incremental.prep_safe_word_plan_count == 1
+    assert incremental.sum_crying_level == 11
+
+    rebuild_user_rollups(db_session)
+    db_session.commit()
+    assert db_session.query(*[getattr(Rollup, c) for c in columns]).one() == incremental
+
+
+def test_rollup_first_write_seeds_missing_row(db_session):
+    from cqox.jobs.rollup import rebuild_user_rollups
+
+    service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    service.record_outcome(db_session, user_id=1, episode_id=1, outcome=sample_outcome(crying_level=4))
+    Rollup = service.models.EmotionUserRollup
+    db_session.query(Rollup).delete()
+    db_session.commit()
+
+    service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    service.record_outcome(db_session, user_id=1, episode_id=2, outcome=sample_outcome(crying_level=3))
+
+    columns = [c.name for c in Rollup.__table__.columns if c.name != "updated_at"]
+    seeded = db_session.query(*[getattr(Rollup, c) for c in columns]).one()
+    assert seeded.episodes_total == 2 and seeded.episodes_completed == 2
+    assert seeded.sum_crying_level == 7
+
+    rebuild_user_rollups(db_session)
+    db_session.commit()
+    assert db_session.query(*[getattr(Rollup, c) for c in columns]).one() == seeded
+
+
+def test_keyset_pagination_walks_all_pages_via_index(db_session, query_log):
+    base = datetime(2025, 3, 1)
+    for i in range(7):
+        draft = sample_draft()
+        draft.scheduled_at = base + timedelta(days=i // 2)  # pairs share a timestamp
+        draft.context_partner_role = "boss" if i % 2 else "peer"
+        service.create_episode_draft(db_session, user_id=1, draft=draft)
+    service.create_episode_draft(db_session, user_id=2, draft=sample_draft())
+
+    seen, cursor = [], None
+    while True:
+        query_log.clear()
+        page = service.list_episodes_page(db_session, user_id=1, cursor=cursor, limit=3)
+        seen.extend((ep.scheduled_at, ep.id) for ep in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert len(seen) == 7
+    assert seen == sorted(seen, reverse=True)
+
+    statement, params = query_log[-1]
+    plan = " ".join(row[3] for row in db_session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params))
+    assert "USING INDEX ix_episode_user_scheduled" in plan
+    assert "TEMP B-TREE" not in plan
+
+    filtered = service.list_episodes_page(
+        db_session,
+        user_id=1,
+        partner_role="boss",
+        scheduled_from=base + timedelta(days=1),
+        scheduled_to=base + timedelta(days=3),
+    )
+    assert [ep.context_partner_role for ep in filtered.items] == ["boss", "boss"]
+    assert filtered.next_cursor is None
+    assert service.list_episodes(db_session, user_id=1, limit=2) == service.list_episodes_page(
+        db_session, user_id=1, limit=2
+    ).items
+
+
+def test_timeline_is_one_query_windowed_and_downsampled(db_session, query_log):
+    import numpy as np
+
+    from cqox.emotion.downsample import lttb_indices
+
+    base = datetime(2025, 1, 1)
+    for i in range(40):
+        draft = sample_draft()
+        draft.scheduled_at = base + timedelta(days=i)
+        episode_id = service.create_episode_draft(db_session, user_id=1, draft=draft).episode_id
+        crying = 10 if i == 17 else i % 3  # one spike the downsampler must keep
+        service.record_outcome(db_session, user_id=1, episode_id=episode_id, outcome=sample_outcome(crying_level=crying))
+
+    query_log.clear()
+    full = service.get_timeline_points(db_session, user_id=1)
+    assert len(query_log) == 1
+    assert len(full.points) == full.total_points == 40
+
+    window = service.get_timeline_points(
+        db_session, user_id=1, scheduled_from=base + timedelta(days=10), scheduled_to=base + timedelta(days=20)
+    )
+    assert len(window.points) == 10
+    assert window.points[0].label.endswith("#11")  # position in the full history
+
+    sampled = service.get_timeline_points(db_session, user_id=1, max_points=8)
+    assert len(sampled.points) == 8 and sampled.total_points == 40
+    assert sampled.points[0].episode_id == full.points[0].episode_id
+    assert sampled.points[-1].episode_id == full.points[-1].episode_id
+    assert 10 in [p.crying_level for p in sampled.points]
+
+    assert list(lttb_indices(np.arange(5), np.arange(5), 10)) == [0, 1, 2, 3, 4]
+
+
+def _seed_decomposition_user(db_session):
+    for i in range(10):
+        draft = sample_draft()
+        draft.eval_threat_level = i  # i == 0 falls back to the mean, as before
+        res = service.create_episode_draft(db_session, user_id=1, draft=draft)
+        service.record_outcome(db_session, user_id=1, episode_id=res.episode_id, outcome=sample_outcome(min(i + 1, 10)))
+    db_session.add(
+        service.models.EmotionTreatmentEffect(
+            user_id=1,
+            treatment_key="three_messages",
+            outcome_name="crying_level",
+            ate=-0.5,
+            n_treated=5,
+            n_control=5,
+            model_version="test",
+        )
+    )
+    service.mark_user_dirty(db_session, 1)
+    db_session.commit()
+
+
+def test_batch_decomposition_matches_single_and_reuses_context(db_session, query_log):
+    _seed_decomposition_user(db_session)
+
+    batch = service.decompose_episodes(db_session, user_id=1)
+    assert len(batch) == 10
+    assert batch[3] == service.decompose_episode(db_session, user_id=1, episode_id=batch[3].episode_id)
+    assert abs(batch[0].contrib_preparations - (-0.5 * 7 / 10)) < 1e-12
+    assert batch[0].contrib_eval_threat == 0.0
+
+    query_log.clear()
+    service.decompose_episodes(db_session, user_id=1)
+    assert len(query_log) == 2  # episodes, preparations; the context is cached
+
+    # A new (planned) episode shifts the means, so the cached context is rebuilt.
+    draft = sample_draft()
+    draft.eval_threat_level = 10
+    service.create_episode_draft(db_session, user_id=1, draft=draft)
+    assert service.decompose_episodes(db_session, user_id=1)[0].baseline_crying != batch[0].baseline_crying
+
+
+def test_materialised_decomposition_baseline_skips_aggregation(db_session, query_log):
+    _seed_decomposition_user(db_session)
+    live = service.decompose_episodes(db_session, user_id=1)
+
+    assert estimate_paths.refresh_decomposition_baselines(db_session, [1]) == 1
+    db_session.commit()  # invalidates the cached (live) context
+
+    query_log.clear()
+    materialised = service.decompose_episodes(db_session, user_id=1)
+    assert not any("avg(" in statement.lower() for statement, _ in query_log)
+    assert materialised == live
+
+    # Incremental coefficient refreshes keep the stored baseline consistent.
+    summary = db_session.query(service.models.EmotionPathSummary).filter_by(user_id=1).one()
+    moments = db_session.query(service.models.EmotionPathMoments).filter_by(user_id=1, partner_role="").one()
+    M = np.array(json.loads(moments.moments))
+    estimate_paths._refresh_point_estimates(db_session, 1, "", M * 2)
+    expected = estimate_paths.decomposition_baseline(
+        estimate_paths.point_estimates_from_moments(M * 2),
+        (summary.mean_eval_threat, summary.mean_pre_anxiety, summary.mean_suppress_intent),
+        summary.trait_crying_proneness,
+    )
+    assert summary.baseline_crying == expected["baseline_crying"]
+
+    # New effect estimates refresh the stored crying effects without a path run.
+    from cqox.jobs.estimate_effects import _persist_effects
+
+    effect = {"user_id": 1, "treatment_key": "three_messages", "outcome_name": "crying_level", "ate": -1.5}
+    _persist_effects(db_session, [{**effect, "ci_lower": None, "ci_upper": None, "n_treated": 5, "n_control": 5}])
+    db_session.commit()
+    db_session.refresh(summary)
+    assert json.loads(summary.crying_effects) == {"three_messages": -1.5}
+    # Even without new data (a forced refit), decompositions pick the new ATE up.
+    refit = service.decompose_episodes(db_session, user_id=1)
+    assert refit[0].contrib_preparations == pytest.approx(3 * materialised[0].contrib_preparations)
+
+
+def test_profile_and_path_reads_are_cached_until_writes_commit(db_session, query_log):
+    from prometheus_client import REGISTRY
+
+    def lookups(result):
+        return REGISTRY.get_sample_value("emotion_cache_requests_total", {"namespace": "traits", "result": result}) or 0.0
+
+    hits, misses = lookups("hit"), lookups("miss")
+    service.get_trait_profile(db_session, user_id=1)
+    query_log.clear()
+    assert service.get_trait_profile(db_session, user_id=1).trait_crying_proneness == 5
+    assert query_log == []
+    assert (lookups("hit") - hits, lookups("miss") - misses) == (1, 1)
+
+    payload = schemas.TraitProfileCreate(trait_social_anxiety=3, trait_crying_proneness=8, trait_suppression=2)
+    service.update_trait_profile(db_session, user_id=1, payload=payload)
+    assert service.get_trait_profile(db_session, user_id=1).trait_crying_proneness == 8
+
+    # A rolled-back write leaves the cached entry alone.
+    service.cache.invalidate_on_commit(db_session, service.cache.TRAITS, [1])
+    db_session.rollback()
+    query_log.clear()
+    service.get_trait_profile(db_session, user_id=1)
+    assert query_log == []
+
+    # Incremental path refreshes on record_outcome invalidate the cached summary.
+    _seed_decomposition_user(db_session)
+    assert service.get_path_summary(db_session, user_id=1).n_episodes == 10
+    res = service.create_episode_draft(db_session, user_id=1, draft=sample_draft())
+    service.record_outcome(db_session, user_id=1, episode_id=res.episode_id, outcome=sample_outcome())
+    assert service.get_path_summary(db_session, user_id=1).n_episodes == 11
+
+
+def test_read_through_does_not_store_values_loaded_before_an_invalidation():
+    from pydantic import TypeAdapter
+
+    cache = service.cache
+    adapter = TypeAdapter(int)
+
+    def racing_loader():
+        # A writer commits (and invalidates) while this load is in flight.
+        cache.invalidate([(cache.TRAITS, 1)])
+        return 1
+
+    assert cache.read_through(cache.TRAITS, 1, adapter, racing_loader) == 1
+    assert cache.read_through(cache.TRAITS, 1, adapter, lambda: 2) == 2
+    assert cache.read_through(cache.TRAITS, 1, adapter, lambda: 3) == 2
+
+    def racing_rebuild():
+        cache.invalidate([(cache.TRAITS, None)])
+        return 4
+
+    cache.invalidate([(cache.TRAITS, 1)])
+    assert cache.read_through(cache.TRAITS, 1, adapter, racing_rebuild) == 4
+    assert cache.read_through(cache.TRAITS, 1, adapter, lambda: 5) == 5
+
+
+def test_dashboard_bundle_matches_endpoints_and_honours_sections(db_session, query_log):
+    _seed_decomposition_user(db_session)
+    Section = schemas.DashboardSection
+
+    bundle = service.get_dashboard_bundle(
+        db_session, user_id=1, timeline_max_points=5, episode_status=schemas.EpisodeStatus.COMPLETED, episode_limit=100
+    )
+    assert bundle.summary == service.get_dashboard_summary(db_session, user_id=1)
+    assert bundle.effects == service.get_treatment_effects_for_user(db_session, user_id=1)
+    assert bundle.timeline == service.get_timeline_points(db_session, user_id=1, max_points=5)
+    assert bundle.path_summary == service.get_path_summary(db_session, user_id=1)
+    assert bundle.partner_paths == service.get_partner_path_summaries(db_session, user_id=1)
+    assert [ep.id for ep in bundle.episodes] == [d.episode_id for d in reversed(bundle.decompositions)]
+    assert bundle.decompositions == service.decompose_episodes(db_session, user_id=1)
+
+    query_log.clear()
+    partial = service.get_dashboard_bundle(db_session, user_id=1, sections=[Section.SUMMARY, Section.PATH_SUMMARY])
+    assert partial.effects is None and partial.timeline is None and partial.episodes is None
+    assert partial.path_summary is not None
+    assert len(query_log) == 1  # rollup row; the path summary is served from the cache
+
+
+def test_batch_simulation_matches_scalar_predictions():
+    from cqox.emotion.analytics import PREPARATION_KEYS, AnalyticsEngine
+
+    engine = AnalyticsEngine()
+    grid = schemas.PreparationGrid(journaling_10m=[0, 5, 10], three_messages=[10, 3, 3], breathing_4_7_8=[7])
+    plans = engine.plan_grid(grid.model_dump())
+    assert plans.shape == (grid.size(), 5) == (6, 5)
+
+    batch = engine.predict_outcomes_batch(8, 9, 2, plans)
+    for i, row in enumerate(plans):
+        single = engine.predict_outcome(8, 9, 2, dict(zip(PREPARATION_KEYS, row)))
+        for name, metric in single.items():
+            assert metric["mean"] == batch[name]["mean"][i]
+            assert metric["ci95"] == [batch[name]["ci95_low"][i], batch[name]["ci95_high"][i]]
+
+    with pytest.raises(ValueError):
+        schemas.SimulationBatchRequest(pre_anxiety=5, pre_crying_risk=5, pre_speech_block_risk=5)
+    with pytest.raises(ValueError):
+        full = list(range(11))
+        schemas.SimulationBatchRequest(
+            pre_anxiety=5, pre_crying_risk=5, pre_speech_block_risk=5, grid={key: full for key in PREPARATION_KEYS}
+        )
+
+
+def test_monte_carlo_simulation_is_seeded_and_consistent_across_batches():
+    from cqox.emotion.analytics import PREPARATION_KEYS, AnalyticsEngine
+
+    engine = AnalyticsEngine()
+    plans = engine.plan_grid({"three_messages": [0, 5, 10], "journaling_10m": [0, 10]})
+    batch = engine.simulate_outcomes_batch(7, 6, 5, plans, n_samples=5000, seed=11)
+    again = engine.simulate_outcomes_batch(7, 6, 5, plans, n_samples=5000, seed=11)
+
+    for name, metric in batch.items():
+        assert np.array_equal(metric["mean"], again[name]["mean"])
+        quantiles = np.array(list(metric["quantiles"].values()))
+        assert np.all(np.diff(quantiles, axis=0) >= 0)
+        assert np.array_equal(metric["ci95_low"], metric["quantiles"]["0.025"])
+        # Every plan sees the same draws, so a single-plan run reproduces its row.
+        single = engine.predict_outcome(7, 6, 5, dict(zip(PREPARATION_KEYS, plans[4])), n_samples=5000, seed=11)
+        assert single[name]["mean"] == metric["mean"][4]
+        assert single[name]["ci95"] == [metric["ci95_low"][4], metric["ci95_high"][4]]
+
+    # Stress after has no upstream noise: only clipping and rounding separate it from the analytic mean.
+    analytic = engine.predict_outcomes_batch(7, 6, 5, plans)
+    assert np.allclose(batch["stress_after"]["mean"], analytic["stress_after"]["mean"], atol=0.15)
+
+    with pytest.raises(ValueError):
+        schemas.SimulationBatchRequest(
+            pre_anxiety=5,
+            pre_crying_risk=5,
+            pre_speech_block_risk=5,
+            grid={key: list(range(6)) for key in PREPARATION_KEYS[:3]},
+            n_samples=10000,
+        )
+
+
+def test_plan_recommendation_respects_budget_and_matches_brute_force():
+    from cqox.emotion.analytics import AnalyticsEngine
+    from cqox.emotion.recommend import full_plan_grid, pareto_front, recommend_plans
+
+    engine = AnalyticsEngine()
+    weights = {"relief": 0.2, "expression": 0.5, "relationship": 0.3}
+    result = recommend_plans(engine, 7, 6, 5, weights, effort_budget=12, top_k=3)
+
+    plans = full_plan_grid()
+    within = plans[plans.sum(axis=1) <= 12]
+    prediction = engine.predict_outcomes_batch(7, 6, 5, within)
+    reward = engine.calculate_total_reward(
+        prediction["stress_after"]["mean"],
+        prediction["expression_score"]["mean"],
+        prediction["relationship_impact"]["mean"],
+        7.0,
+        0.2,
+        0.5,
+        0.3,
+    )
+    assert result["n_evaluated"] == len(within)
+    assert [p["total_reward"] for p in result["top"]] == sorted(reward, reverse=True)[:3]
+    assert all(p["effort"] <= 12 for p in result["top"] + result["pareto"])
+
+    rng = np.random.default_rng(0)
+    points = rng.random((200, 3))
+    points[:, 2] = 1 - points[:, 0]  # trade-off, so the front is non-trivial
+    points = np.vstack([points, points[:10]])
+    cost = rng.random(len(points))
+    front = pareto_front(points, cost, resolution=len(points))
+    dominated = [any((q >= p).all() and (q > p).any() for q in points) for p in points]
+    assert {tuple(p) for p in points[front]} == {tuple(p) for p, d in zip(points, dominated) if not d}
+    assert len(front) == len({tuple(p) for p in points[front]})
+
+
+def test_pareto_front_stays_bounded_with_personal_effects():
+    from cqox.emotion.analytics import PREPARATION_KEYS, AnalyticsEngine
+    from cqox.emotion.recommend import MAX_PARETO_PLANS, recommend_plans
+
+    engine = AnalyticsEngine()
+    weights = {"relief": 0.4, "expression": 0.35, "relationship": 0.25}
+    rng = np.random.default_rng(9)
+    outcomes = ["crying_level", "stress_after", "expression_score", "relationship_impact"]
+    # These estimates flatten the trade-off surface: the exact front has several hundred plans.
+    effects = AnalyticsEngine.compile_effects(
+        (key, outcome, float(rng.normal(0, 0.5))) for key in PREPARATION_KEYS for outcome in outcomes
+    )
+    result = recommend_plans(engine, 7, 6, 5, weights, effects=effects)
+    assert 0 < len(result["pareto"]) <= MAX_PARETO_PLANS
+
+    prediction = engine.predict_outcomes_batch(
+        7, 6, 5, engine.plan_matrix([p["plan"] for p in result["pareto"]]), effects
+    )
+    assert np.allclose(prediction["expression_score"]["mean"], [p["predicted_expression_score"] for p in result["pareto"]])
+    points = np.array(
+        [[p["relief"], p["predicted_expression_score"], p["predicted_relationship_impact"]] for p in result["pareto"]]
+    )
+    assert not any(((q >= p).all() and (q > p).any()) for p in points for q in points)
+    reliefs = [p["relief"] for p in result["pareto"]]
+    assert reliefs == sorted(reliefs, reverse=True)
+
+
+def test_personal_predictor_compiles_effects_and_refreshes_after_persist(db_session):
+    from cqox.emotion.analytics import PREPARATION_KEYS, AnalyticsEngine
+    from cqox.jobs.estimate_effects import _persist_effects
+
+    engine = AnalyticsEngine()
+    plans = np.array([[0, 0, 0, 0, 0], [3, 7, 0, 2, 10], [10, 10, 10, 10, 10]], dtype=float)
+    population = engine.predict_outcomes_batch(6, 5, 4, plans)
+
+    # Cold user: no estimates, so the population model is used unchanged.
+    assert service.get_personal_effects(db_session, 1) == {}
+    cold = engine.predict_outcomes_batch(6, 5, 4, plans, service.get_personal_effects(db_session, 1))
+    assert all(np.array_equal(cold[name]["mean"], population[name]["mean"]) for name in population)
+
+    def effect_row(treatment_key, ate):
+        return {
+            "user_id": 1,
+            "treatment_key": treatment_key,
+            "outcome_name": "crying_level",
+            "ate": ate,
+            "ci_lower": None,
+            "ci_upper": None,
+            "n_treated": 5,
+            "n_control": 5,
+        }
+
+    _persist_effects(db_session, [effect_row("three_messages", -0.5)])
+    db_session.commit()
+    effects = service.get_personal_effects(db_session, 1)
+    assert effects["crying_level"][PREPARATION_KEYS.index("three_messages")] == -0.5
+
+    warm = engine.predict_outcomes_batch(6, 5, 4, plans, effects)
+    base = population["crying_level"]["mean"][0]
+    # Preparations without an estimate keep the population's full-intensity effect.
+    slopes = engine.predict_outcomes_batch(6, 5, 4, 10 * np.eye(5))["crying_level"]["mean"] - base
+    slopes[PREPARATION_KEYS.index("three_messages")] = -0.5
+    assert np.allclose(warm["crying_level"]["mean"], np.clip(base + plans @ slopes / 10, 0, 10))
+    assert np.array_equal(warm["stress_after"]["mean"], population["stress_after"]["mean"])
+
+    # The compiled vector is cached until the effects job commits new results.
+    _persist_effects(db_session, [effect_row("three_messages", -2.0)])
+    assert service.get_personal_effects(db_session, 1)["crying_level"][1] == -0.5
+    db_session.commit()
+    assert service.get_personal_effects(db_session, 1)["crying_level"][1] == -2.0
+
+
+def test_bandit_posterior_updates_incrementally_and_serves_from_cache(db_session, query_log):
+    from cqox.emotion.recommend import bandit_candidates, recommend_bandit_plan
+    from cqox.jobs import bandit
+
+    # Scoring via plan_weights equals the full feature rows.
+    rng = np.random.default_rng(0)
+    theta = rng.standard_normal(bandit.N_FEATURES)
+    context = bandit.context_vector(7, 6, 5, None, 8)
+    plans, _effort, scaled, squared = bandit_candidates()
+    linear, quadratic, constant = bandit.plan_weights(theta, "partner", context)
+    assert np.allclose(bandit.features("partner", context, plans) @ theta, scaled @ linear + squared @ quadratic + constant)
+
+    cold = service.get_bandit_posterior(db_session, 1)
+    assert cold.n_updates == 0
+    for i in range(6):
+        draft = sample_draft()
+        draft.pre_state.pre_anxiety = 3 + i
+        draft.preparations_planned.roleplay_self_qa = i
+        res = service.create_episode_draft(db_session, user_id=1, draft=draft)
+        service.record_outcome(db_session, user_id=1, episode_id=res.episode_id, outcome=sample_outcome(i))
+
+    # Six rank-1 updates land where a batch rebuild does.
+    incremental = service.get_bandit_posterior(db_session, 1)
+    assert incremental.n_updates == 6
+    bandit.rebuild_bandit_posteriors(db_session, [1])
+    db_session.commit()
+    rebuilt = service.get_bandit_posterior(db_session, 1)
+    assert np.allclose(incremental.arrays()[0], rebuilt.arrays()[0])
+    assert np.allclose(incremental.arrays()[1], rebuilt.arrays()[1], atol=1e-6)
+
+    query_log.clear()
+    args = dict(scenario_type="interview", pre_anxiety=7, pre_crying_risk=6, pre_speech_block_risk=5)
+    first = recommend_bandit_plan(service.get_bandit_posterior(db_session, 1), **args, effort_budget=12, seed=3)
+    again = recommend_bandit_plan(service.get_bandit_posterior(db_session, 1), **args, effort_budget=12, seed=3)
+    assert not query_log
+    assert first == again
+    assert first["effort"] <= 12 and first["n_observations"] == 6
+    assert set(first["plan"].values()) <= {0, 3, 5, 7, 10}
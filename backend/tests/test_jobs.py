@@ -0,0 +1,447 @@
+from datetime import datetime
+from functools import partial
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from cqox.db import bulk_upsert
+from cqox.emotion import models
+from cqox.jobs import estimate_effects
+from cqox.jobs.estimate_effects import (
+    CONFOUNDER_COLS,
+    OUTCOMES,
+    TREATMENTS,
+    dml_ate,
+    estimate_user_effects,
+    estimate_all_effects,
+    estimate_user_groups,
+    iter_episode_frames,
+    load_episode_dataframe,
+)
+from cqox.jobs.coordination import _LeaseLock, run_analytics_jobs
+from cqox.jobs.queue import MAX_ATTEMPTS, claim_jobs, complete_jobs, enqueue_analytics_job, fail_jobs
+from cqox.jobs.state import JOB_EFFECTS, JOB_PATHS, data_versions, dirty_user_ids, mark_user_dirty, mark_users_estimated
+
+
+def test_dirty_user_tracking(db_session):
+    mark_user_dirty(db_session, 1)
+    mark_user_dirty(db_session, 2)
+    db_session.commit()
+    assert dirty_user_ids(db_session, JOB_EFFECTS) == [1, 2]
+
+    mark_users_estimated(db_session, JOB_EFFECTS, data_versions(db_session, [1]))
+    db_session.commit()
+    assert dirty_user_ids(db_session, JOB_EFFECTS) == [2]
+    # Each job keeps its own watermark.
+    assert dirty_user_ids(db_session, JOB_PATHS) == [1, 2]
+
+    # A change committed after the snapshot keeps the user dirty, whatever the clocks say.
+    snapshot = data_versions(db_session)
+    mark_user_dirty(db_session, 2)
+    db_session.commit()
+    mark_users_estimated(db_session, JOB_EFFECTS, snapshot)
+    db_session.commit()
+    assert dirty_user_ids(db_session, JOB_EFFECTS) == [2]
+
+    # An older snapshot never lowers a newer estimate.
+    mark_users_estimated(db_session, JOB_EFFECTS, data_versions(db_session))
+    mark_users_estimated(db_session, JOB_EFFECTS, snapshot)
+    db_session.commit()
+    assert dirty_user_ids(db_session, JOB_EFFECTS) == []
+
+
+def synthetic_effects_frame(n_users=2, n_per_user=40, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_users * n_per_user
+    df = pd.DataFrame(
+        {
+            "episode_id": np.arange(1, n + 1),
+            "user_id": np.repeat(np.arange(1, n_users + 1), n_per_user),
+            "scenario_type": rng.choice(["interview", "partner", "friend"], n),
+            "topic": rng.choice(["a", "b"], n),
+            "location": rng.choice(["online", "office"], n),
+            "pre_anxiety": rng.integers(0, 11, n),
+            "pre_crying_risk": rng.integers(0, 11, n),
+            "pre_speech_block_risk": rng.integers(0, 11, n),
+            "crying_level": rng.integers(0, 11, n),
+            "stress_after": rng.integers(0, 11, n),
+            "expression_score": rng.integers(0, 11, n),
+            "relationship_impact": rng.integers(-5, 6, n),
+        }
+    )
+    for key in TREATMENTS:
+        df[f"prep_{key}_intensity"] = rng.choice([0, 0, 5, 8], n)
+    return df
+
+
+def test_parallel_effects_match_serial_keys():
+    df = synthetic_effects_frame()
+    key = lambda r: (r["user_id"], r["treatment_key"], r["outcome_name"])
+    serial = sorted(map(key, estimate_all_effects(df, workers=1)))
+    parallel = sorted(map(key, estimate_all_effects(df, workers=2)))
+    assert serial == parallel
+    assert len(serial) == 2 * 5 * 4
+
+
+def test_shared_nuisances_match_per_pair_dml(monkeypatch):
+    monkeypatch.setattr(estimate_effects, "RandomForestRegressor", partial(RandomForestRegressor, random_state=0))
+    df = synthetic_effects_frame(n_users=1, n_per_user=60, seed=4)
+
+    shared = {(r["treatment_key"], r["outcome_name"]): r for r in estimate_user_effects(1, df, n_jobs=1)}
+    assert len(shared) == len(TREATMENTS) * len(OUTCOMES)
+    for t_key in TREATMENTS:
+        for outcome in OUTCOMES:
+            expected = dml_ate(df, f"prep_{t_key}_intensity", outcome, CONFOUNDER_COLS, n_jobs=1)
+            row = shared[(t_key, outcome)]
+            assert row["ate"] == pytest.approx(expected["ate"], rel=1e-9, abs=1e-12)
+            assert row["ci_upper"] - row["ate"] == pytest.approx(1.96 * expected["se"], rel=1e-9)
+            assert (row["n_treated"], row["n_control"]) == (expected["n_treated"], expected["n_control"])
+
+
+def test_bulk_upsert_skips_unchanged_rows(db_session):
+    def effect(outcome, ate):
+        return {
+            "user_id": 1,
+            "treatment_key": "journaling_10m",
+            "outcome_name": outcome,
+            "ate": ate,
+            "ci_lower": ate - 1,
+            "ci_upper": ate + 1,
+            "n_treated": 10,
+            "n_control": 12,
+            "model_version": "test",
+        }
+
+    conflict = ["user_id", "treatment_key", "outcome_name"]
+    bulk_upsert(db_session, models.EmotionTreatmentEffect, [effect("crying_level", 0.5), effect("stress_after", 1.0)], conflict)
+    db_session.commit()
+    stamp = datetime(2000, 1, 1)
+    db_session.query(models.EmotionTreatmentEffect).update({"updated_at": stamp})
+    db_session.commit()
+
+    bulk_upsert(db_session, models.EmotionTreatmentEffect, [effect("crying_level", 0.5), effect("stress_after", -2.0)], conflict)
+    db_session.commit()
+    rows = {r.outcome_name: r for r in db_session.query(models.EmotionTreatmentEffect).all()}
+    assert len(rows) == 2
+    assert rows["crying_level"].updated_at == stamp
+    assert rows["stress_after"].ate == -2.0
+    assert rows["stress_after"].updated_at > stamp
+
+
+def seed_completed_episodes(db, user_ids, per_user=3):
+    rng = np.random.default_rng(1)
+    for user_id in user_ids:
+        for _ in range(per_user):
+            episode = models.EmotionEpisode(
+                user_id=user_id,
+                scenario_type=models.ScenarioType.INTERVIEW,
+                topic="転職理由",
+                scheduled_at=datetime(2025, 1, 1),
+                location="online",
+                status=models.EpisodeStatus.COMPLETED,
+                pre_anxiety=int(rng.integers(0, 11)),
+                pre_crying_risk=int(rng.integers(0, 11)),
+                pre_speech_block_risk=int(rng.integers(0, 11)),
+                eval_threat_level=int(rng.integers(0, 11)),
+                suppress_intent_level=int(rng.integers(0, 11)),
+            )
+            db.add(episode)
+            db.flush()
+            db.add(
+                models.EmotionPreparationExecution(
+                    episode_id=episode.id,
+                    template_key="three_messages",
+                    planned_intensity=int(rng.integers(1, 11)),
+                )
+            )
+            db.add(
+                models.EmotionOutcome(
+                    episode_id=episode.id,
+                    stress_during=5,
+                    stress_after=int(rng.integers(0, 11)),
+                    crying_level=int(rng.integers(0, 11)),
+                    speech_block_level=3,
+                    expression_score=int(rng.integers(0, 11)),
+                    relationship_impact=0,
+                )
+            )
+    db.commit()
+
+
+def test_streaming_frames_match_bulk_loader(db_session, monkeypatch):
+    seed_completed_episodes(db_session, [3, 1, 2])
+    monkeypatch.setattr(estimate_effects, "STREAM_BATCH_SIZE", 2)
+
+    bulk = load_episode_dataframe(db_session)
+    streamed = list(iter_episode_frames(db_session))
+    assert [user_id for user_id, _ in streamed] == [1, 2, 3]
+    for user_id, frame in streamed:
+        expected = bulk[bulk["user_id"] == user_id].reset_index(drop=True)
+        pd.testing.assert_frame_equal(frame, expected)
+
+
+def legacy_episode_dataframe(db):
+    """The per-episode ORM loader `load_episode_dataframe` replaced."""
+    rows = []
+    episodes = (
+        db.query(models.EmotionEpisode)
+        .join(models.EmotionOutcome)
+        .filter(models.EmotionEpisode.status == models.EpisodeStatus.COMPLETED)
+        .all()
+    )
+    for ep in episodes:
+        row = {
+            "episode_id": ep.id,
+            "user_id": ep.user_id,
+            "scenario_type": ep.scenario_type.value,
+            "topic": ep.topic,
+            "location": ep.location,
+            "pre_anxiety": ep.pre_anxiety,
+            "pre_crying_risk": ep.pre_crying_risk,
+            "pre_speech_block_risk": ep.pre_speech_block_risk,
+            "crying_level": ep.outcome.crying_level,
+            "stress_after": ep.outcome.stress_after,
+            "expression_score": ep.outcome.expression_score,
+            "relationship_impact": ep.outcome.relationship_impact,
+        }
+        row.update({f"prep_{key}_intensity": 0 for key in TREATMENTS})
+        for prep in ep.preparations:
+            if prep.template_key in TREATMENTS:
+                chosen = prep.actual_intensity if prep.actual_intensity is not None else prep.planned_intensity
+                row[f"prep_{prep.template_key}_intensity"] = chosen or 0
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def test_columnar_loader_matches_orm_loader(db_session):
+    seed_completed_episodes(db_session, [2, 1], per_user=4)
+    episodes = db_session.query(models.EmotionEpisode).order_by(models.EmotionEpisode.id).all()
+    # Actual intensity wins over planned, templates outside TREATMENTS are ignored,
+    # and episodes without an outcome or not completed are left out.
+    db_session.add(models.EmotionPreparationExecution(episode_id=episodes[0].id, template_key="journaling_10m", planned_intensity=4, actual_intensity=9))
+    db_session.add(models.EmotionPreparationExecution(episode_id=episodes[1].id, template_key="breathing_4_7_8", planned_intensity=6))
+    db_session.add(models.EmotionPreparationExecution(episode_id=episodes[2].id, template_key="custom_walk", planned_intensity=7))
+    episodes[3].status = models.EpisodeStatus.PLANNED
+    db_session.add(
+        models.EmotionEpisode(
+            user_id=1,
+            scenario_type=models.ScenarioType.PARTNER,
+            topic="t",
+            scheduled_at=datetime(2025, 1, 2),
+            location="home",
+            status=models.EpisodeStatus.COMPLETED,
+            pre_anxiety=1,
+            pre_crying_risk=1,
+            pre_speech_block_risk=1,
+            eval_threat_level=1,
+            suppress_intent_level=1,
+        )
+    )
+    db_session.commit()
+
+    columnar = load_episode_dataframe(db_session)
+    legacy = legacy_episode_dataframe(db_session)
+    assert len(columnar) == 7
+    pd.testing.assert_frame_equal(
+        legacy.sort_values("episode_id").reset_index(drop=True)[columnar.columns],
+        columnar.sort_values("episode_id").reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_batched_bootstrap_matches_sequential_ridge():
+    from cqox.jobs.estimate_paths import BOOTSTRAP_SAMPLES, _bootstrap_stats, _fit_ridge_coeffs
+
+    rng = np.random.default_rng(3)
+    X = np.column_stack([rng.integers(0, 11, 40), rng.integers(0, 11, 40), np.full(40, 5)]).astype(float)
+    y = X[:, 0] * 0.4 - X[:, 1] * 0.2 + rng.normal(0, 1, 40)
+
+    np.random.seed(0)
+    intercepts, coefs = [], []
+    for _ in range(BOOTSTRAP_SAMPLES):
+        idx = np.random.choice(len(y), size=len(y), replace=True)
+        inter, coef = _fit_ridge_coeffs(X[idx], y[idx])
+        intercepts.append(inter)
+        coefs.append(coef)
+    coefs = np.array(coefs)
+    expected = {"intercept": np.array(intercepts), "E": coefs[:, 0], "S": coefs[:, 1], "A": coefs[:, 2]}
+
+    np.random.seed(0)
+    stats = _bootstrap_stats(X, y, ["E", "S", "A"])
+    for name, series in expected.items():
+        summary = (series.mean(), np.percentile(series, 2.5), np.percentile(series, 97.5))
+        np.testing.assert_allclose(stats[name], summary, rtol=1e-8, atol=1e-10)
+
+
+def test_moment_ridge_matches_full_fit():
+    from cqox.jobs.estimate_paths import _fit_ridge_coeffs, episode_moments, ridge_from_moments
+
+    rng = np.random.default_rng(5)
+    values = rng.integers(0, 11, size=(30, 4)).astype(float)  # E, S, R, C
+    trait = np.full((30, 1), 7.0)
+    M = episode_moments(values[:15]) + episode_moments(values[15:])
+
+    intercept, coef = _fit_ridge_coeffs(np.hstack([values[:, :3], trait]), values[:, 3])
+    m_intercept, m_coef = ridge_from_moments(M, ["E", "S", "R"], "C")
+    np.testing.assert_allclose(m_coef, coef[:3], rtol=1e-8)
+    assert coef[3] == 0.0
+    assert abs(m_intercept - intercept) < 1e-8
+
+
+def test_job_queue_coalesces_and_claims_once(db_session):
+    Job = models.EmotionAnalyticsJob
+    for user_id in [1, 1, 2, 1]:
+        enqueue_analytics_job(db_session, user_id)
+    db_session.commit()
+    assert db_session.query(Job).count() == 2
+
+    jobs = claim_jobs(db_session)
+    assert sorted(job.user_id for job in jobs) == [1, 2]
+    assert claim_jobs(db_session) == []
+
+    # A change while the job runs queues a new one instead of being dropped.
+    enqueue_analytics_job(db_session, 1)
+    db_session.commit()
+    complete_jobs(db_session, [job.id for job in jobs])
+    assert db_session.query(Job).filter_by(status=models.JobStatus.QUEUED).count() == 1
+
+    retry = claim_jobs(db_session)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        fail_jobs(db_session, retry, "boom")
+        expected = models.JobStatus.FAILED if attempt == MAX_ATTEMPTS else models.JobStatus.QUEUED
+        assert retry[0].status == expected
+        retry = claim_jobs(db_session)
+    assert retry == []
+
+
+def test_worker_releases_jobs_when_another_worker_runs(db_session, monkeypatch):
+    from contextlib import contextmanager
+
+    from cqox.jobs import worker
+
+    Job = models.EmotionAnalyticsJob
+    monkeypatch.setattr(worker, "session_scope", contextmanager(lambda: iter([db_session])))
+    enqueue_analytics_job(db_session, 1)
+    db_session.commit()
+
+    monkeypatch.setattr(worker, "run_analytics_jobs", lambda full_rebuild: False)
+    assert worker.run_once() == 0
+    job = db_session.query(Job).one()
+    assert (job.status, job.attempts, job.dedupe_key) == (models.JobStatus.QUEUED, 0, "analytics:1")
+
+    monkeypatch.setattr(worker, "run_analytics_jobs", lambda full_rebuild: True)
+    assert worker.run_once() == 1
+    db_session.refresh(job)
+    assert job.status == models.JobStatus.DONE
+
+
+def test_run_lock_turns_concurrent_triggers_into_reruns(engine):
+    calls = []
+
+    def runner(full_rebuild):
+        calls.append(full_rebuild)
+        if len(calls) == 1:
+            # A trigger from "another process" while the run is in progress.
+            assert run_analytics_jobs(full_rebuild=True, engine=engine, runner=runner) is False
+
+    assert run_analytics_jobs(engine=engine, runner=runner) is True
+    assert calls == [False, True]
+
+    holder = _LeaseLock(engine, "analytics")
+    holder.owner = "other-host:1"
+    assert holder.acquire()
+    assert run_analytics_jobs(engine=engine, runner=runner) is False
+    assert calls == [False, True]
+    holder.release()
+    assert run_analytics_jobs(engine=engine, runner=runner) is True
+    # The request left pending while blocked coalesces with this one.
+    assert calls == [False, True, False]
+
+
+def test_job_run_exports_stage_and_user_metrics():
+    from prometheus_client import REGISTRY
+
+    from cqox.metrics import JobRun
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, {"job": "test", **labels}) or 0.0
+
+    df = synthetic_effects_frame(n_users=2, n_per_user=20)
+    users_before = sample("emotion_job_users_fit_total")
+    with JobRun("test") as run:
+        with run.stage("load"):
+            groups = list(df.groupby("user_id"))
+        with run.stage("estimate"):
+            estimate_user_groups(run.timed_iter(groups, "load"), workers=1, run=run)
+    elapsed = time.perf_counter() - run._started
+
+    assert sample("emotion_job_users_fit_total") == users_before + 2
+    assert sample("emotion_job_user_fit_seconds_count") >= 2
+    for stage in ["load", "estimate"]:
+        assert sample("emotion_job_stage_seconds_count", stage=stage) >= 1
+    for stage in ["encode", "fit"]:
+        assert sample("emotion_job_user_stage_seconds_count", stage=stage) >= 1
+    # Stage wall times partition the run: time inside the streamed load is not counted twice.
+    assert set(run.clock.seconds) == {"load", "estimate"}
+    assert run.clock.total() <= elapsed
+    assert sample("emotion_job_runs_total", status="success") >= 1
+    assert sample("emotion_job_last_success_timestamp_seconds") > 0
+
+
+def test_paths_fit_users_without_a_trait_profile(db_session):
+    from cqox.jobs.estimate_paths import DEFAULT_TRAIT_CRYING_PRONENESS, _persist_paths, build_user_dataframe
+    from cqox.metrics import JobRun
+
+    seed_completed_episodes(db_session, [1], per_user=12)
+    df = build_user_dataframe(db_session)
+    assert (df["A_cp"] == DEFAULT_TRAIT_CRYING_PRONENESS).all()
+
+    with JobRun("paths") as run:
+        _persist_paths(db_session, df.groupby("user_id"), run)
+    db_session.commit()
+    assert db_session.query(models.EmotionPathSummary).filter_by(user_id=1).one().n_episodes == 12
+
+
+def test_unchanged_fingerprints_skip_refit(db_session):
+    from cqox.jobs.estimate_paths import _persist_paths, build_user_dataframe
+    from cqox.jobs.state import frame_fingerprint, stored_fingerprints
+    from cqox.metrics import JobRun
+
+    seed_completed_episodes(db_session, [1, 2], per_user=12)
+    # Too few episodes for a summary row: the fingerprint must still be kept.
+    seed_completed_episodes(db_session, [3], per_user=2)
+    for user_id in [1, 2, 3]:
+        db_session.add(
+            models.EmotionTraitProfile(
+                user_id=user_id, trait_social_anxiety=5, trait_crying_proneness=6, trait_suppression=4
+            )
+        )
+    db_session.commit()
+
+    def run_paths(known):
+        df = build_user_dataframe(db_session)
+        with JobRun("paths") as run:
+            _persist_paths(db_session, df.groupby("user_id"), run, known)
+        db_session.commit()
+        return run
+
+    first = run_paths({})
+    assert (first.users_fit, first.users_skipped) == (3, 0)
+    assert db_session.query(models.EmotionPathSummary).filter_by(user_id=3).count() == 0
+    known = stored_fingerprints(db_session, JOB_PATHS)
+    assert set(known) == {1, 2, 3}
+    assert stored_fingerprints(db_session, JOB_EFFECTS) == {}
+
+    df = build_user_dataframe(db_session)
+    user_frame = df[df["user_id"] == 1]
+    assert frame_fingerprint(user_frame, "v") == frame_fingerprint(user_frame.iloc[::-1], "v")
+    assert frame_fingerprint(user_frame, "v") != frame_fingerprint(user_frame, "v2")
+
+    outcome = db_session.query(models.EmotionOutcome).join(models.EmotionEpisode).filter_by(user_id=2).first()
+    outcome.crying_level = (outcome.crying_level + 1) % 11
+    db_session.commit()
+    second = run_paths(known)
+    assert (second.users_fit, second.users_skipped) == (1, 2)
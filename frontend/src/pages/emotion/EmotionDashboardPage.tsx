@@ -8,91 +8,62 @@ import { EvalToCryingPathCard, PathSummary } from "@/features/emotion/components
 import { PartnerPathTable, PartnerPathRow } from "@/features/emotion/components/PartnerPathTable";
 import { EpisodeDecompositionCard, EpisodeDecomposition } from "@/features/emotion/components/EpisodeDecompositionCard";
 
-type EffectsResponse = { effects: EffectDatum[] };
-type TimelineResponse = { points: TimelinePoint[] };
+type TimelineResponse = { points: TimelinePoint[]; total_points?: number };
+
+// The chart cannot show more than a few hundred points legibly; the API downsamples.
+const TIMELINE_MAX_POINTS = 300;
 type EpisodeListItem = { id: number; topic: string; scenario_type: string; scheduled_at: string };
 
+// Every section the page renders, in one request (see GET /api/emotion/dashboard/bundle).
+type DashboardBundle = {
+  summary: SummaryStats;
+  effects: EffectDatum[];
+  timeline: TimelineResponse;
+  path_summary: PathSummary | null;
+  partner_paths: PartnerPathRow[];
+  episodes: EpisodeListItem[];
+  decompositions: EpisodeDecomposition[];
+};
+
+const BUNDLE_PARAMS = new URLSearchParams({
+  timeline_max_points: String(TIMELINE_MAX_POINTS),
+  episode_status: "completed",
+  episode_limit: "100",
+});
+
 export const EmotionDashboardPage: React.FC = () => {
-  const summaryQuery = useQuery({
-    queryKey: ["emotion", "dashboard", "summary"],
-    queryFn: () => apiFetch<SummaryStats>("/api/emotion/dashboard/summary"),
-  });
-  const effectsQuery = useQuery({
-    queryKey: ["emotion", "effects"],
-    queryFn: () => apiFetch<EffectsResponse>("/api/emotion/effects/me"),
-  });
-  const timelineQuery = useQuery({
-    queryKey: ["emotion", "timeline"],
-    queryFn: () => apiFetch<TimelineResponse>("/api/emotion/episodes/timeline/me"),
-  });
-  const pathSummaryQuery = useQuery({
-    queryKey: ["emotion", "path-summary"],
-    queryFn: async () => {
-      try {
-        return await apiFetch<PathSummary>("/api/emotion/path-summary/me");
-      } catch (error) {
-        const err = error as Error & { status?: number };
-        if (err.status === 404) return null;
-        throw err;
-      }
-    },
-  });
-  const partnerPathsQuery = useQuery({
-    queryKey: ["emotion", "partner-paths"],
-    queryFn: () => apiFetch<PartnerPathRow[]>("/api/emotion/paths/by-partner"),
-  });
-  const episodesQuery = useQuery({
-    queryKey: ["emotion", "episodes", "completed"],
-    queryFn: () => apiFetch<EpisodeListItem[]>("/api/emotion/episodes?status=completed&limit=100"),
+  const bundleQuery = useQuery({
+    queryKey: ["emotion", "dashboard", "bundle"],
+    queryFn: () => apiFetch<DashboardBundle>(`/api/emotion/dashboard/bundle?${BUNDLE_PARAMS}`),
   });
   const [selectedEpisode, setSelectedEpisode] = React.useState<number | null>(null);
   React.useEffect(() => {
-    if (!selectedEpisode && episodesQuery.data && episodesQuery.data.length > 0) {
-      setSelectedEpisode(episodesQuery.data[0].id);
+    const episodes = bundleQuery.data?.episodes;
+    if (!selectedEpisode && episodes && episodes.length > 0) {
+      setSelectedEpisode(episodes[0].id);
     }
-  }, [episodesQuery.data, selectedEpisode]);
-  const decompositionQuery = useQuery({
-    queryKey: ["emotion", "episode-decomposition", selectedEpisode],
-    queryFn: async () => {
-      if (!selectedEpisode) return null;
-      try {
-        return await apiFetch<EpisodeDecomposition>(`/api/emotion/episodes/${selectedEpisode}/decomposition`);
-      } catch {
-        return null;
-      }
-    },
-    enabled: !!selectedEpisode,
-  });
+  }, [bundleQuery.data, selectedEpisode]);
+  // Switching the selected episode is local: the bundle carries every listed episode's decomposition.
+  const decompositions = React.useMemo(
+    () => new Map((bundleQuery.data?.decompositions ?? []).map((item) => [item.episode_id, item])),
+    [bundleQuery.data]
+  );
 
-  if (
-    summaryQuery.isLoading ||
-    effectsQuery.isLoading ||
-    timelineQuery.isLoading ||
-    pathSummaryQuery.isLoading ||
-    partnerPathsQuery.isLoading ||
-    episodesQuery.isLoading ||
-    decompositionQuery.isLoading
-  ) {
+  if (bundleQuery.isLoading) {
     return <div className="text-gray-500">読み込み中...</div>;
   }
-  if (
-    summaryQuery.isError ||
-    effectsQuery.isError ||
-    timelineQuery.isError ||
-    pathSummaryQuery.isError ||
-    partnerPathsQuery.isError ||
-    episodesQuery.isError
-  ) {
+  if (bundleQuery.isError || !bundleQuery.data) {
     return <div className="text-red-500 text-sm">データの取得に失敗しました。</div>;
   }
 
-  const effects = effectsQuery.data?.effects ?? [];
-  const timeline = timelineQuery.data?.points ?? [];
-  const summary = summaryQuery.data as SummaryStats;
-  const pathSummary = pathSummaryQuery.data ?? undefined;
-  const partnerRows = partnerPathsQuery.data ?? [];
-  const episodes = episodesQuery.data ?? [];
-  const decomposition = decompositionQuery.data ?? null;
+  const bundle = bundleQuery.data;
+  const effects = bundle.effects ?? [];
+  const timeline = bundle.timeline?.points ?? [];
+  const summary = bundle.summary;
+  const pathSummary = bundle.path_summary ?? undefined;
+  const partnerRows = bundle.partner_paths ?? [];
+  const episodes = bundle.episodes ?? [];
+  const decomposition = (selectedEpisode && decompositions.get(selectedEpisode)) || null;
 
   return (
     <div className="space-y-8">
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+DML nuisance 共有のベンチマーク
+
+sample CSV の completed エピソードを使い、ユーザーごとに
+- per-pair: dml_ate() を treatment x outcome (20 組) ごとに呼ぶ従来方式
+- shared:   estimate_user_effects() で設計行列・nuisance を共有する方式
+の所要時間を比較する。
+
+    python scripts/benchmark_dml_nuisance.py --csv sample/emotion_cqox_sample_5000.csv
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from cqox.jobs.estimate_effects import (  # noqa: E402
+    CONFOUNDER_COLS,
+    OUTCOMES,
+    TREATMENTS,
+    dml_ate,
+    estimate_user_effects,
+)
+
+
+def load_frame(csv_path: str) -> pd.DataFrame:
+    """CSV を load_episode_dataframe() と同じ列構成に揃える。"""
+    df = pd.read_csv(csv_path)
+    df = df[df["status"] == "completed"].copy()
+    for key in TREATMENTS:
+        col = f"prep_{key}_intensity"
+        df[col] = df[col].fillna(0).astype(int)
+    return df
+
+
+def run_per_pair(df_user: pd.DataFrame) -> int:
+    n = 0
+    for key in TREATMENTS:
+        for outcome in OUTCOMES:
+            dml_ate(df_user, f"prep_{key}_intensity", outcome, CONFOUNDER_COLS)
+            n += 1
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark shared DML nuisance fits")
+    parser.add_argument("--csv", default="sample/emotion_cqox_sample_5000.csv", help="入力 CSV パス")
+    parser.add_argument("--max-users", type=int, default=10, help="計測するユーザー数 (エピソード数の多い順)")
+    args = parser.parse_args()
+
+    df = load_frame(args.csv)
+    sizes = df.groupby("user_id").size().sort_values(ascending=False)
+    user_ids = list(sizes.index[: args.max_users])
+    print(f"{len(df)} completed episodes, benchmarking {len(user_ids)} users")
+
+    timings = {"per-pair": 0.0, "shared": 0.0}
+    for user_id in user_ids:
+        df_user = df[df["user_id"] == user_id]
+
+        start = time.perf_counter()
+        run_per_pair(df_user)
+        timings["per-pair"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        estimate_user_effects(user_id, df_user)
+        timings["shared"] += time.perf_counter() - start
+
+    for name, seconds in timings.items():
+        print(f"  {name:<9} {seconds:8.2f}s  ({seconds / len(user_ids):.2f}s/user)")
+    print(f"  speedup   {timings['per-pair'] / timings['shared']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
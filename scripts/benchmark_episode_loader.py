@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+バッチジョブ用エピソードローダーのベンチマーク
+
+一時 SQLite DB に合成エピソード (completed + outcome + 準備 0〜5 件) を
+n 件投入し、
+- legacy:   ORM で EmotionEpisode を読み、ep.outcome / ep.preparations を
+            1 件ずつ遅延ロードする従来方式 (N+1)
+- columnar: load_episode_dataframe() (単一 Core SELECT + SQL ピボット)
+の所要時間を比較する。legacy は --legacy-max 件以下のときのみ計測し、
+結果の DataFrame が一致することも確認する。
+
+    python scripts/benchmark_episode_loader.py --sizes 5000,100000,1000000
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from cqox.db import Base  # noqa: E402
+from cqox.emotion import models  # noqa: E402
+from cqox.jobs.estimate_effects import TREATMENTS, load_episode_dataframe  # noqa: E402
+
+BATCH = 20000
+
+
+def seed(engine, n_episodes: int, seed: int = 42) -> None:
+    rng = random.Random(seed)
+    scenarios = list(models.ScenarioType)
+    start = datetime(2024, 1, 1)
+    n_users = max(1, n_episodes // 200)
+    with engine.begin() as conn:
+        for offset in range(0, n_episodes, BATCH):
+            episodes, outcomes, preps = [], [], []
+            for episode_id in range(offset + 1, min(offset + BATCH, n_episodes) + 1):
+                episodes.append(
+                    {
+                        "id": episode_id,
+                        "user_id": rng.randint(1, n_users),
+                        "scenario_type": rng.choice(scenarios),
+                        "topic": rng.choice(["転職理由", "お金の話", "謝罪"]),
+                        "scheduled_at": start + timedelta(minutes=episode_id),
+                        "location": rng.choice(["online", "office", "home"]),
+                        "status": models.EpisodeStatus.COMPLETED,
+                        "pre_anxiety": rng.randint(0, 10),
+                        "pre_crying_risk": rng.randint(0, 10),
+                        "pre_speech_block_risk": rng.randint(0, 10),
+                        "eval_threat_level": rng.randint(0, 10),
+                        "suppress_intent_level": rng.randint(0, 10),
+                        "created_at": start,
+                        "updated_at": start,
+                    }
+                )
+                outcomes.append(
+                    {
+                        "episode_id": episode_id,
+                        "stress_during": rng.randint(0, 10),
+                        "stress_after": rng.randint(0, 10),
+                        "crying_level": rng.randint(0, 10),
+                        "speech_block_level": rng.randint(0, 10),
+                        "expression_score": rng.randint(0, 10),
+                        "relationship_impact": rng.randint(-5, 5),
+                        "created_at": start,
+                    }
+                )
+                for key in rng.sample(TREATMENTS, rng.randint(0, len(TREATMENTS))):
+                    preps.append(
+                        {
+                            "episode_id": episode_id,
+                            "template_key": key,
+                            "planned_intensity": rng.randint(1, 10),
+                            "actual_intensity": rng.choice([None, rng.randint(0, 10)]),
+                            "created_at": start,
+                        }
+                    )
+            conn.execute(insert(models.EmotionEpisode.__table__), episodes)
+            conn.execute(insert(models.EmotionOutcome.__table__), outcomes)
+            if preps:
+                conn.execute(insert(models.EmotionPreparationExecution.__table__), preps)
+
+
+def legacy_load_episode_dataframe(db) -> pd.DataFrame:
+    """従来の ORM + 遅延ロード実装 (比較用にそのまま残したもの)。"""
+    episodes = (
+        db.query(models.EmotionEpisode)
+        .join(models.EmotionOutcome)
+        .filter(models.EmotionEpisode.status == models.EpisodeStatus.COMPLETED)
+        .all()
+    )
+    rows = []
+    for ep in episodes:
+        base = {
+            "episode_id": ep.id,
+            "user_id": ep.user_id,
+            "scenario_type": ep.scenario_type.value,
+            "topic": ep.topic,
+            "location": ep.location,
+            "pre_anxiety": ep.pre_anxiety,
+            "pre_crying_risk": ep.pre_crying_risk,
+            "pre_speech_block_risk": ep.pre_speech_block_risk,
+            "crying_level": ep.outcome.crying_level,
+            "stress_after": ep.outcome.stress_after,
+            "expression_score": ep.outcome.expression_score,
+            "relationship_impact": ep.outcome.relationship_impact,
+        }
+        intensity = {f"prep_{key}_intensity": 0 for key in TREATMENTS}
+        for prep in ep.preparations:
+            if prep.template_key in TREATMENTS:
+                chosen = prep.actual_intensity if prep.actual_intensity is not None else prep.planned_intensity
+                intensity[f"prep_{prep.template_key}_intensity"] = chosen or 0
+        rows.append({**base, **intensity})
+    return pd.DataFrame(rows)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the columnar episode loader")
+    parser.add_argument("--sizes", default="5000,100000,1000000", help="カンマ区切りのエピソード件数")
+    parser.add_argument("--legacy-max", type=int, default=100000, help="legacy を計測する最大件数")
+    args = parser.parse_args()
+
+    print(f"{'episodes':>10} {'legacy':>10} {'columnar':>10} {'speedup':>8}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/bench.db")
+            Base.metadata.create_all(engine)
+            seed(engine, n)
+            Session = sessionmaker(bind=engine)
+
+            with Session() as db:
+                df_new, t_new = timed(load_episode_dataframe, db)
+            legacy = "-"
+            speedup = "-"
+            if n <= args.legacy_max:
+                with Session() as db:
+                    df_old, t_old = timed(legacy_load_episode_dataframe, db)
+                pd.testing.assert_frame_equal(
+                    df_old.sort_values("episode_id").reset_index(drop=True)[df_new.columns],
+                    df_new.sort_values("episode_id").reset_index(drop=True),
+                    check_dtype=False,
+                )
+                legacy = f"{t_old:.2f}s"
+                speedup = f"{t_old / t_new:.1f}x"
+            engine.dispose()
+        print(f"{n:>10} {legacy:>10} {t_new:>9.2f}s {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()